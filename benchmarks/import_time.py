@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Import time budget of the numerical core.
+
+The core modules are imported in a fresh interpreter, several times, and the median
+import time is compared to the budget. The script also checks that the heavy
+optional dependencies (matplotlib, pandas, lmfit, scipy) aren't imported by the core.
+
+Usage, from the root of the project:
+    $ python -m benchmarks.import_time
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+CORE_MODULES = ['degradation_model.degradation_model',
+                'degradation_model.cycle_counting_algorithm',
+                'degradation_model.DST_cycle',
+                'degradation_model.degradation_tracker',
+                'degradation_model.stress_surface_representation',
+                'lib.peak_det.peak_det',
+                'lib.rainflow.rainflow']
+
+HEAVY_MODULES = ['matplotlib', 'pandas', 'lmfit', 'scipy']
+
+IMPORT_BUDGET_MS = 250  # including numpy, which takes most of it
+
+PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import numpy
+t1 = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+t2 = time.perf_counter()
+print(json.dumps({{'numpy_ms': 1000 * (t1 - t0), 'core_ms': 1000 * (t2 - t1),
+                  'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure_import_time(n_runs=7):
+    """
+
+    :param n_runs: number of fresh interpreters in which the core is imported
+    :return: dictionary with the median import times of numpy and of the core (in ms)
+             and the list of heavy modules imported by the core
+    """
+    probe = PROBE.format(modules=CORE_MODULES, heavy=HEAVY_MODULES)
+
+    runs = []
+    for i in range(0, n_runs):
+        output = subprocess.check_output([sys.executable, '-c', probe])
+        runs.append(json.loads(output.decode()))
+
+    numpy_ms = sorted(run['numpy_ms'] for run in runs)[n_runs // 2]
+    core_ms = sorted(run['core_ms'] for run in runs)[n_runs // 2]
+
+    return {'numpy_ms': numpy_ms,
+            'core_ms': core_ms,
+            'total_ms': numpy_ms + core_ms,
+            'heavy': sorted(set(m for run in runs for m in run['heavy']))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks the import time budget of the numerical core')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    result = measure_import_time(args.runs)
+
+    print('numpy import:      {:7.1f} ms'.format(result['numpy_ms']))
+    print('core import:       {:7.1f} ms'.format(result['core_ms']))
+    print('total (budget):    {:7.1f} ms ({:.0f} ms)'.format(result['total_ms'], args.budget_ms))
+
+    if len(result['heavy']) > 0:
+        sys.exit('The core imports heavy modules: ' + ', '.join(result['heavy']))
+    if result['total_ms'] > args.budget_ms:
+        sys.exit('The import time budget of the core is exceeded')
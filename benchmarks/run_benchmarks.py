@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the degradation pipeline on synthetic state of charge profiles.
+
+Each profile of benchmarks.synthetic_soc is generated for each size, then goes through
+the stages of final_degradation_model, which are timed separately:
+- generate: generation of the synthetic profile (not part of the pipeline)
+- peakdet: extraction of the turning points (CycleCounter)
+- rainflow: rainflow counting of the turning points (CycleCounter.rainflow_process)
+- stress: calendar and cycling degradation models
+The time of a stage is the best of several repetitions. The peak memory of a stage is measured
+with tracemalloc in a separate run, since tracing slows the stages down.
+
+The results are written in a JSON file, and two JSON files, e.g. of two commits, can be compared.
+With --dtype float32, the state of charge and the cycles are stored in single precision
+(see CycleCounter); comparing a float32 run to a float64 run prints the relative error of
+the degradation, which must stay below FLOAT32_RTOL, and the speedup of the peak detection.
+float32 is a memory trade-off, not a speed one: it halves the series and the cycle arrays, but the peak
+detection compares the samples as Python floats in both types, and the conversion of float32 samples
+can make it slower (0.73x on random_walk with 1e6 samples on a single core machine).
+
+Usage, from the root of the project:
+    $ python -m benchmarks.run_benchmarks run --sizes 1e4 1e5 1e6 --out before.json
+    $ python -m benchmarks.run_benchmarks run --sizes 1e4 1e5 1e6 --out after.json
+    $ python -m benchmarks.run_benchmarks compare before.json after.json
+    $ python -m benchmarks.run_benchmarks run --sizes 1e4 1e5 1e6 --dtype float32 --out float32.json
+    $ python -m benchmarks.run_benchmarks compare after.json float32.json
+
+Sizes up to 1e8 samples are accepted: a 1e8 samples profile takes 1.6 GB of memory
+and several minutes per stage.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic_soc import GENERATORS
+from degradation_model.cycle_counting_algorithm import CycleCounter
+from degradation_model.degradation_model import cal_degradation_model, cyc_degradation_model
+
+STAGES = ['generate', 'peakdet', 'rainflow', 'stress']
+PIPELINE_STAGES = ['peakdet', 'rainflow', 'stress']
+
+MIN_SIZE = 10**4
+MAX_SIZE = 10**8
+
+DTYPES = {'float64': np.float64, 'float32': np.float32}
+FLOAT32_RTOL = 1e-5  # bound of the relative error of the degradation in float32
+
+
+def run_stages(generator, n_samples, seed, temperature, chemistry, delta, measure, dtype=np.float64):
+    """ Runs the stages once
+
+    :param measure: function called around each stage, measure(stage, function) -> (output, measurement)
+    :return: tuple (dictionary of the measurements per stage, dictionary of the outputs of the pipeline)
+    """
+    measurements = {}
+
+    def generate():
+        time_v, soc_v = generator(n_samples, seed)
+        return time_v, soc_v.astype(dtype, copy=False)
+
+    (time_v, soc_v), measurements['generate'] = measure(generate)
+
+    cycle_counter, measurements['peakdet'] = measure(
+        lambda: CycleCounter(time_v=time_v, soc_v=soc_v, delta=delta, dtype=dtype))
+
+    _, measurements['rainflow'] = measure(cycle_counter.rainflow_process)
+
+    def stress():
+        cal_deg = cal_degradation_model(cycle_counter.mean_soc, temperature, time_v[-1] - time_v[0])
+        cyc_deg = cyc_degradation_model(cycle_counter.arr_dod, cycle_counter.arr_n, cycle_counter.arr_soc_mean,
+                                        temperature, chemistry)
+        return cal_deg, cyc_deg
+
+    (cal_deg, cyc_deg), measurements['stress'] = measure(stress)
+
+    outputs = {'n_turning_points': len(cycle_counter.min_points) + len(cycle_counter.max_points),
+               'n_cycles': len(cycle_counter.arr_n),
+               'series_bytes': int(cycle_counter.data['series'].nbytes + cycle_counter.arr_dod.nbytes
+                                   + cycle_counter.arr_n.nbytes + cycle_counter.arr_soc_mean.nbytes),
+               'cal_degradation': float(cal_deg),
+               'cyc_degradation': float(cyc_deg)}
+
+    return measurements, outputs
+
+
+def measure_time(function):
+    t0 = time.perf_counter()
+    output = function()
+    return output, time.perf_counter() - t0
+
+
+def measure_memory(function):
+    tracemalloc.start()
+    output = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return output, peak
+
+
+def benchmark(generator_name, n_samples, seed=0, repeat=3, temperature=25, chemistry='NMC', delta=0.1,
+              dtype=np.float64):
+    """
+
+    :param generator_name: name of a generator of benchmarks.synthetic_soc.GENERATORS
+    :param n_samples: number of samples of the profile
+    :param seed: seed of the generator
+    :param repeat: number of timed repetitions
+    :param dtype: float type of the state of charge and of the cycles
+    :return: dictionary of the results
+    """
+    generator = GENERATORS[generator_name]
+
+    times = {stage: [] for stage in STAGES}
+    for k in range(0, repeat):
+        measurements, outputs = run_stages(generator, n_samples, seed, temperature, chemistry, delta, measure_time,
+                                           dtype=dtype)
+        for stage in STAGES:
+            times[stage].append(measurements[stage])
+
+    peak_bytes, _ = run_stages(generator, n_samples, seed, temperature, chemistry, delta, measure_memory,
+                               dtype=dtype)
+
+    time_s = {stage: min(times[stage]) for stage in STAGES}
+    time_s['pipeline'] = sum(time_s[stage] for stage in PIPELINE_STAGES)
+
+    result = {'generator': generator_name,
+              'n_samples': n_samples,
+              'seed': seed,
+              'time_s': time_s,
+              'peak_bytes': peak_bytes}
+    result.update(outputs)
+
+    return result
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL)
+        return output.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    sizes = [int(float(size)) for size in args.sizes]
+    for size in sizes:
+        if size < MIN_SIZE or size > MAX_SIZE:
+            sys.exit('The sizes must be between {:.0e} and {:.0e} samples'.format(MIN_SIZE, MAX_SIZE))
+    for name in args.generators:
+        if name not in GENERATORS:
+            sys.exit('Unknown generator ' + name + ', available generators: ' + ', '.join(GENERATORS))
+
+    report = {'meta': {'commit': git_commit(),
+                       'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'python': platform.python_version(),
+                       'numpy': np.__version__,
+                       'machine': platform.machine(),
+                       'repeat': args.repeat,
+                       'temperature': args.temperature,
+                       'chemistry': args.chemistry,
+                       'delta': args.delta,
+                       'dtype': args.dtype},
+              'results': []}
+
+    for name in args.generators:
+        for size in sizes:
+            result = benchmark(name, size, seed=args.seed, repeat=args.repeat,
+                               temperature=args.temperature, chemistry=args.chemistry, delta=args.delta,
+                               dtype=DTYPES[args.dtype])
+            report['results'].append(result)
+
+            print('{:12s} {:>10d} samples  '.format(name, size)
+                  + '  '.join('{} {:8.3f} s'.format(stage, result['time_s'][stage]) for stage in STAGES)
+                  + '  peakdet peak {:8.1f} MB'.format(result['peak_bytes']['peakdet'] / 1e6)
+                  + '  pipeline peak {:8.1f} MB'.format(max(result['peak_bytes'][stage]
+                                                            for stage in PIPELINE_STAGES) / 1e6))
+
+    if args.out is not None:
+        with open(args.out, 'w') as fp:
+            json.dump(report, fp, indent=2)
+        print('Results written in ' + args.out)
+
+
+def compare(args):
+    reports = []
+    for path in (args.base, args.new):
+        with open(path) as fp:
+            reports.append(json.load(fp))
+    base, new = reports
+
+    print('base: {} ({})   new: {} ({})'.format(base['meta']['commit'], base['meta']['timestamp'],
+                                                new['meta']['commit'], new['meta']['timestamp']))
+
+    # files written before the dtype option are float64
+    dtypes = (base['meta'].get('dtype', 'float64'), new['meta'].get('dtype', 'float64'))
+    if dtypes[0] != dtypes[1]:
+        print('base dtype: {}   new dtype: {}'.format(*dtypes))
+
+    base_results = {(r['generator'], r['n_samples']): r for r in base['results']}
+    for r in new['results']:
+        key = (r['generator'], r['n_samples'])
+        if key not in base_results:
+            continue
+        b = base_results[key]
+
+        print('\n{} - {} samples'.format(*key))
+        print('  {:10s} {:>10s} {:>10s} {:>8s} {:>12s} {:>12s}'.format('stage', 'base [s]', 'new [s]', 'speedup',
+                                                                       'base [MB]', 'new [MB]'))
+        for stage in STAGES + ['pipeline']:
+            speedup = b['time_s'][stage] / r['time_s'][stage] if r['time_s'][stage] > 0 else float('inf')
+            line = '  {:10s} {:10.4f} {:10.4f} {:7.2f}x'.format(stage, b['time_s'][stage], r['time_s'][stage], speedup)
+            if stage in r['peak_bytes']:
+                line = line + ' {:12.2f} {:12.2f}'.format(b['peak_bytes'][stage] / 1e6, r['peak_bytes'][stage] / 1e6)
+            print(line)
+
+        # the benchmarks must not change the results of the model,
+        # except for the rounding of the state of charge in float32
+        if dtypes[0] == dtypes[1]:
+            for output in ['n_cycles', 'cal_degradation', 'cyc_degradation']:
+                if not np.isclose(b[output], r[output], rtol=1e-9, atol=0):
+                    print('  WARNING: {} differs: {} (base) vs {} (new)'.format(output, b[output], r[output]))
+        else:
+            print('  cycles: {} (base) vs {} (new)'.format(b['n_cycles'], r['n_cycles']))
+            peakdet_speedup = b['time_s']['peakdet'] / r['time_s']['peakdet'] if r['time_s']['peakdet'] > 0 \
+                else float('inf')
+            print('  peakdet: {:.2f}x, {:.2f} MB (base) vs {:.2f} MB (new); the samples are compared as Python '
+                  'floats in both types, so float32 saves memory rather than time'.format(
+                      peakdet_speedup, b['peak_bytes']['peakdet'] / 1e6, r['peak_bytes']['peakdet'] / 1e6))
+            if 'series_bytes' in b and 'series_bytes' in r:
+                print('  state of charge and cycle arrays: {:.2f} MB (base) vs {:.2f} MB (new)'.format(
+                    b['series_bytes'] / 1e6, r['series_bytes'] / 1e6))
+            for output in ['cal_degradation', 'cyc_degradation']:
+                error = abs(r[output] - b[output]) / abs(b[output]) if b[output] != 0 else abs(r[output])
+                print('  {} relative error: {:.2e}{}'.format(output, error,
+                                                           '' if error <= FLOAT32_RTOL else '  WARNING: above bound'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the degradation pipeline')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_run = subparsers.add_parser('run', help='runs the benchmarks')
+    parser_run.add_argument('--sizes', nargs='+', default=['1e4', '1e5', '1e6'],
+                            help='numbers of samples, between 1e4 and 1e8')
+    parser_run.add_argument('--generators', nargs='+', default=sorted(GENERATORS))
+    parser_run.add_argument('--repeat', type=int, default=3)
+    parser_run.add_argument('--seed', type=int, default=0)
+    parser_run.add_argument('--temperature', type=float, default=25)
+    parser_run.add_argument('--chemistry', default='NMC')
+    parser_run.add_argument('--delta', type=float, default=0.1)
+    parser_run.add_argument('--dtype', default='float64', choices=sorted(DTYPES),
+                            help='float type of the state of charge and of the cycles')
+    parser_run.add_argument('--out', help='JSON file in which the results are written')
+
+    parser_compare = subparsers.add_parser('compare', help='compares two JSON files of results')
+    parser_compare.add_argument('base')
+    parser_compare.add_argument('new')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        compare(args)
+    else:
+        parser.print_help()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Seeded generators of synthetic state of charge profiles, used by the benchmarks.
+
+Every generator has the signature generator(n_samples, seed) and returns a tuple
+(time vector in second, state of charge vector in %) of float arrays of length n_samples.
+A same seed always gives the same profile, so that two commits are benchmarked on the same input.
+
+- random_walk: dispatch of a stationary battery, alternating charge, discharge and rest periods
+  of random durations, with noise, reflected within [soc_min, soc_max]
+- dst: repetitions of the DST cycles of DST_cycle.dst_profile, between the ranges of the experiments
+- calendar: flat segments at random levels of state of charge, i.e. storage
+"""
+
+import numpy as np
+
+from degradation_model.DST_cycle import dst_profile
+
+CHUNK_SIZE = 1000000  # samples generated at once, to bound the memory of the intermediate arrays
+
+# ranges of state of charge of the DST experiments
+DST_RANGES = [(25, 100), (40, 100), (25, 85), (50, 100), (25, 75), (45, 75), (65, 75)]
+
+
+def reflect(x, lower, upper):
+    """ Folds an unbounded signal into [lower, upper], as if it bounced on the bounds
+
+    :param x: array
+    :param lower: lower bound
+    :param upper: upper bound
+    :return: array of values between lower and upper
+    """
+    width = upper - lower
+    x = np.mod(x - lower, 2 * width)
+    return lower + np.where(x > width, 2 * width - x, x)
+
+
+def random_walk_soc(n_samples, seed=0, dt=1., soc_min=10., soc_max=90., rate=0.01, noise=0.05,
+                    p_switch=1e-3):
+    """
+
+    :param n_samples: number of samples
+    :param seed: seed of the random generator
+    :param dt: time step in second
+    :param soc_min: lower bound of the state of charge in %
+    :param soc_max: upper bound of the state of charge in %
+    :param rate: variation of the state of charge per time step while charging or discharging, in %
+    :param noise: standard deviation of the variation of the state of charge per time step, in %
+    :param p_switch: probability per time step to switch to a new regime (charge, discharge or rest)
+    :return: tuple (time vector in second, state of charge vector in %)
+    """
+    rng = np.random.default_rng(seed)
+
+    soc_v = np.empty(n_samples)
+    position = (soc_min + soc_max) / 2  # position of the unbounded walk
+    state = 0  # current regime: -1 discharge, 0 rest, 1 charge
+
+    for start in range(0, n_samples, CHUNK_SIZE):
+        m = min(CHUNK_SIZE, n_samples - start)
+
+        # regime of each sample
+        segment = np.cumsum(rng.random(m) < p_switch)
+        states = rng.choice([-1, 0, 1], size=segment[-1] + 1)
+        states[0] = state
+        regime = states[segment]
+
+        steps = rate * regime + noise * rng.standard_normal(m)
+        walk = position + np.cumsum(steps)
+        soc_v[start:start + m] = reflect(walk, soc_min, soc_max)
+
+        position = walk[-1]
+        state = regime[-1]
+
+    time_v = dt * np.arange(n_samples, dtype=float)
+
+    return time_v, soc_v
+
+
+def dst_soc(n_samples, seed=0):
+    """ Repetitions of DST cycles, each one between one of the ranges of the DST experiments drawn at random
+
+    :param n_samples: number of samples
+    :param seed: seed of the random generator
+    :return: tuple (time vector in second, state of charge vector in %)
+    """
+    rng = np.random.default_rng(seed)
+
+    profiles = {}
+    pieces = []
+    n = 0
+    while n < n_samples:
+        soc_range = DST_RANGES[rng.integers(0, len(DST_RANGES))]
+        if soc_range not in profiles:
+            time_v, soc_v, c_rate_v = dst_profile(*soc_range)
+            profiles[soc_range] = np.asarray(soc_v, dtype=float)
+        pieces.append(profiles[soc_range])
+        n = n + len(profiles[soc_range])
+
+    soc_v = np.concatenate(pieces)[:n_samples]
+
+    # dst_profile is sampled at 10 points per second
+    time_v = 0.1 * np.arange(n_samples, dtype=float)
+
+    return time_v, soc_v
+
+
+def calendar_soc(n_samples, seed=0, dt=60., soc_min=20., soc_max=100., mean_duration=10000):
+    """ Flat segments of state of charge, of random levels and durations
+
+    :param n_samples: number of samples
+    :param seed: seed of the random generator
+    :param dt: time step in second
+    :param soc_min: lower bound of the state of charge in %
+    :param soc_max: upper bound of the state of charge in %
+    :param mean_duration: mean number of samples of a segment
+    :return: tuple (time vector in second, state of charge vector in %)
+    """
+    rng = np.random.default_rng(seed)
+
+    soc_v = np.empty(n_samples)
+    start = 0
+    while start < n_samples:
+        m = min(CHUNK_SIZE, n_samples - start)
+
+        durations = rng.geometric(1 / mean_duration, size=m // mean_duration + 2)
+        while np.sum(durations) < m:
+            durations = np.append(durations, rng.geometric(1 / mean_duration, size=m // mean_duration + 2))
+        levels = np.round(rng.uniform(soc_min, soc_max, size=len(durations)))
+
+        soc_v[start:start + m] = np.repeat(levels, durations)[:m]
+        start = start + m
+
+    time_v = dt * np.arange(n_samples, dtype=float)
+
+    return time_v, soc_v
+
+
+GENERATORS = {'random_walk': random_walk_soc,
+              'dst': dst_soc,
+              'calendar': calendar_soc}
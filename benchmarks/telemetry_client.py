@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Test client of degradation_model.telemetry_server.
+
+Each battery sends a synthetic random walk profile (benchmarks.synthetic_soc) over one of several
+concurrent connections. Once all samples are sent, the state of health of every battery is queried
+and, with --verify, compared to a DegradationTracker fed with the same samples.
+The throughput, the query latencies and the metrics of the server are printed.
+
+Usage, from the root of the project, with the server running:
+    $ python -m benchmarks.telemetry_client --port 8765 --batteries 100 --samples 10000 --verify
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_soc import random_walk_soc
+from degradation_model.degradation_tracker import DegradationTracker
+
+LINES_PER_WRITE = 1000
+
+
+async def open_connection(args):
+    if args.unix is not None:
+        return await asyncio.open_unix_connection(path=args.unix)
+    return await asyncio.open_connection(host=args.host, port=args.port)
+
+
+async def send_profiles(args, battery_ids, profiles):
+    """ Sends the samples of some batteries over one connection, interleaved in time, then queries them
+
+    :return: tuple (dictionary battery id -> state of health, list of query latencies in second)
+    """
+    reader, writer = await open_connection(args)
+
+    lines = []
+    for k in range(0, args.samples):
+        for battery_id in battery_ids:
+            time_v, soc_v = profiles[battery_id]
+            lines.append('SAMPLE {} {!r} {!r} {!r}\n'.format(battery_id, float(time_v[k]), float(soc_v[k]),
+                                                             args.temperature))
+        if len(lines) >= LINES_PER_WRITE:
+            writer.write(''.join(lines).encode('ascii'))
+            await writer.drain()
+            lines = []
+    writer.write(''.join(lines).encode('ascii'))
+    await writer.drain()
+
+    soh = {}
+    latencies = []
+    for battery_id in battery_ids:
+        t0 = time.perf_counter()
+        writer.write('QUERY {}\n'.format(battery_id).encode('ascii'))
+        answer = (await reader.readline()).decode('ascii').split()
+        latencies.append(time.perf_counter() - t0)
+        if answer[0] != 'SOH':
+            sys.exit('Unexpected answer: ' + ' '.join(answer))
+        soh[battery_id] = float(answer[2])
+
+    writer.close()
+    return soh, latencies
+
+
+async def query_stats(args):
+    reader, writer = await open_connection(args)
+    writer.write(b'STATS\n')
+    answer = (await reader.readline()).decode('ascii').split()
+    writer.close()
+    return dict(field.split('=') for field in answer[1:])
+
+
+async def main(args):
+    battery_ids = ['battery_{}'.format(i) for i in range(0, args.batteries)]
+    profiles = {battery_id: random_walk_soc(args.samples, seed=args.seed + i)
+                for i, battery_id in enumerate(battery_ids)}
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*[send_profiles(args, battery_ids[i::args.connections], profiles)
+                                     for i in range(0, args.connections)])
+    elapsed = time.perf_counter() - t0
+
+    soh = {}
+    latencies = []
+    for soh_connection, latencies_connection in results:
+        soh.update(soh_connection)
+        latencies.extend(latencies_connection)
+
+    n_samples = args.batteries * args.samples
+    print('{} samples of {} batteries sent over {} connections in {:.2f} s ({:.0f} samples/s)'.format(
+        n_samples, args.batteries, args.connections, elapsed, n_samples / elapsed))
+    print('query latency: median {:.2f} ms, max {:.2f} ms'.format(1000 * np.median(latencies),
+                                                                  1000 * np.max(latencies)))
+
+    stats = await query_stats(args)
+    print('server: ' + ', '.join('{}={}'.format(k, v) for k, v in stats.items()))
+
+    if args.verify:
+        max_error = 0.
+        for battery_id in battery_ids:
+            tracker = DegradationTracker(args.chemistry)
+            time_v, soc_v = profiles[battery_id]
+            tracker.update_many(time_v, soc_v, args.temperature)
+            max_error = max(max_error, abs(tracker.soh() - soh[battery_id]))
+        print('maximum difference with an offline DegradationTracker: {:.2e}'.format(max_error))
+        if max_error > 1e-12:
+            sys.exit('The states of health of the server are wrong')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drives the telemetry server with synthetic batteries')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='path of the Unix socket of the server, used instead of TCP')
+    parser.add_argument('--batteries', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=10000, help='number of samples per battery')
+    parser.add_argument('--connections', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--temperature', type=float, default=25)
+    parser.add_argument('--chemistry', default='NMC', help='chemistry of the server, used by --verify')
+    parser.add_argument('--verify', action='store_true')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
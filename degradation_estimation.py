@@ -1,110 +1,91 @@
 """ This modules enables to calculate and plot the estimated degradation of a lithium ion battery, over its operations
-defined a file located in the folder input_data"""
-
+defined a file located in the folder input_data
+
+The cumulative degradation of each file is computed in one pass (degradation_series), then resampled
+on n_points evenly spaced times to plot the capacity curve.
+
+With --out, the estimation runs without plots: the files are read by blocks and the results written as they
+are produced (see degradation_model.checkpointed_estimation and degradation_model.result_writer), in CSV or
+columnar format, in the directory given by --out:
+- windows: per window of --window seconds of each file, the cumulative calendar, cycling, linearised
+  and nonlinear degradation at the last sample of the window
+- files: the same results at the end of each file, with its numbers of samples and turning points
+- file_names.txt: the name of each file id
+Every write is flushed, so that an interrupted run leaves the results of the windows written so far.
+
+Usage, from the root of the project:
+    $ python degradation_estimation.py
+    $ python degradation_estimation.py input_data --out results --format columnar --window 86400
+"""
+
+import argparse
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import time
+import numpy as np
 
-from degradation_model.degradation_model import final_degradation_model, nonlinear_general_model
+from degradation_model.data_io import input_files, read_soc_csv, time_in_seconds
+from degradation_model.degradation_series import degradation_series
+from degradation_model.profiling import ProfileCollector, get_collector
 
 
 colors = ['red', 'blue', 'green', 'orange', 'purple', 'black', 'grey', 'brown']
 
 
-def nearest(items, pivot):
-    return min(items, key=lambda x: abs(x - pivot))
-
-
-def even_selection_array(n, array_in):
-    step = (len(array_in) - 1) / (n - 1)
-    array_out = []
-    for i in range(0, n):
-        array_out.append(array_in[round(step * i)])
-    return array_out
-
-
-def convert_vector_time(time_array):
-    array_out = []
-    for i in range(0, len(time_array)):
-        diff = time_array.iloc[i] - time_array.iloc[0]
-        array_out.append(diff.total_seconds())
-    return array_out
-
-time1 = time.time()
+def estimate_file(path, args, collector):
+    """
 
-fig = plt.figure(figsize=(5, 4), dpi=100)
-ax1 = fig.add_subplot(111)
+    :param path: path of a .csv file of time and state of charge
+    :return: tuple (time column of the file, time vector in second, DegradationSeries)
+    """
+    with collector.stage('read_csv'):
+        dtm, soc = read_soc_csv(path)
 
-temperature = 21
-chemistry = 'NMC'
-alpha_sei = 5.87e-02
-beta_sei = 1.06e+02
+    with collector.stage('time_conversion'):
+        time_v = time_in_seconds(dtm)
 
-for m, fn in enumerate(os.listdir('input_data/')):
-    if os.path.isfile(os.path.join('input_data/', str(fn))):
-        filename, file_extension = os.path.splitext(fn)
-        if file_extension == '.csv':
-            # file processing
-            df = pd.read_csv('input_data/' + fn, parse_dates=[0])
-            dtm = df.iloc[:, 0]  # date time
-            soc = df.iloc[:, 1]  # state of charge
+    # cumulative calendar and cycling degradation, at the turning points of the state of charge
+    series = degradation_series(time_v=time_v,
+                                soc_v=soc,
+                                T=args.temperature,
+                                chemistry=args.chemistry,
+                                delta=args.delta,
+                                collector=collector)
+    return dtm, time_v, series
 
-            # calculation of total duration
-            last_index = dtm.index[-1]
-            first_time = dtm[1]
-            last_time = dtm[last_index]
-            diff = last_time - first_time
-            total_duration = diff.total_seconds()
 
-            time_linspace = even_selection_array(365, dtm)  # selection 100 time points from dtm
+def write_results(args, collector):
+    """ Writes the results of the windows and of the files as they are computed, without plotting them.
 
-            cal_results = [0]
-            cyc_results = [0]
-            linearised_deg_v = [0]
-            nonlinear_deg_v = [0]
-            time_index_v = [0]
+    The files are estimated by degradation_model.checkpointed_estimation, without checkpoints, so that both
+    give the same results.
+    """
+    from degradation_model.checkpointed_estimation import CheckpointedEstimation, print_file_done
 
-            for k in range(1, len(time_linspace)):
+    estimation = CheckpointedEstimation(input_files(args.input_dir), args.out, output_format=args.format,
+                                        temperature=args.temperature, chemistry=args.chemistry,
+                                        alpha_sei=args.alpha_sei, beta_sei=args.beta_sei, delta=args.delta,
+                                        window=args.window)
+    estimation.run(collector=collector, on_file_done=print_file_done)
 
-                # searches in dtm the index at which the date is equal to time_linspace[i]
-                index_dtm_i = dtm[dtm == time_linspace[k]].index.tolist()[0]
-                time_index_v.append(index_dtm_i)
 
-                # extracts the relevant time data
-                time_v = dtm.iloc[time_index_v[k-1]:time_index_v[k]]
-                # and converts them to time difference
-                time_v = convert_vector_time(time_v)
+def plot_results(args, collector):
+    """ Plots the remaining capacity of each file """
+    import matplotlib.pyplot as plt
+    import pandas as pd
 
-                # extracts the relevant soc data
-                soc_v = soc.iloc[time_index_v[k-1]:time_index_v[k]].as_matrix()
+    fig = plt.figure(figsize=(5, 4), dpi=100)
+    ax1 = fig.add_subplot(111)
 
-                # calculate calendar and cycling degradation
-                cal_deg, cyc_deg = final_degradation_model(time_v=time_v,
-                                                           soc_v=soc_v,
-                                                           T=temperature,
-                                                           time=time_v[-1],
-                                                           chemistry=chemistry,
-                                                           delta=0.1,
-                                                           title='DST')
+    for m, path in enumerate(input_files(args.input_dir)):
+        filename = os.path.splitext(os.path.basename(path))[0]
+        with collector.file(os.path.basename(path)):
+            dtm, time_v, series = estimate_file(path, args, collector)
 
-                # stores the results
-                cal_results.append(cal_results[k-1] + cal_deg)
-                cyc_results.append(cyc_results[k-1] + cyc_deg)
+            # resampling at the resolution of the plot
+            time_points = np.linspace(time_v[0], time_v[-1], args.n_points)
+            remaining_capa = 100*series.resample(time_points).soh(args.alpha_sei, args.beta_sei)
 
-                linearised_deg = cal_results[k]+cyc_results[k]
-                linearised_deg_v.append(linearised_deg)
-
-                non_linear_deg = nonlinear_general_model(alpha_sei, beta_sei, linearised_deg)
-
-                nonlinear_deg_v.append(non_linear_deg)
-
-            remaining_capa = []
-
-            for i in range(0, len(nonlinear_deg_v)):
-                remaining_capa.append(100*(1-nonlinear_deg_v[i]))
-
-            ax1.plot(time_linspace, remaining_capa, 'x-', color=colors[m], label=filename)
+            ax1.plot(pd.to_datetime(dtm[0]) + pd.to_timedelta(time_points, unit='s'), remaining_capa, 'x-',
+                     color=colors[m % len(colors)], label=filename)
             ax1.set_xlabel('Time')
             ax1.set_ylabel('Remaining capacity [%]')
             ax1.set_ylim([80, 100])
@@ -112,4 +93,37 @@ for m, fn in enumerate(os.listdir('input_data/')):
             plt.legend()
             plt.tight_layout()
             plt.draw()
-plt.show()
\ No newline at end of file
+
+    return plt
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Degradation of the state of charge profiles of a directory')
+    parser.add_argument('input_dir', nargs='?', default='input_data', help='directory of the .csv input files')
+    parser.add_argument('--temperature', type=float, default=21)
+    parser.add_argument('--chemistry', default='NMC', choices=['NMC', 'LMO', 'LFP'])
+    parser.add_argument('--alpha-sei', type=float, default=5.87e-02)
+    parser.add_argument('--beta-sei', type=float, default=1.06e+02)
+    parser.add_argument('--delta', type=float, default=0.1, help='hysteresis of the peak detection, in %%')
+    parser.add_argument('--n-points', type=int, default=365, help='number of points of the capacity curves')
+    parser.add_argument('--out', help='output directory; if given, the results are written instead of plotted')
+    parser.add_argument('--format', default='csv', choices=['csv', 'columnar'], help='format of the output')
+    parser.add_argument('--window', type=float, default=86400., help='duration of the output windows, in second')
+    parser.add_argument('--profile', action='store_true',
+                        help='prints the time spent in each stage of the estimation, for each file')
+    args = parser.parse_args()
+
+    if args.window <= 0:
+        parser.error('--window must be positive')
+
+    collector = get_collector(ProfileCollector() if args.profile else None)
+
+    if args.out is not None:
+        write_results(args, collector)
+        if collector.enabled:
+            print(collector.report())
+    else:
+        plt = plot_results(args, collector)
+        if collector.enabled:
+            print(collector.report())
+        plt.show()
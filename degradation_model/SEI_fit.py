@@ -16,35 +16,44 @@ occurs at the beginning of the cell life. We'll chose arbitrarily 10 as lower bo
 
 """
 
-import numpy as np
-import matplotlib.pyplot as plt
 from lmfit import minimize, Parameters, fit_report
 from pandas import read_csv, DataFrame
-from degradation_model.degradation_model import nonlinear_cycle_model, residuals_nonlinear_cycle_model
+from degradation_model.degradation_model import residuals_nonlinear_cycle_model
+from degradation_model.parallel_fit import bootstrap_fit, same_observations
 
 
 class SEI_fit:
 
     def __init__(self, data_file_path):
         # data importation
-        data_cyc = read_csv(data_file_path)
-        N = data_cyc['N']
-        SoC = data_cyc['SoC[%]']
-        L = 1 - SoC  # converts SoC into degradation (between 0 and 1)
-        
-        self.data = DataFrame({'N': N, 'SoC': SoC, 'L': L})        
+        self.data = self.read_data(data_file_path)
         self.alpha_sei = ''
         self.beta_sei = ''
         self.deg_per_cycle = ''
+        self.opt_params = None
 
         self.least_square_fit()
 
-    def least_square_fit(self):
+    @staticmethod
+    def read_data(data_file_path):
+        data_cyc = read_csv(data_file_path)
+        N = data_cyc['N']
+        SoC = data_cyc['SoC[%]']
+        L = 1 - SoC  # converts SoC into degradation (between 0 and 1)
+
+        return DataFrame({'N': N, 'SoC': SoC, 'L': L})
+
+    def least_square_fit(self, params=None):
+        """
+
+        :param params: initial values of the parameters; by default, the fit starts from generic initial values
+        """
         # parameters definition
-        params = Parameters()
-        params.add('alpha_sei', value=0.02, max=0.16, min=0.03)
-        params.add('beta_sei', value=40, min=10)
-        params.add('deg_per_cyc', value=0.02, min=5e-9, max=7e-5)
+        if params is None:
+            params = Parameters()
+            params.add('alpha_sei', value=0.02, max=0.16, min=0.03)
+            params.add('beta_sei', value=40, min=10)
+            params.add('deg_per_cyc', value=0.02, min=5e-9, max=7e-5)
 
         # least square algorithm
         out = minimize(fcn=residuals_nonlinear_cycle_model,
@@ -55,6 +64,7 @@ class SEI_fit:
 
         # print(fit_report(out))
 
+        self.opt_params = out.params
         self.alpha_sei = out.params['alpha_sei'].value
         self.beta_sei = out.params['beta_sei'].value
         self.deg_per_cycle = out.params['deg_per_cyc'].value
@@ -64,25 +74,42 @@ class SEI_fit:
         print("beta_sei = ", "{:0.2e}".format(self.beta_sei))
         print("deg_per_cyc = ", "{:0.2e}".format(self.deg_per_cycle))
 
+    def update(self, data_file_path):
+        """ Refits the model after observations have been appended to the data file.
+        The fit starts from the previous optimum, and is skipped if the data didn't change.
+
+        :param data_file_path: path of the updated data file
+        :return: True if the model has been refitted
+        """
+        data = self.read_data(data_file_path)
+
+        if same_observations(self.data['N'], self.data['L'], data['N'], data['L']):
+            return False
+
+        self.data = data
+        self.least_square_fit(params=self.opt_params)
+        return True
+
+    def bootstrap(self, n_replicates=200, resampling='residuals', seed=None, processes=None):
+        """ Bootstrap of the SEI model parameters, warm started from the point estimate
+
+        :param n_replicates: number of bootstrap replicates
+        :param resampling: either 'residuals' or 'pairs'
+        :param seed: seed of the resampling
+        :param processes: number of worker processes; None uses all the cores
+        :return: dictionary of arrays of alpha_sei, beta_sei and deg_per_cyc samples
+        """
+        return bootstrap_fit(residuals=residuals_nonlinear_cycle_model,
+                             params=self.opt_params,
+                             x=self.data['N'],
+                             y=self.data['L'],
+                             n_replicates=n_replicates,
+                             resampling=resampling,
+                             seed=seed,
+                             method='least_squares',
+                             nan_policy='omit',
+                             processes=processes)
+
     def plot_sei_model(self, ax):
-        # solution
-        cycle_num_linspace = np.linspace(self.data['N'].min(), self.data['N'].max(), 100)
-        degradation_model = nonlinear_cycle_model(cycle_num_linspace,
-                                                  self.alpha_sei,
-                                                  self.beta_sei,
-                                                  self.deg_per_cycle)
-        capa_model = 100-100*degradation_model
-
-        # plot
-        ax.plot(cycle_num_linspace, capa_model, 'r-', label='SEI model')
-        ax.plot(self.data['N'], 100 * self.data['SoC'], 'bx', label='experimental data')
-
-        ax.set_xlabel('Cycle number')
-        ax.set_ylabel('State of Charge [%]')
-        ax.set_ylim([75, 100])
-        ax.set_xlim([0, None])
-
-        plt.title('SEI model fit')
-        plt.legend()
-        plt.tight_layout()
-        plt.draw()
+        from degradation_model.plotting import plot_sei_model
+        plot_sei_model(self, ax)
@@ -0,0 +1,291 @@
+# -*- coding: UTF-8 -*-
+
+"""
+Estimation of the degradation of a directory of state of charge files, which can be resumed after an interruption.
+
+The files are read by blocks (data_io.read_soc_csv_blocks) and their samples fed to a DegradationTracker,
+one per file. The results are written as in degradation_estimation.py --out (windows and files tables,
+see result_writer), the degradation of a window being the one at its last sample.
+
+At intervals of --checkpoint-interval samples, and at the end of each file, the state of the estimation
+is saved in a JSON checkpoint file: the state of the tracker (hysteresis of the peak detection,
+residue of the rainflow counting, sums of the calendar and cycling degradation), the file being read and
+the byte offset of its next block, the current window and the sizes of the outputs. The checkpoint is
+written in a temporary file, then renamed, so that an interruption leaves the previous checkpoint.
+
+With --resume, the run starts again from the checkpoint: the outputs are truncated to their sizes at
+the checkpoint, and the blocks are read from the saved offset. The blocks, hence the sums, are the same as
+in an uninterrupted run, so the results are bit-identical.
+
+Usage, from the root of the project:
+    $ python -m degradation_model.checkpointed_estimation input_data --out results --checkpoint-interval 10000000
+and, after an interruption:
+    $ python -m degradation_model.checkpointed_estimation input_data --out results --resume
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from degradation_model.data_io import input_files, read_soc_csv_blocks, time_in_seconds
+from degradation_model.degradation_model import nonlinear_general_model
+from degradation_model.degradation_tracker import DegradationTracker
+from degradation_model.profiling import get_collector
+from degradation_model.result_writer import open_result_writer, WINDOW_COLUMNS, FILE_COLUMNS
+
+CHECKPOINT_VERSION = 3
+
+
+class CheckpointedEstimation:
+    def __init__(self, input_paths, out, output_format='csv', temperature=21, chemistry='NMC',
+                 alpha_sei=5.87e-02, beta_sei=1.06e+02, delta=0.1, window=86400., block_bytes=1 << 24):
+        """
+
+        :param input_paths: list of the paths of the .csv files of time and state of charge
+        :param out: output directory
+        :param output_format: either csv or columnar
+        :param temperature: temperature in °C
+        :param chemistry: either NMC, LMO or LFP
+        :param alpha_sei: parameter of the nonlinear general model
+        :param beta_sei: parameter of the nonlinear general model
+        :param delta: hysteresis of the peak detection, in % of state of charge
+        :param window: duration of the output windows, in second
+        :param block_bytes: size of the blocks read in the files, in byte
+        """
+        # parameters, which must be the same when the estimation is resumed
+        self.config = {'input_paths': list(input_paths),
+                       'output_format': output_format,
+                       'temperature': temperature,
+                       'chemistry': chemistry,
+                       'alpha_sei': alpha_sei,
+                       'beta_sei': beta_sei,
+                       'delta': delta,
+                       'window': window,
+                       'block_bytes': block_bytes}
+        self.out = out
+
+        # progress
+        self.file_index = 0
+        self.offset = 0  # byte offset of the next block of the current file (0 before its header)
+        self.origin = None  # first date of the current file, if its times are dates
+        self.t_first = None  # first time of the current file, in second
+        self.window = 0  # index of the current window of the current file
+        self.tracker = None
+        self.output_positions = None  # sizes of the outputs, see ResultWriter.position
+
+    # -------- checkpoints ----------------------------------------------
+
+    def state(self):
+        return {'version': CHECKPOINT_VERSION,
+                'config': self.config,
+                'file_index': self.file_index,
+                'offset': self.offset,
+                'origin': self.origin,
+                't_first': self.t_first,
+                'window': self.window,
+                'tracker': None if self.tracker is None else self.tracker.state(),
+                'output_positions': self.output_positions}
+
+    def save_checkpoint(self, path):
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as fp:
+            json.dump(self.state(), fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def from_checkpoint(cls, path, out):
+        """
+
+        :param path: path of a checkpoint file
+        :param out: output directory
+        :return: CheckpointedEstimation, at the state of the checkpoint
+        """
+        with open(path) as fp:
+            state = json.load(fp)
+        if state['version'] != CHECKPOINT_VERSION:
+            sys.exit('The checkpoint ' + path + ' was written by another version')
+
+        estimation = cls(out=out, **state['config'])
+        estimation.file_index = state['file_index']
+        estimation.offset = state['offset']
+        estimation.origin = state['origin']
+        estimation.t_first = state['t_first']
+        estimation.window = state['window']
+        if state['tracker'] is not None:
+            estimation.tracker = DegradationTracker.from_state(state['tracker'])
+        estimation.output_positions = state['output_positions']
+        return estimation
+
+    # -------- estimation -----------------------------------------------
+
+    def degradation_row(self):
+        cal_degradation, cyc_degradation = self.tracker.degradation()
+        linearised = cal_degradation + cyc_degradation
+        return {'cal_degradation': cal_degradation,
+                'cyc_degradation': cyc_degradation,
+                'linearised_degradation': linearised,
+                'nonlinear_degradation': nonlinear_general_model(self.config['alpha_sei'], self.config['beta_sei'],
+                                                                 linearised)}
+
+    def write_windows(self, writer, last_window, t_end=None):
+        """ Writes the windows from the current one to last_window excluded, with the degradation at the last
+        sample fed to the tracker (the windows without samples keep the degradation of the previous one)
+
+        :param t_end: end of the last written window (end of the windows if None)
+        """
+        window = np.arange(self.window, last_window)
+        t_start = self.t_first + window * self.config['window']
+        rows = self.degradation_row()
+        rows.update({'file_id': self.file_index, 'window': window, 't_start': t_start,
+                     't_end': t_start + self.config['window']})
+        if t_end is not None:
+            rows['t_end'] = np.append(rows['t_end'][:-1], t_end)
+        writer.write(rows)
+        self.window = last_window
+
+    def feed(self, time_v, soc_v, windows_writer):
+        """ Feeds samples to the tracker, writing the windows which end before them """
+        window_length = self.config['window']
+        while len(time_v) > 0:
+            # samples of the current window
+            stop = np.searchsorted(time_v, self.t_first + (self.window + 1) * window_length, side='left')
+            self.tracker.update_many(time_v[:stop], soc_v[:stop], self.config['temperature'])
+            if stop == len(time_v):
+                return
+
+            # the sample stop starts a new window: the previous ones are complete
+            self.write_windows(windows_writer, int((time_v[stop] - self.t_first) // window_length))
+            time_v = time_v[stop:]
+            soc_v = soc_v[stop:]
+
+    def run(self, checkpoint_path=None, checkpoint_interval=10000000, collector=None, on_file_done=None):
+        """
+
+        :param checkpoint_path: path of the checkpoint file (no checkpoint if None)
+        :param checkpoint_interval: number of samples between two checkpoints (checked at the end of each block)
+        :param collector: collector of profiling measurements, see degradation_model.profiling (disabled if None)
+        :param on_file_done: function called at the end of each file, on_file_done(path, n_samples, n_windows),
+                             e.g. print_file_done to report the progress (nothing is reported if None)
+        """
+        collector = get_collector(collector)
+        if not os.path.isdir(self.out):
+            os.makedirs(self.out)
+
+        input_paths = self.config['input_paths']
+        output_format = self.config['output_format']
+        resume = self.output_positions is not None
+
+        with open(os.path.join(self.out, 'file_names.txt'), 'w') as fp:
+            fp.write(''.join(os.path.basename(path) + '\n' for path in input_paths))
+
+        with open_result_writer(os.path.join(self.out, 'windows'), WINDOW_COLUMNS, output_format,
+                                append=resume) as windows_writer, \
+                open_result_writer(os.path.join(self.out, 'files'), FILE_COLUMNS, output_format,
+                                   append=resume) as files_writer:
+
+            writers = (windows_writer, files_writer)
+            if resume:
+                # the rows written after the checkpoint are written again
+                for writer, position in zip(writers, self.output_positions):
+                    writer.truncate(position)
+
+            def checkpoint():
+                if checkpoint_path is not None:
+                    self.output_positions = [writer.position() for writer in writers]
+                    self.save_checkpoint(checkpoint_path)
+
+            n_unsaved = 0
+            while self.file_index < len(input_paths):
+                path = input_paths[self.file_index]
+                if self.tracker is None:
+                    self.tracker = DegradationTracker(self.config['chemistry'], alpha_sei=self.config['alpha_sei'],
+                                                      beta_sei=self.config['beta_sei'], delta=self.config['delta'])
+
+                with collector.file(os.path.basename(path)):
+                    for dtm, soc_v, offset in read_soc_csv_blocks(path, self.offset, self.config['block_bytes']):
+                        if len(dtm) > 0:
+                            with collector.stage('time_conversion'):
+                                if self.t_first is None:
+                                    # the times of the file are counted from its first date
+                                    if not np.issubdtype(np.asarray(dtm).dtype, np.number):
+                                        self.origin = str(dtm[0])
+                                    self.t_first = float(time_in_seconds(dtm[:1], origin=self.origin)[0])
+                                time_v = time_in_seconds(dtm, origin=self.origin)
+
+                            with collector.stage('tracker'):
+                                self.feed(time_v, np.asarray(soc_v, dtype=float), windows_writer)
+                            collector.count('samples', len(dtm))
+
+                        self.offset = offset
+                        n_unsaved += len(dtm)
+                        if n_unsaved >= checkpoint_interval:
+                            checkpoint()
+                            n_unsaved = 0
+
+                    # end of the file: last window, and results of the file
+                    if self.tracker.n_samples > 0:
+                        self.write_windows(windows_writer, self.window + 1, t_end=self.tracker.last_timestamp)
+                        rows = self.degradation_row()
+                        rows.update({'file_id': self.file_index, 'n_samples': self.tracker.n_samples,
+                                     'n_turning_points': self.tracker.n_turning_points,
+                                     't_start': self.t_first, 't_end': self.tracker.last_timestamp})
+                        files_writer.write(rows)
+                if on_file_done is not None:
+                    on_file_done(path, self.tracker.n_samples, self.window)
+
+                self.file_index += 1
+                self.offset = 0
+                self.origin = None
+                self.t_first = None
+                self.window = 0
+                self.tracker = None
+                checkpoint()
+                n_unsaved = 0
+
+
+def print_file_done(path, n_samples, n_windows):
+    """ Progress report of the command line interfaces, see CheckpointedEstimation.run """
+    print('{}: {} samples, {} windows'.format(os.path.basename(path), n_samples, n_windows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resumable degradation estimation of the state of charge files '
+                                                 'of a directory')
+    parser.add_argument('input_dir', nargs='?', default='input_data', help='directory of the .csv input files')
+    parser.add_argument('--out', required=True, help='output directory')
+    parser.add_argument('--format', default='csv', choices=['csv', 'columnar'], help='format of the output')
+    parser.add_argument('--temperature', type=float, default=21)
+    parser.add_argument('--chemistry', default='NMC', choices=['NMC', 'LMO', 'LFP'])
+    parser.add_argument('--alpha-sei', type=float, default=5.87e-02)
+    parser.add_argument('--beta-sei', type=float, default=1.06e+02)
+    parser.add_argument('--delta', type=float, default=0.1, help='hysteresis of the peak detection, in %%')
+    parser.add_argument('--window', type=float, default=86400., help='duration of the output windows, in second')
+    parser.add_argument('--block-bytes', type=int, default=1 << 24, help='size of the blocks read in the files')
+    parser.add_argument('--checkpoint', help='path of the checkpoint file (default: <out>/checkpoint.json)')
+    parser.add_argument('--checkpoint-interval', type=int, default=10000000,
+                        help='number of samples between two checkpoints')
+    parser.add_argument('--resume', action='store_true', help='resumes the estimation from the checkpoint')
+    args = parser.parse_args()
+
+    if args.window <= 0:
+        parser.error('--window must be positive')
+
+    checkpoint_file = args.checkpoint if args.checkpoint is not None else os.path.join(args.out, 'checkpoint.json')
+
+    if args.resume:
+        if not os.path.isfile(checkpoint_file):
+            sys.exit('No checkpoint ' + checkpoint_file + ' to resume from')
+        estimation = CheckpointedEstimation.from_checkpoint(checkpoint_file, args.out)
+    else:
+        estimation = CheckpointedEstimation(input_files(args.input_dir), args.out, output_format=args.format,
+                                            temperature=args.temperature, chemistry=args.chemistry,
+                                            alpha_sei=args.alpha_sei, beta_sei=args.beta_sei, delta=args.delta,
+                                            window=args.window, block_bytes=args.block_bytes)
+
+    estimation.run(checkpoint_path=checkpoint_file, checkpoint_interval=args.checkpoint_interval,
+                   on_file_done=print_file_done)
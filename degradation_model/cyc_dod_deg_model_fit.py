@@ -13,13 +13,16 @@ N_cycles_at_80_SoH = k_d1 * DoD * e^(k_d2 * DoD)
 
 N-B: if the first equation is used to fit LFP data, the behavior
      at low DoD isn't properly modelled
+
+The least square algorithm only converges from initial values not too far from the solution.
+For a new chemistry, the multi-start mode solves the fit from many initial values
+(log-spaced k_d1, random k_d2 and k_d3) in parallel and keeps the best solution.
 """
 
-import matplotlib.pyplot as plt
 import numpy as np
 import sys
-from degradation_model.degradation_model import emp_deg_model_after_1_dod, residuals_emp_deg_model_after_1_dod, \
-                                                exp_deg_model_after_1_dod, residuals_exp_deg_model_after_1_dod
+from degradation_model.degradation_model import residuals_emp_deg_model_after_1_dod, residuals_exp_deg_model_after_1_dod
+from degradation_model.parallel_fit import bootstrap_tasks, run_fit_tasks, multi_start_fit, same_observations
 from lmfit import minimize, Parameters, fit_report
 from pandas import read_csv
 
@@ -27,12 +30,29 @@ from pandas import read_csv
 class CyclingDegModelFit:
     colors = ['red', 'blue', 'green', 'orange', 'purple', 'black', 'grey', 'brown']
 
-    def __init__(self, data_file_paths):
+    def __init__(self, data_file_paths, multi_start=False, n_starts=64, seed=None, processes=None):
+        """
+
+        :param data_file_paths: list of paths of the data files, one per chemistry
+        :param multi_start: if True, the fits are solved from n_starts initial values instead of the
+                            initial values hard-coded for NMC, LMO and LFP
+        :param n_starts: number of initial values of the multi-start mode
+        :param seed: seed of the random initial values of the multi-start mode
+        :param processes: number of worker processes of the multi-start mode; None uses all the cores
+        """
         self.data_file_paths = data_file_paths
+        self.multi_start = multi_start
+        self.n_starts = n_starts
+        self.rng = np.random.default_rng(seed)
+        self.processes = processes
+        self.convergence_reports = []
         self.opt_params = []
+        self.opt_param_sets = []
+        self.residuals_v = []
         self.chemistry = []
         self.cyc_nb_v = []
         self.dod_v = []
+        self.stress_data_v = []
 
         self.fit_stress_model_dod()
 
@@ -73,79 +93,167 @@ class CyclingDegModelFit:
 
             if chemistry == "LFP":
                 residuals = residuals_exp_deg_model_after_1_dod
-            elif chemistry == "LMO" or "NMC":
+            elif chemistry in ("LMO", "NMC"):
                 residuals = residuals_emp_deg_model_after_1_dod
             else:
                 sys.exit("The chemistry is incorrect or not supported by the model")
 
             # least square minimisation
-            opt_param = minimize(fcn=residuals,
-                                 params=params,
-                                 args=(dod, stress_data, 1),
-                                 method='leastsq')
+            if self.multi_start:
+                starting_params = self.multi_start_params(chemistry)
+                if len(params) > 0:
+                    starting_params.append(params)
+                best_params, report = multi_start_fit(residuals=residuals,
+                                                      starting_params=starting_params,
+                                                      args=(np.asarray(dod), np.asarray(stress_data), 1),
+                                                      method='leastsq',
+                                                      processes=self.processes)
+                self.convergence_reports.append(report)
+
+                # same fit from the best solution, so that opt_param is a standard lmfit output
+                opt_param = minimize(fcn=residuals,
+                                     params=best_params,
+                                     args=(dod, stress_data, 1),
+                                     method='leastsq')
+            else:
+                opt_param = minimize(fcn=residuals,
+                                     params=params,
+                                     args=(dod, stress_data, 1),
+                                     method='leastsq')
             # leastsq seems to work better than least_squares for those types of equations
 
             # stores optimisation output
             self.opt_params.append(opt_param.params['k_d1'].value)
             self.opt_params.append(opt_param.params['k_d2'].value)
             self.opt_params.append(opt_param.params['k_d3'].value)
+            self.opt_param_sets.append(opt_param.params)
+            self.residuals_v.append(residuals)
+            self.stress_data_v.append(stress_data)
 
             # stores chemistry
             self.chemistry.append(chemistry)
 
             # prints results
-            list_opt_params = ['{:.2e}'.format(opt_param.params['k_d1'].value),
-                               '{:.2e}'.format(opt_param.params['k_d2'].value),
-                               '{:.2e}'.format(opt_param.params['k_d3'].value)]
-
             print("Chemistry:", chemistry)
-            if chemistry == "LFP":
-                print("k_d1 = ", list_opt_params[0])
-                print("k_d2 = ", list_opt_params[1])
-            else:
-                print("k_d1 = ", list_opt_params[0])
-                print("k_d2 = ", list_opt_params[1])
-                print("k_d3 = ", list_opt_params[2])
+            if self.multi_start:
+                print("starts converged: ", report['n_converged'], "/", report['n_starts'],
+                      "- at best solution: ", report['n_at_best'])
+            self.print_results(chemistry, opt_param.params)
 
             # index incrementation
             i = i + 1
 
-    def plot_dod_graph(self, ax):
-        """ Plots the results of the data fit """
-        i = 0
+    def update(self, data_file_paths=None):
+        """ Refits the model after observations have been appended to the data files.
+        Each fit starts from its previous optimum, and is skipped if the data of its file didn't change.
 
-        for file in self.data_file_paths:
-            # solution
-            dod_linspace = np.linspace(1, 100, 100)
+        :param data_file_paths: paths of the updated data files, in the same order as the initial ones;
+                                by default, the initial paths are read again
+        :return: list of the chemistries which have been refitted
+        """
+        if data_file_paths is not None:
+            self.data_file_paths = data_file_paths
 
+        refitted = []
+        for i, file in enumerate(self.data_file_paths):
+            data_cyc = read_csv(file)
+            dod = data_cyc['DoD']
+            cyc_nb = data_cyc.iloc[:, 1]
+            stress_data = 0.2 * np.divide(1, cyc_nb)
+
+            if same_observations(self.dod_v[i], self.stress_data_v[i], dod, stress_data):
+                continue
+
+            opt_param = minimize(fcn=self.residuals_v[i],
+                                 params=self.opt_param_sets[i],
+                                 args=(dod, stress_data, 1),
+                                 nan_policy='omit',
+                                 method='leastsq')
+
+            self.opt_params[i * 3:(i + 1) * 3] = [opt_param.params['k_d1'].value,
+                                                  opt_param.params['k_d2'].value,
+                                                  opt_param.params['k_d3'].value]
+            self.opt_param_sets[i] = opt_param.params
+            self.cyc_nb_v[i] = cyc_nb
+            self.dod_v[i] = dod
+            self.stress_data_v[i] = stress_data
+
+            print("Chemistry:", self.chemistry[i], "(refitted)")
+            self.print_results(self.chemistry[i], opt_param.params)
+            refitted.append(self.chemistry[i])
+
+        return refitted
+
+    @staticmethod
+    def print_results(chemistry, params):
+        list_opt_params = ['{:.2e}'.format(params['k_d1'].value),
+                           '{:.2e}'.format(params['k_d2'].value),
+                           '{:.2e}'.format(params['k_d3'].value)]
+
+        if chemistry == "LFP":
+            print("k_d1 = ", list_opt_params[0])
+            print("k_d2 = ", list_opt_params[1])
+        else:
+            print("k_d1 = ", list_opt_params[0])
+            print("k_d2 = ", list_opt_params[1])
+            print("k_d3 = ", list_opt_params[2])
+
+    def multi_start_params(self, chemistry):
+        """ Initial values of the multi-start mode: k_d1 is log-spaced, k_d2 and k_d3 are random
+
+        :param chemistry: chemistry of the data file; k_d3 is fixed to 0 for LFP
+        :return: list of lmfit Parameters
+        """
+        k_d1_v = np.logspace(-8, 8, self.n_starts)
+        k_d2_v = self.rng.uniform(-3, 3, self.n_starts)
+        # k_d3 can be of either sign, and spans several orders of magnitude
+        k_d3_v = self.rng.choice([-1, 1], self.n_starts) * np.power(10, self.rng.uniform(0, 6, self.n_starts))
+
+        starting_params = []
+        for k in range(0, self.n_starts):
             params = Parameters()
+            params.add('k_d1', value=k_d1_v[k])
+            params.add('k_d2', value=k_d2_v[k])
+            if chemistry == "LFP":
+                params.add('k_d3', value=0, vary=False)
+            else:
+                params.add('k_d3', value=k_d3_v[k])
+            starting_params.append(params)
 
-            params.add('k_d1', value=self.opt_params[i * 3])
-            params.add('k_d2', value=self.opt_params[i * 3 + 1])
-            params.add('k_d3', value=self.opt_params[i * 3 + 2])
+        return starting_params
 
-            if self.chemistry[i] == "LFP":
-                stress_dod_model_emp = exp_deg_model_after_1_dod(params, dod_linspace / 100)
-            elif self.chemistry[i] == "LMO" or "NMC":
-                stress_dod_model_emp = emp_deg_model_after_1_dod(params, dod_linspace / 100)
+    def bootstrap(self, n_replicates=200, resampling='residuals', seed=None, processes=None):
+        """ Bootstrap of the depth of discharge model parameters of every data file,
+        warm started from the point estimates. All the replicates are fitted in a single process pool.
 
-            # plot
-            ax.plot(dod_linspace,
-                    0.2 * np.divide(1, stress_dod_model_emp),
-                    'b-',
-                    label=self.chemistry[i],
-                    color=self.colors[i])
-            # ax.plot(self.dod_v[i]*100, self.cyc_nb_v[i], 'kx', label='', alpha=0.4)
+        :param n_replicates: number of bootstrap replicates per data file
+        :param resampling: either 'residuals' or 'pairs'
+        :param seed: seed of the resampling
+        :param processes: number of worker processes; None uses all the cores
+        :return: list (one element per data file) of dictionaries of arrays of k_d1, k_d2 and k_d3 samples
+        """
+        rng = np.random.default_rng(seed)
 
-            # index incrementation
-            i = i + 1
+        tasks = []
+        for i in range(0, len(self.data_file_paths)):
+            tasks += bootstrap_tasks(residuals=self.residuals_v[i],
+                                     params=self.opt_param_sets[i],
+                                     x=self.dod_v[i],
+                                     y=self.stress_data_v[i],
+                                     n_replicates=n_replicates,
+                                     resampling=resampling,
+                                     seed=rng,
+                                     method='leastsq')
+
+        samples = run_fit_tasks(tasks, processes=processes)
 
-        ax.set_xlabel('Depth of Discharge [%]')
-        ax.set_ylabel('Cycle No.')
-        ax.set_xlim([0, 100])
-        ax.set_title('Cycle count at 80% state of Health')
+        samples_v = []
+        for i in range(0, len(self.data_file_paths)):
+            samples_i = samples[i * n_replicates:(i + 1) * n_replicates]
+            samples_v.append({name: samples_i[:, k] for k, name in enumerate(self.opt_param_sets[i])})
 
-        plt.yscale('log')
-        plt.legend()
-        plt.tight_layout()  # without it, the text overlap
-        plt.draw()
+        return samples_v
+
+    def plot_dod_graph(self, ax):
+        from degradation_model.plotting import plot_dod_graph
+        plot_dod_graph(self, ax)
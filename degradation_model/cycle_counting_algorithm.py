@@ -4,18 +4,34 @@ This module uses the peak detection and rainflow libraries.
 It enables to convert a random signal into simple cycles,
 characterised by their range, count (half or full cycle)
 and mean value.
+
+Only numpy is imported: data files are read with pandas, and plots drawn
+with matplotlib, through modules imported when needed.
 """
 
 import lib.peak_det.peak_det as pkd
 import lib.rainflow.rainflow as rf
-import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import sys
 
+from degradation_model.profiling import get_collector
+
 
 class CycleCounter:
-    def __init__(self, data_file_path='', time_v=None, soc_v=None, delta=0.1, title=''):
+    def __init__(self, data_file_path='', time_v=None, soc_v=None, delta=0.1, title='', collector=None, dtype=None):
+        """
+
+        :param data_file_path: path of a .csv file of time and state of charge, read if the vectors aren't given
+        :param time_v: time vector in second
+        :param soc_v: state of charge vector in %
+        :param delta: hysteresis of the peak detection in %
+        :param title: title of the plots
+        :param collector: collector of profiling measurements, see degradation_model.profiling (disabled if None)
+        :param dtype: float type of the state of charge and of the cycle arrays, e.g. numpy.float32 to halve their
+                      memory; the sums are accumulated in double precision (float64 if None)
+        """
+        self.collector = get_collector(collector)
+        self.dtype = dtype
 
         if data_file_path == '':
             if (time_v is not None) and (soc_v is not None):
@@ -24,66 +40,118 @@ class CycleCounter:
             else:
                 sys.exit('Either a path or vectors must be argument of CycleCounter')
         else:
-            csv_input = pd.read_csv(data_file_path, parse_dates=True)
-            t = csv_input.iloc[:, 0]
-            series = csv_input.iloc[:, 1]
+            from degradation_model.data_io import read_soc_csv
+            with self.collector.stage('read_csv'):
+                t, series = read_soc_csv(data_file_path, dtype=dtype)
 
         self.mean_soc = 0
         self.arr_dod = []
-        self.arr_dod = []
         self.arr_n = []
+        self.arr_start = []
+        self.arr_end = []
 
         self.title = title
         self.delta = delta
-        self.data = pd.DataFrame({'t': t, 'series': series})
+        self.data = {'t': np.asarray(t), 'series': np.asarray(series, dtype=dtype)}
         self.min_points = []
         self.max_points = []
 
+        # the mean state of charge only needs the sum and number of samples;
+        # the missing samples (NaN) are skipped, as by the mean of pandas
+        self.n_samples = len(self.data['series']) - int(np.count_nonzero(np.isnan(self.data['series'])))
+        self.soc_sum = np.nansum(self.data['series'], dtype=np.float64)
+
+        self.collector.count('samples', self.n_samples)
+
         self.turning_points_extraction()
 
+    @classmethod
+    def from_compressed(cls, compressed, title='', collector=None):
+        """ Builds a cycle counter from the turning points of a compressed state of charge series,
+        without the samples, see degradation_model.soc_compression
+
+        :param compressed: CompressedSoC
+        :return: CycleCounter, on which rainflow_process can be called
+        """
+        cycle_counter = cls.__new__(cls)
+
+        cycle_counter.collector = get_collector(collector)
+        cycle_counter.dtype = None
+        cycle_counter.mean_soc = 0
+        cycle_counter.arr_dod = []
+        cycle_counter.arr_n = []
+        cycle_counter.arr_start = []
+        cycle_counter.arr_end = []
+        cycle_counter.title = title
+        cycle_counter.delta = compressed.delta
+        cycle_counter.data = {'t': None, 'series': None}
+
+        cycle_counter.n_samples = compressed.n_samples
+        cycle_counter.soc_sum = compressed.soc_sum
+        cycle_counter.max_points, cycle_counter.min_points = compressed.turning_points()
+
+        cycle_counter.collector.count('samples', compressed.n_samples)
+        cycle_counter.collector.count('turning_points', len(compressed.tp_value))
+
+        return cycle_counter
+
     def turning_points_extraction(self):
-        max_points, min_points = pkd.peakdet(self.data['series'], delta=self.delta)
+        with self.collector.stage('peakdet'):
+            max_points, min_points = pkd.peakdet(self.data['series'], delta=self.delta)
 
         self.min_points = min_points
         self.max_points = max_points
 
-    def soc_profile_plot(self, title, ax):
-        ax.plot(self.data['t'], self.data['series'], label="x")
-        ax.set_ylabel('State of charge [%]')
-        ax.set_xlabel('time [s]')
-        ax.set_title('SoC profile - ' + self.title)
+        self.collector.count('turning_points', len(min_points) + len(max_points))
 
-        plt.draw()
+    def soc_profile_plot(self, title, ax):
+        from degradation_model.plotting import soc_profile_plot
+        soc_profile_plot(self, ax)
 
     def turning_point_plot(self, ax):
-        ax.plot(self.data['series'], label='turning points')
+        from degradation_model.plotting import turning_point_plot
+        turning_point_plot(self, ax)
+
+    def rainflow_process(self, processes=1):
+        """
 
-        ax.scatter(np.array(self.max_points)[:, 0], np.array(self.max_points)[:, 1], color='red', label="max")
-        ax.scatter(np.array(self.min_points)[:, 0], np.array(self.min_points)[:, 1], color='blue', label="min")
-        ax.set_ylabel('State of charge [%]')
-        ax.set_xlabel('time series')
+        :param processes: number of processes of the rainflow counting (all the cores if None),
+                          see lib.rainflow.rainflow.rainflow_parallel; the cycles don't depend on it
+        """
+        with self.collector.stage('rainflow'):
+            self.rainflow_counting(processes=processes)
 
-        plt.xticks([])
-        plt.legend()
-        plt.title('Series of extracted peaks')
-        plt.tight_layout()
-        plt.draw()
+        self.collector.count('cycles', len(self.arr_n))
 
-    def rainflow_process(self):
+    def rainflow_counting(self, processes=1):
         # concatenation of the turning points
-        array_ext = np.concatenate((self.min_points, self.max_points), axis=0)
+        # (a signal without reversal has no turning points)
+        array_ext = np.concatenate((np.reshape(self.min_points, (-1, 2)), np.reshape(self.max_points, (-1, 2))), axis=0)
         array_ext = array_ext[array_ext[:, 0].argsort(), :]
         array_ext = np.transpose(array_ext)
+        index_ext = array_ext[0].astype(np.int64)  # indices of the turning points in the series
         array_ext = array_ext[1]
 
         # calculate cycle counts with rainflow algorithm
         # with default values for lfm (0), l_ult (1e16), and uc_mult (0.5)
-        array_out = rf.rainflow(array_ext)
+        dtype = float if self.dtype is None else self.dtype
+        if processes == 1:
+            array_out, arr_start, arr_end = rf.rainflow(array_ext, return_indices=True, index_ext=index_ext,
+                                                        dtype=dtype)
+        else:
+            array_out, arr_start, arr_end = rf.rainflow_parallel(array_ext, processes=processes,
+                                                                 return_indices=True, index_ext=index_ext,
+                                                                 dtype=dtype)
 
         # sort array_out by cycle range
-        array_out = array_out[:, array_out[0, :].argsort()]
+        order = array_out[0, :].argsort()
+        array_out = array_out[:, order]
 
-        self.mean_soc = np.mean(self.data['series'])/100  # converts percentage into number between 0 and 1
+        # sample indices of the start and end of each cycle
+        self.arr_start = arr_start[order]
+        self.arr_end = arr_end[order]
+
+        self.mean_soc = self.soc_sum/self.n_samples/100  # converts percentage into number between 0 and 1
 
         self.arr_dod = array_out[0, :]/100  # converts percentage into number between 0 and 1
         self.arr_n = array_out[3, :]
@@ -95,3 +163,34 @@ class CycleCounter:
         #     fp.write('Range,Count,Mean_' + mean_soc + '\n')
         #     for i in range(len(array_out.T)):
         #         fp.write('{:.3f},{:.3f},{:.3f}'.format(*array_out[[0, 3, 1], i]) + '\n')
+
+
+def count_cycles_batch(soc_profiles, delta=0.1):
+    """ Counts the cycles of many state of charge profiles, e.g. daily profiles, with one call of rainflow
+
+    :param soc_profiles: list of state of charge vectors in %
+    :param delta: hysteresis of the peak detection in %
+    :return: tuple of arrays (arr_dod, arr_n, arr_soc_mean, segment, mean_soc):
+             the depth of discharge, count and mean state of charge of the cycles of all the profiles
+             (between 0 and 1), the index of the profile of each cycle, and the mean state of charge of
+             each profile (between 0 and 1)
+    """
+    values = []
+    offsets = [0]
+    mean_soc = np.empty(len(soc_profiles))
+
+    for i, soc_v in enumerate(soc_profiles):
+        soc_v = np.asarray(soc_v)
+        max_points, min_points = pkd.peakdet(soc_v, delta=delta)
+
+        # concatenation of the turning points, in the order of the profile
+        array_ext = np.concatenate((np.reshape(min_points, (-1, 2)), np.reshape(max_points, (-1, 2))), axis=0)
+        array_ext = array_ext[array_ext[:, 0].argsort(), 1]
+
+        values.append(array_ext)
+        offsets.append(offsets[-1] + len(array_ext))
+        mean_soc[i] = np.sum(soc_v)/len(soc_v)/100
+
+    array_out, segment = rf.rainflow_batch(np.concatenate(values) if len(values) > 0 else np.empty(0), offsets)
+
+    return array_out[0, :]/100, array_out[2, :], array_out[1, :]/100, segment, mean_soc
@@ -0,0 +1,145 @@
+# -*- coding: UTF-8 -*-
+
+""" This module reads the data files of the project with pandas.
+
+The numerical core doesn't depend on pandas: it imports this module lazily,
+only when a data file has to be read.
+"""
+
+import os
+import numpy as np
+
+from io import BytesIO
+from pandas import read_csv, to_datetime
+
+
+def input_files(input_dir):
+    """
+
+    :param input_dir: directory of the input files
+    :return: sorted list of the paths of the .csv files of the directory
+    """
+    return [os.path.join(input_dir, fn) for fn in sorted(os.listdir(input_dir))
+            if os.path.isfile(os.path.join(input_dir, fn)) and os.path.splitext(fn)[1] == '.csv']
+
+
+def read_soc_csv(data_file_path, dtype=None):
+    """
+
+    :param data_file_path: path of a file whose first column is the time and second column the state of charge
+    :param dtype: float type of the state of charge, e.g. numpy.float32, parsed directly in this type
+                  (type inferred by pandas if None)
+    :return: tuple (time array, state of charge array)
+    """
+    column_types = None
+    if dtype is not None:
+        columns = read_csv(data_file_path, nrows=0).columns
+        column_types = {columns[1]: dtype}
+    csv_input = read_csv(data_file_path, parse_dates=True, dtype=column_types)
+    return csv_input.iloc[:, 0].values, csv_input.iloc[:, 1].values
+
+
+def read_calendar_data(data_file_path):
+    """
+
+    :param data_file_path: path of a calendar data file, whose first column is the time in year and whose other
+                           columns are the remaining capacity under a condition given by their name, e.g. capa_T=25
+                           or capa_SoC=50%
+    :return: tuple (time in year, list of the conditions, list of the remaining capacity series under each condition)
+    """
+    df_cal_data = read_csv(data_file_path)
+
+    # extracts the conditions from the columns' name
+    conditions = [int(x.split('=')[1].rstrip('%')) for x in df_cal_data.columns[1:]]
+
+    SoH_data = []
+    for i in range(1, len(conditions) + 1):  # the first column is skipped (that's the time in year)
+        SoH_data.append(df_cal_data.iloc[:, i])
+
+    return df_cal_data['time[year]'], conditions, SoH_data
+
+
+def read_dst_data(data_file_path):
+    """
+
+    :param data_file_path: path of a DST experimental data file
+    :return: tuple (DST cycle number array, state of health array in %)
+    """
+    df_data_DST = read_csv(data_file_path)
+    return df_data_DST.iloc[:, 0].values, df_data_DST.iloc[:, 1].values
+
+
+def time_in_seconds(t, origin=None):
+    """
+
+    :param t: time column, either numbers of seconds or dates
+    :param origin: date (or date string) from which the dates are counted (the first date if None)
+    :return: float array of the times in second
+    """
+    t = np.asarray(t)
+    if np.issubdtype(t.dtype, np.number):
+        return t.astype(float)
+
+    dates = to_datetime(t)
+    origin = dates[0] if origin is None else to_datetime(origin)
+    return (dates - origin).total_seconds().values
+
+
+def read_soc_csv_runs(data_file_path, chunksize=1000000):
+    """ Reads a file of time and state of charge as runs of constant state of charge, chunk by chunk,
+    so that the memory used depends on the number of changes of the state of charge
+
+    :param data_file_path: path of a file whose first column is the time and second column the state of charge
+    :param chunksize: number of lines read at once
+    :return: SoCRuns, the dates being counted in second from the first one
+    """
+    from degradation_model.soc_runs import encode_runs, concatenate_runs
+
+    runs_list = []
+    origin = None
+    n = 0
+    for chunk in read_csv(data_file_path, chunksize=chunksize):
+        t = chunk.iloc[:, 0].values
+        if origin is None and not np.issubdtype(t.dtype, np.number):
+            origin = to_datetime(t[:1])[0]
+        runs_list.append(encode_runs(time_in_seconds(t, origin), chunk.iloc[:, 1].values, first_index=n))
+        n = n + len(chunk)
+
+    return concatenate_runs(runs_list)
+
+
+def read_soc_csv_blocks(data_file_path, offset=0, block_bytes=1 << 24):
+    """ Reads a file of time and state of charge by blocks of lines, from a byte offset.
+
+    The blocks only depend on the offset they start from: reading from the offset of a block
+    gives the same blocks as the reading which reached it, e.g. when an estimation is resumed.
+
+    :param data_file_path: path of a file whose first column is the time and second column the state of charge
+    :param offset: byte offset of the first line to read; 0 for the start of the file, whose header is skipped
+    :param block_bytes: size of the blocks, in byte (a block ends at the last complete line)
+    :return: generator of tuples (time column, state of charge array, byte offset of the next block)
+    """
+    with open(data_file_path, 'rb') as fp:
+        if offset == 0:
+            fp.readline()
+            offset = fp.tell()
+
+        while True:
+            fp.seek(offset)
+            data = fp.read(block_bytes)
+            if len(data) == 0:
+                return
+
+            if len(data) == block_bytes:
+                end = data.rfind(b'\n') + 1
+                if end == 0:
+                    # line longer than a block
+                    data = data + fp.readline()
+                    end = len(data)
+                data = data[:end]
+            offset += len(data)
+
+            if len(data.strip()) == 0:
+                continue
+            block = read_csv(BytesIO(data), header=None)
+            yield block.iloc[:, 0].values, block.iloc[:, 1].values, offset
@@ -1,14 +1,16 @@
 # -*- coding: UTF-8 -*-
 
 """ This modules defines all degradation and stress models used in the project.
+
+It only depends on numpy, so that it can be imported quickly, e.g. by worker processes.
+The residuals functions take lmfit Parameters, but don't need lmfit to be imported.
 """
 
-import matplotlib.pylab as plt
-import collections
 import numpy as np
+import sys
 
-from degradation_model.cycle_counting_algorithm import CycleCounter
-from lmfit import Parameters
+from degradation_model.cycle_counting_algorithm import CycleCounter, count_cycles_batch
+from degradation_model.profiling import get_collector
 from math import sqrt
 
 
@@ -95,20 +97,29 @@ def residuals_nonlinear_cal_model(params, t, soh, eps_data):
 
 # -------- Depth of discharge degradation model -----------------------
 
-def emp_deg_model_after_1_dod(params, dod):
+def emp_deg_model(dod, k_d1, k_d2, k_d3):
     """
 
-    :param params: parameters of the empirical degradation model (used for LFP batteries)
     :param dod: depth of discharge
+    :param k_d1: coefficient of the empirical degradation model
+    :param k_d2: coefficient of the empirical degradation model
+    :param k_d3: coefficient of the empirical degradation model
     :return: degradation after on cycle of the given depth of discharge
     """
-    k_d1 = params['k_d1'].value
-    k_d2 = params['k_d2'].value
-    k_d3 = params['k_d3'].value
     cycle_num_at_80_soh = np.divide(1, k_d1 * np.power(dod, k_d2) + k_d3)
     return cycle_num_at_80_soh
 
 
+def emp_deg_model_after_1_dod(params, dod):
+    """
+
+    :param params: parameters of the empirical degradation model (used for LFP batteries)
+    :param dod: depth of discharge
+    :return: degradation after on cycle of the given depth of discharge
+    """
+    return emp_deg_model(dod, params['k_d1'].value, params['k_d2'].value, params['k_d3'].value)
+
+
 def residuals_emp_deg_model_after_1_dod(params, dod, deg_data_after_1_dod, eps_data):
     """
 
@@ -122,20 +133,29 @@ def residuals_emp_deg_model_after_1_dod(params, dod, deg_data_after_1_dod, eps_d
     return (emp_deg_model_after_1_dod(params, dod) - deg_data_after_1_dod) / eps_data
 
 
-def exp_deg_model_after_1_dod(params, dod):
+def exp_deg_model(dod, k_d1, k_d2):
     """
 
-    :param params: parameters of the exponential degradation model (used for LMO and NMC batteries)
     :param dod: depth of discharge
+    :param k_d1: coefficient of the exponential degradation model
+    :param k_d2: coefficient of the exponential degradation model
     :return: degradation after on cycle of the given depth of discharge
     """
-    k_d1 = params['k_d1'].value
-    k_d2 = params['k_d2'].value
-    k_d3 = params['k_d3'].value  # not used but prevents from implementing if conditions in cyc_dod_deg_model_fit.py
     stress_dod = k_d1 * dod * np.exp(k_d2*dod)
     return stress_dod
 
 
+def exp_deg_model_after_1_dod(params, dod):
+    """
+
+    :param params: parameters of the exponential degradation model (used for LMO and NMC batteries)
+    :param dod: depth of discharge
+    :return: degradation after on cycle of the given depth of discharge
+    """
+    # k_d3 is not used but prevents from implementing if conditions in cyc_dod_deg_model_fit.py
+    return exp_deg_model(dod, params['k_d1'].value, params['k_d2'].value)
+
+
 def residuals_exp_deg_model_after_1_dod(params, dod, deg_data_after_1_dod, eps_data):
     """
 
@@ -157,22 +177,12 @@ def dod_deg_model(chemistry, dod):
     :return: degradation; 0.2 means end of life of the battery
     """
 
-    params = Parameters()
     if chemistry == "NMC":
-        params.add('k_d1', value=1.47e+04)
-        params.add('k_d2', value=-1.65e+00)
-        params.add('k_d3', value=3.61e+02)
-        deg_per_cyc = emp_deg_model_after_1_dod(params, dod)
+        deg_per_cyc = emp_deg_model(dod, k_d1=1.47e+04, k_d2=-1.65e+00, k_d3=3.61e+02)
     elif chemistry == "LMO":
-        params.add('k_d1', value=1.39e+05)
-        params.add('k_d2', value=-5.09e-01)
-        params.add('k_d3', value=-1.21e+05)
-        deg_per_cyc = emp_deg_model_after_1_dod(params, dod)
+        deg_per_cyc = emp_deg_model(dod, k_d1=1.39e+05, k_d2=-5.09e-01, k_d3=-1.21e+05)
     elif chemistry == "LFP":
-        params.add('k_d1', value=9.05e-06)
-        params.add('k_d2', value=1.40e+00)
-        params.add('k_d3', value=0)
-        deg_per_cyc = exp_deg_model_after_1_dod(params, dod)
+        deg_per_cyc = exp_deg_model(dod, k_d1=9.05e-06, k_d2=1.40e+00)
     else:
         print('The chemistry input of DoD_stress_model isn''t valid')
         return
@@ -193,40 +203,31 @@ def time_deg_model(t, k_t=4.11e-10):
 
 
 def voltage_stress_model(soc, k_v=10.2):
+    """
 
+    :param soc: state of charge (between 0 and 1), scalar or array
+    :param k_v: voltage stress parameter
+    :return: stress; stress = 1 below the state of charge threshold
+    """
     soc_threshold = 0.85
-    if not isinstance(soc, collections.Iterable):
-        if soc > soc_threshold:
-            stress = np.exp(k_v * (soc - soc_threshold))
-        else:
-            stress = 1.0
-    else:
-        stress = []
-        for i in range(0, len(soc)):
-            if soc[i] > soc_threshold:
-                stress.append(np.exp(k_v * (soc[i] - soc_threshold)))
-            else:
-                stress.append(1.0)
-    return stress
+    soc = np.asarray(soc)
+
+    stress = np.where(soc > soc_threshold, np.exp(k_v * (soc - soc_threshold)), 1.0)
+    return stress[()]
 
 
 def soc_stress_model(soc, k_soc=1.01e+00, s_ref=0.5):
     """
 
-    :param soc: state of charge (between 0 and 1)
+    :param soc: state of charge (between 0 and 1), scalar or array
     :param k_soc:
     :param s_ref:
     :return: stress between 0 and 1; stress = 1 under standard conditions
     """
 
     # model type 1 -------------------------------------------------------------------
-    if not isinstance(soc, collections.Iterable):
-            stress = np.exp(k_soc * (soc - s_ref))
-    else:
-        stress = []
-        for i in range(0, len(soc)):
-                stress.append(np.exp(k_soc * (soc[i] - s_ref)))
-    return stress
+    stress = np.exp(k_soc * (np.asarray(soc) - s_ref))
+    return stress[()]
 
     # model type 2, which an increased stress factor beyond 90% SoC ------------------
 
@@ -250,59 +251,225 @@ def soc_stress_model(soc, k_soc=1.01e+00, s_ref=0.5):
 def temp_stress_model(T, k_T=6.71e-02, T_ref=25):
     """
 
-    :param T: temperature in °C
+    :param T: temperature in °C, scalar or array
     :param k_T: temperature stress parameter
     :param T_ref: reference temperature, usually around 25°C
     :return: stress between 0 and 1; stress = 1 under reference conditions
     """
-    if not isinstance(T, collections.Iterable):
-        if T >= T_ref:
-            stress = (np.exp(k_T * (T - T_ref)))
-        elif T > T_ref - 10:
-            stress = 1
-        else:
-            stress = np.exp(k_T * (- T + T_ref - 10))
-    else:
-        stress = []
-        for i in range(0, len(T)):
-            if T[i] >= T_ref:
-                stress.append(np.exp(k_T*(T[i]-T_ref)))
-            elif T[i] > T_ref - 10:
-                stress.append(1)
-            else:
-                stress.append(np.exp(k_T * (- T[i] + T_ref - 10)))
-    return stress
+    T = np.asarray(T)
+
+    stress = np.where(T >= T_ref,
+                      np.exp(k_T * (T - T_ref)),
+                      np.where(T > T_ref - 10, 1.0, np.exp(k_T * (- T + T_ref - 10))))
+    return stress[()]
+
+
+def cal_degradation_model(soc_mean, T, time):
+    """
+
+    :param soc_mean: mean state of charge (between 0 and 1)
+    :param T: temperature in °C
+    :param time: time in second
+    :return: calendar degradation (linearised); 0.2 means end of life of the battery
+    """
+    time_stress = time_deg_model(time)
+    SoC_stress_cal = soc_stress_model(soc_mean)
+    temp_stress_cal = temp_stress_model(T)
+    return time_stress*SoC_stress_cal*temp_stress_cal
+
+
+GAP_POLICIES = ('interpolate', 'hold', 'exclude')
+
+
+def find_gaps(time_v, max_gap=None):
+    """
+
+    :param time_v: time vector in second
+    :param max_gap: longest interval between two samples which isn't a gap, in second
+                    (10 times the median interval if None)
+    :return: boolean array, True for the intervals between consecutive samples which are gaps
+    """
+    dt = np.diff(np.asarray(time_v, dtype=float))
+    if max_gap is None:
+        max_gap = 10 * np.median(dt) if len(dt) > 0 else 0.
+    return dt > max_gap
+
+
+def integrated_cal_degradation_model(time_v, soc_v, T, gap_policy='interpolate', max_gap=None):
+    """ Calendar degradation of irregularly sampled logs: the stress soc_stress_model(SoC(t)) * temp_stress_model(T(t))
+    is integrated over the timestamps of the samples (trapezoidal rule), instead of taking the stress of the mean
+    state of charge over an evenly sampled time
+
+    The intervals longer than max_gap are gaps of the log, handled according to gap_policy:
+    - 'interpolate': the stress varies linearly over the gap, as over any interval
+    - 'hold': the stress of the last sample before the gap is held until the next sample
+    - 'exclude': the gap doesn't age the battery
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param T: temperature in °C, scalar or vector of the temperatures of the samples
+    :param gap_policy: either interpolate, hold or exclude
+    :param max_gap: longest interval between two samples which isn't a gap, in second, see find_gaps
+    :return: calendar degradation (linearised); 0.2 means end of life of the battery
+    """
+    time_v = np.asarray(time_v, dtype=float)
+    soc_v = np.asarray(soc_v, dtype=float)
 
+    if gap_policy not in GAP_POLICIES:
+        sys.exit('The gap policy must be either ' + ', '.join(GAP_POLICIES))
+    if len(time_v) != len(soc_v):
+        sys.exit('The time and state of charge vectors must have the same length')
 
-def final_degradation_model(time_v, soc_v, T, time, chemistry, delta=0.1, title=''):
+    dt = np.diff(time_v)
+    if np.any(dt < 0):
+        sys.exit('The timestamps must be increasing')
+
+    stress = soc_stress_model(soc_v / 100) * temp_stress_model(T)
+
+    # mean stress over each interval between two samples
+    interval_stress = (stress[:-1] + stress[1:]) / 2
+    if gap_policy != 'interpolate':
+        gaps = find_gaps(time_v, max_gap)
+        interval_stress = np.where(gaps, stress[:-1] if gap_policy == 'hold' else 0., interval_stress)
+
+    # the time model is linear in time: the stress weights the time
+    return time_deg_model(np.dot(interval_stress, dt))
+
+
+def cyc_degradation_model(arr_dod, arr_n, arr_soc_mean, T, chemistry):
+    """
+
+    :param arr_dod: depth of discharge of the counted cycles (between 0 and 1)
+    :param arr_n: count of the cycles (1 for a full cycle, 0.5 for a half cycle)
+    :param arr_soc_mean: mean state of charge of the cycles (between 0 and 1)
+    :param T: temperature in °C
+    :param chemistry: either NMC, LMO or LFP
+    :return: cycling degradation (linearised); 0.2 means end of life of the battery
+    """
+    if len(arr_dod) == 0:
+        return 0
+
+    DoD_stress_cyc = dod_deg_model(chemistry, np.asarray(arr_dod))
+    SoC_stress_cyc = soc_stress_model(arr_soc_mean)
+    temp_stress_cyc = temp_stress_model(T)
+    voltage_stress_cyc = voltage_stress_model(arr_soc_mean)
+
+    # the cycle arrays may be float32: the sum is accumulated in double precision
+    return np.sum(arr_n * DoD_stress_cyc * SoC_stress_cyc * temp_stress_cyc * voltage_stress_cyc, dtype=np.float64)
+
+
+def final_degradation_model(time_v, soc_v, T, time, chemistry, delta=0.1, title='', collector=None,
+                            gap_policy=None, max_gap=None, dtype=None):
+    """
+
+    :param T: temperature in °C, scalar or vector of the temperatures of the samples; with a vector, the stress of
+              each cycle is the one of the mean temperature of its samples, and gap_policy must be given
+    :param time: time in second of the calendar degradation; unused when gap_policy is given, the calendar
+                 stress being then integrated over time_v
+    :param collector: collector of profiling measurements, see degradation_model.profiling (disabled if None)
+    :param gap_policy: if None, the calendar degradation is the one of the mean state of charge over time;
+                       otherwise the calendar stress is integrated over time_v, see integrated_cal_degradation_model
+    :param max_gap: longest interval between two samples which isn't a gap, in second, see find_gaps
+    :param dtype: float type of the state of charge and of the cycles, e.g. numpy.float32 (float64 if None),
+                  see CycleCounter
+    :return: tuple (calendar degradation, cycling degradation)
+    """
+    collector = get_collector(collector)
+
+    if np.ndim(T) > 0 and gap_policy is None:
+        sys.exit('A vector of temperatures needs a gap_policy, the calendar stress being integrated over time')
 
     # cycles counting
-    cycle_count1 = CycleCounter(time_v=time_v, soc_v=soc_v, delta=delta, title=title)
+    cycle_count1 = CycleCounter(time_v=time_v, soc_v=soc_v, delta=delta, title=title, collector=collector,
+                                dtype=dtype)
+
+    if gap_policy is None:
+        return cycle_counter_degradation(cycle_count1, T, time, chemistry, collector=collector)
 
     cycle_count1.rainflow_process()
 
-    soc_mean = cycle_count1.mean_soc
-    arr_dod = cycle_count1.arr_dod
-    arr_n = cycle_count1.arr_n
-    arr_soc_mean = cycle_count1.arr_soc_mean
+    with collector.stage('stress'):
+        cal_degradation = integrated_cal_degradation_model(time_v, soc_v, T, gap_policy=gap_policy,
+                                                           max_gap=max_gap)
+        cyc_degradation = cyc_degradation_model(cycle_count1.arr_dod,
+                                                cycle_count1.arr_n,
+                                                cycle_count1.arr_soc_mean,
+                                                cycle_temperature(T, cycle_count1.arr_start, cycle_count1.arr_end),
+                                                chemistry)
 
-    counted_cycles = len(arr_dod)
+    return cal_degradation, cyc_degradation
 
-    # calendar degradation ------------------------------------------------------------
-    time_stress = time_deg_model(time)
-    SoC_stress_cal = soc_stress_model(soc_mean)
-    temp_stress_cal = temp_stress_model(T)
-    cal_degradation = time_stress*SoC_stress_cal*temp_stress_cal
 
-    # cycling degradation -------------------------------------------------------------
-    cyc_degradation = 0
-    for i in range(0, counted_cycles):
-        DoD_stress_cyc_i = dod_deg_model(chemistry, arr_dod[i])
-        SoC_stress_cyc_i = soc_stress_model(arr_soc_mean[i])
-        temp_stress_cyc_i = temp_stress_model(T)
-        voltage_stress_cyc_i = voltage_stress_model(arr_soc_mean[i])
+def cycle_temperature(T, arr_start, arr_end):
+    """
 
-        cyc_degradation += arr_n[i] * DoD_stress_cyc_i * SoC_stress_cyc_i * temp_stress_cyc_i * voltage_stress_cyc_i
+    :param T: temperature in °C, scalar or vector of the temperatures of the samples
+    :param arr_start: sample index of the start of each cycle
+    :param arr_end: sample index of the end of each cycle
+    :return: T if it is a scalar, otherwise the mean temperature of the samples of each cycle
+    """
+    T = np.asarray(T, dtype=float)
+    if T.ndim == 0:
+        return T[()]
+
+    start = np.asarray(arr_start, dtype=np.int64)
+    end = np.asarray(arr_end, dtype=np.int64)
+    cumulative_T = np.concatenate(([0.], np.cumsum(T)))
+    return (cumulative_T[end + 1] - cumulative_T[start]) / (end - start + 1)
+
+
+def cycle_counter_degradation(cycle_count1, T, time, chemistry, collector=None):
+    """
+
+    :param cycle_count1: CycleCounter whose turning points are extracted
+    :param T: temperature in °C
+    :param time: time in second
+    :param chemistry: either NMC, LMO or LFP
+    :param collector: collector of profiling measurements, see degradation_model.profiling (disabled if None)
+    :return: tuple (calendar degradation, cycling degradation)
+    """
+    collector = get_collector(collector)
+
+    cycle_count1.rainflow_process()
+
+    with collector.stage('stress'):
+        # calendar degradation --------------------------------------------------------
+        cal_degradation = cal_degradation_model(cycle_count1.mean_soc, T, time)
+
+        # cycling degradation ---------------------------------------------------------
+        cyc_degradation = cyc_degradation_model(cycle_count1.arr_dod,
+                                                cycle_count1.arr_n,
+                                                cycle_count1.arr_soc_mean,
+                                                T,
+                                                chemistry)
 
     return cal_degradation, cyc_degradation
 
+
+def batch_degradation_model(soc_profiles, T, times, chemistry, delta=0.1, processes=1):
+    """ final_degradation_model of many profiles, e.g. daily profiles, whose cycles are counted in one call
+
+    :param soc_profiles: list of state of charge vectors in %
+    :param T: temperature in °C
+    :param times: time of each profile in second (array, or scalar for profiles of the same duration)
+    :param chemistry: either NMC, LMO or LFP
+    :param delta: hysteresis of the peak detection in %
+    :param processes: number of worker processes sharing the profiles, see fleet_runner.fleet_degradation
+                      (number of cores if None); 1 counts the cycles in the current process
+    :return: tuple of arrays (calendar degradation, cycling degradation), one value per profile
+    """
+    if processes != 1:
+        from degradation_model.fleet_runner import fleet_degradation
+        return fleet_degradation(soc_profiles, T, times, chemistry, delta=delta, processes=processes)
+
+    arr_dod, arr_n, arr_soc_mean, segment, mean_soc = count_cycles_batch(soc_profiles, delta=delta)
+
+    cal_degradation = cal_degradation_model(mean_soc, T, np.asarray(times, dtype=float))
+
+    cyc_degradation = np.zeros(len(soc_profiles))
+    if len(arr_dod) > 0:
+        deg_per_cycle = arr_n * dod_deg_model(chemistry, arr_dod) * soc_stress_model(arr_soc_mean) \
+            * temp_stress_model(T) * voltage_stress_model(arr_soc_mean)
+        cyc_degradation = np.bincount(segment, weights=deg_per_cycle, minlength=len(soc_profiles))
+
+    return cal_degradation, cyc_degradation
@@ -0,0 +1,163 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module computes the cumulative degradation of a battery over a state of charge series, in one pass.
+
+final_degradation_model gives the degradation at the end of a series; computing a capacity curve with it
+means running it again on many windows. degradation_series counts the cycles of the whole series once
+and returns the cumulative degradation at the turning points of the series:
+- cycling degradation: sum of the degradation of the cycles closed so far, and of the half cycles of the
+  rainflow residue of the turning points so far; a cycle is closed at the turning point which ends it.
+  As in DegradationTracker, the stress of the residue is kept in a stack of cumulative sums aligned with
+  the residue, so that each point is the degradation of the turning points so far
+- calendar degradation: cumulative sum of the calendar degradation of the intervals between the samples,
+  the state of charge stress being integrated over time (trapezoidal rule), as in
+  integrated_cal_degradation_model; unlike the calendar model of the mean state of charge so far, it never
+  decreases, e.g. when the state of charge drops
+Both are cumulative sums of non-negative increments, so the series is non-decreasing. At the last sample,
+the cycling degradation is the one of final_degradation_model on the whole series, and the calendar
+degradation the one of integrated_cal_degradation_model.
+
+The series can then be resampled at any times by linear interpolation, without counting the cycles again.
+"""
+
+import numpy as np
+
+import lib.rainflow.rainflow as rf
+from degradation_model.degradation_model import dod_deg_model, soc_stress_model, temp_stress_model, \
+                                                voltage_stress_model, time_deg_model, nonlinear_general_model
+from degradation_model.profiling import get_collector
+from degradation_model.soc_compression import turning_points
+
+
+class DegradationSeries:
+    def __init__(self, time, cal_degradation, cyc_degradation):
+        """
+
+        :param time: times of the points of the series, in second
+        :param cal_degradation: cumulative calendar degradation (linearised) at these times
+        :param cyc_degradation: cumulative cycling degradation (linearised) at these times
+        """
+        self.time = np.asarray(time, dtype=float)
+        self.cal_degradation = np.asarray(cal_degradation, dtype=float)
+        self.cyc_degradation = np.asarray(cyc_degradation, dtype=float)
+
+    def linearised_degradation(self):
+        return self.cal_degradation + self.cyc_degradation
+
+    def soh(self, alpha_sei=5.87e-02, beta_sei=1.06e+02):
+        """
+
+        :return: state of health (between 0 and 1) given by the nonlinear general model at the times of the series
+        """
+        return 1 - nonlinear_general_model(alpha_sei, beta_sei, self.linearised_degradation())
+
+    def resample(self, time):
+        """
+
+        :param time: times at which the series is evaluated, in second
+        :return: DegradationSeries at these times, interpolated linearly
+        """
+        time = np.asarray(time, dtype=float)
+        return DegradationSeries(time,
+                                 np.interp(time, self.time, self.cal_degradation),
+                                 np.interp(time, self.time, self.cyc_degradation))
+
+
+def cycles_degradation(cycles, chemistry, temp_stress):
+    """
+
+    :param cycles: (n x 3) array of cycles (load range in %, range mean in %, cycle count)
+    :param chemistry: either NMC, LMO or LFP
+    :param temp_stress: temperature stress
+    :return: degradation of each cycle
+    """
+    arr_dod = cycles[:, 0] / 100
+    arr_soc_mean = cycles[:, 1] / 100
+    return cycles[:, 2] * dod_deg_model(chemistry, arr_dod) * soc_stress_model(arr_soc_mean) * temp_stress \
+        * voltage_stress_model(arr_soc_mean)
+
+
+def degradation_series(time_v, soc_v, T, chemistry, delta=0.1, collector=None):
+    """
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param T: temperature in °C
+    :param chemistry: either NMC, LMO or LFP
+    :param delta: hysteresis of the peak detection, in % of state of charge
+    :param collector: collector of profiling measurements, see degradation_model.profiling (disabled if None)
+    :return: DegradationSeries at the first sample, at the turning points and at the last sample
+    """
+    collector = get_collector(collector)
+
+    time_v = np.asarray(time_v, dtype=float)
+    soc_v = np.asarray(soc_v)
+    n = len(soc_v)
+    collector.count('samples', n)
+
+    with collector.stage('peakdet'):
+        tp_index, tp_value, tp_is_max = turning_points(soc_v, delta)
+    collector.count('turning_points', len(tp_index))
+
+    with collector.stage('rainflow'):
+        # cycles, with the turning point which closes them, and the half cycles added to the residue by each
+        # turning point, with the number of points of the residue which it left unchanged
+        rainflow_counter = rf.RainflowCounter()
+        closing_tp = []
+        cycles = []
+        residue_tp = []
+        residue_cycles = []
+        n_kept = []
+        for i, value in enumerate(tp_value.tolist()):
+            closed = rainflow_counter.add(value)
+            closing_tp.extend([i] * len(closed))
+            cycles.extend(closed)
+
+            residue = rainflow_counter.residue
+            kept = max(rainflow_counter.n_unchanged, 1)
+            n_kept.append(kept)
+            for k in range(kept, len(residue)):
+                residue_tp.append(i)
+                residue_cycles.append((abs(residue[k] - residue[k - 1]), (residue[k] + residue[k - 1]) / 2.,
+                                       rainflow_counter.uc_mult))
+    collector.count('cycles', len(cycles) + len(rainflow_counter.residue_cycles()))
+
+    # points of the series: first sample, turning points, last sample
+    index = np.concatenate(([0], tp_index, [n - 1]))
+
+    with collector.stage('stress'):
+        temp_stress = temp_stress_model(T)
+
+        cyc_per_point = np.zeros(len(index))
+        if len(cycles) > 0:
+            cycles = np.array(cycles)
+            # the turning point i is the point i+1 of the series
+            cyc_per_point = np.bincount(np.array(closing_tp) + 1,
+                                        weights=cycles_degradation(cycles, chemistry, temp_stress),
+                                        minlength=len(index))
+        closed_degradation = np.cumsum(cyc_per_point)
+
+        # degradation of the residue at each turning point, from its stack of cumulative sums
+        residue_degradation = np.zeros(len(index))
+        if len(residue_cycles) > 0:
+            residue_cycles = np.array(residue_cycles)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                half_cycles = np.where(residue_cycles[:, 0] > 0,
+                                       cycles_degradation(residue_cycles, chemistry, temp_stress), 0.).tolist()
+            stack = [0.]
+            j = 0
+            for i, kept in enumerate(n_kept):
+                del stack[kept:]
+                while j < len(residue_tp) and residue_tp[j] == i:
+                    stack.append(stack[-1] + half_cycles[j])
+                    j += 1
+                residue_degradation[i + 1] = stack[-1]
+            residue_degradation[-1] = residue_degradation[-2]
+
+        # calendar degradation of each interval between two samples, the time model being linear in time
+        soc_stress = soc_stress_model(np.asarray(soc_v, dtype=float) / 100)
+        cal_increments = time_deg_model((soc_stress[:-1] + soc_stress[1:]) / 2 * np.diff(time_v)) * temp_stress
+        cal_degradation = np.concatenate(([0.], np.cumsum(cal_increments)))[index]
+
+    return DegradationSeries(time_v[index], cal_degradation, closed_degradation + residue_degradation)
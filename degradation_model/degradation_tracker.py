@@ -0,0 +1,289 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module tracks the degradation of a battery in real time, sample by sample.
+
+final_degradation_model counts the cycles of a whole state of charge profile; calling it on an
+ever-growing history costs O(n) per new sample. DegradationTracker keeps instead:
+- the hysteresis state of the peak detection (lib.peak_det.PeakDetector)
+- the residue of the rainflow counting (lib.rainflow.RainflowCounter)
+- the running sums of the calendar degradation (calendar stress times time) and of the cycling degradation
+  of the closed cycles
+so that each new sample costs an amortised O(1) work. The stress of the turning points found in the samples
+of a same update_many call is computed at once.
+
+The state of a tracker (state) is made of Python numbers and lists, e.g. to be saved as JSON in a checkpoint,
+and restored exactly by DegradationTracker.from_state.
+
+The cycles of the residue are counted as half cycles, as in final_degradation_model: the stress of the
+residue is kept in a stack of cumulative sums, aligned with the residue, so that it is updated in O(1).
+
+Temperature: the degradation so far is never rescaled by later temperatures, and the same rules as
+final_degradation_model with a vector of temperatures are used:
+- the stress of a cycle, or of a half cycle of the residue, is the one of the mean temperature of the samples
+  between its start and its end (cycle_temperature); the turning points carry the cumulative sum of the
+  temperatures up to their sample, so that the samples don't have to be kept
+- the calendar stress (state of charge and temperature stress) is integrated over time (trapezoidal rule)
+The tracker gives the degradation of final_degradation_model(..., gap_policy='interpolate') on the same
+samples (up to rounding errors).
+"""
+
+import numpy as np
+import sys
+
+from lib.peak_det.peak_det import PeakDetector
+from lib.rainflow.rainflow import RainflowCounter
+from degradation_model.degradation_model import dod_deg_model, soc_stress_model, voltage_stress_model, \
+                                                temp_stress_model, time_deg_model, nonlinear_general_model
+
+
+def cycle_stress(chemistry, dod, soc_mean):
+    """
+
+    :param chemistry: either NMC, LMO or LFP
+    :param dod: depth of discharge of the cycle (between 0 and 1)
+    :param soc_mean: mean state of charge of the cycle (between 0 and 1)
+    :return: degradation of one full cycle, without the temperature stress
+    """
+    return dod_deg_model(chemistry, dod) * soc_stress_model(soc_mean) * voltage_stress_model(soc_mean)
+
+
+def to_builtin(value):
+    """
+
+    :return: value, with its numpy scalars converted to Python numbers
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [to_builtin(v) for v in value]
+    return value
+
+
+def cycles_stress(chemistry, cycles):
+    """
+
+    :param chemistry: either NMC, LMO or LFP
+    :param cycles: list of cycles (load range in %, range mean in %, cycle count, start position, end position),
+                   a position being a tuple (sample index, sum of the temperatures of the samples before it,
+                   sum of the temperatures up to it)
+    :return: list of the degradation of the cycles, at the mean temperature of their samples
+    """
+    if len(cycles) == 0:
+        return []
+
+    lrange, mean, count, start, end = zip(*cycles)
+    temperature = [(e[2] - s[1]) / (e[0] - s[0] + 1) for s, e in zip(start, end)]
+
+    lrange = np.array(lrange)
+    mean = np.array(mean) / 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stress = np.array(count) * cycle_stress(chemistry, lrange / 100, mean) * temp_stress_model(np.array(temperature))
+    return np.where(lrange > 0, stress, 0.).tolist()
+
+
+class DegradationTracker:
+    def __init__(self, chemistry, alpha_sei=5.87e-02, beta_sei=1.06e+02, delta=0.1):
+        """
+
+        :param chemistry: either NMC, LMO or LFP
+        :param alpha_sei: parameter of the nonlinear general model
+        :param beta_sei: parameter of the nonlinear general model
+        :param delta: hysteresis of the peak detection, in % of state of charge
+        """
+        if chemistry not in ('NMC', 'LMO', 'LFP'):
+            sys.exit('The chemistry must be either NMC, LMO or LFP')
+
+        self.chemistry = chemistry
+        self.alpha_sei = alpha_sei
+        self.beta_sei = beta_sei
+        self.delta = delta
+
+        self.peak_detector = PeakDetector(delta)
+        self.rainflow_counter = RainflowCounter()
+
+        # calendar degradation
+        self.n_samples = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.stress = None  # calendar stress of the last sample
+        self.stress_time = 0.  # integral of the calendar stress over time, in second
+        self.sum_temperature = 0.  # sum of the temperatures of the samples, see cycle_temperature
+
+        # cycling degradation
+        self.n_turning_points = 0
+        self.n_cycles = 0
+        self.closed_cycles_stress = 0.
+        self.residue_stress = [0.]  # residue_stress[i]: stress of the half cycles between the points 0 and i
+
+    def update(self, timestamp, soc, temperature):
+        """
+
+        :param timestamp: time of the sample in second
+        :param soc: state of charge in %
+        :param temperature: temperature in °C
+        """
+        self.update_many([timestamp], [soc], [temperature])
+
+    def update_many(self, timestamps, socs, temperatures):
+        """
+
+        :param timestamps: array of times in second
+        :param socs: array of states of charge in %
+        :param temperatures: array of temperatures in °C, or a scalar
+        """
+        socs = np.asarray(socs, dtype=float)
+        if len(socs) == 0:
+            return
+
+        temperatures = np.broadcast_to(np.asarray(temperatures, dtype=float), socs.shape)
+        timestamps = np.asarray(timestamps, dtype=float)
+
+        # the time model is linear in time: the calendar stress weights the time
+        stress = soc_stress_model(socs / 100) * temp_stress_model(temperatures)
+        if self.first_timestamp is None:
+            self.first_timestamp = timestamps[0].item()
+        else:
+            self.stress_time += (self.stress + stress[0].item()) / 2 * (timestamps[0].item() - self.last_timestamp)
+        self.stress_time += float(np.dot((stress[:-1] + stress[1:]) / 2, np.diff(timestamps)))
+        self.last_timestamp = timestamps[-1].item()
+        self.stress = stress[-1].item()
+
+        # sums of the temperatures before and up to each sample, accumulated in the order of cycle_temperature
+        sum_temperature = np.cumsum(np.concatenate(([self.sum_temperature], temperatures))).tolist()
+        self.sum_temperature = sum_temperature[-1]
+
+        first = self.n_samples
+        self.n_samples += len(socs)
+
+        values = []
+        positions = []
+        update = self.peak_detector.update
+        for k, soc in enumerate(socs.tolist()):
+            peak = update(soc, (first + k, sum_temperature[k], sum_temperature[k + 1]))
+            if peak is not None:
+                values.append(peak[1])
+                positions.append(peak[0])
+
+        self.add_turning_points(values, positions)
+
+    def add_turning_points(self, values, positions):
+        """
+
+        :param values: states of charge of the new turning points in %
+        :param positions: positions of the turning points, see cycles_stress
+        """
+        if len(values) == 0:
+            return
+        self.n_turning_points += len(values)
+
+        # cycles closed by the turning points, and half cycles which they add to the residue,
+        # with the number of points of the residue which each one left unchanged
+        closed = []
+        half_cycles = []
+        n_kept = []
+        n_added = []
+        rainflow_counter = self.rainflow_counter
+        for value, position in zip(values, positions):
+            closed.extend(rainflow_counter.add(value, position, return_positions=True))
+
+            residue = rainflow_counter.residue
+            residue_positions = rainflow_counter.positions
+            kept = max(rainflow_counter.n_unchanged, 1)
+            n_kept.append(kept)
+            n_added.append(len(residue) - kept)
+            for i in range(kept, len(residue)):
+                half_cycles.append((abs(residue[i] - residue[i - 1]), (residue[i] + residue[i - 1]) / 2.,
+                                    rainflow_counter.uc_mult, residue_positions[i - 1], residue_positions[i]))
+
+        for stress in cycles_stress(self.chemistry, closed):
+            self.closed_cycles_stress += stress
+        self.n_cycles += len(closed)
+
+        # the bottom of the residue which wasn't changed keeps its stress
+        half_cycles_stress = cycles_stress(self.chemistry, half_cycles)
+        j = 0
+        for kept, added in zip(n_kept, n_added):
+            del self.residue_stress[kept:]
+            for stress in half_cycles_stress[j:j + added]:
+                self.residue_stress.append(self.residue_stress[-1] + stress)
+            j += added
+
+    def state(self):
+        """
+
+        :return: dictionary of the state of the tracker, made of Python numbers and lists
+        """
+        state = {name: to_builtin(value) for name, value in vars(self).items()
+                 if name not in ('peak_detector', 'rainflow_counter')}
+        state['peak_detector'] = {name: to_builtin(value) for name, value in vars(self.peak_detector).items()}
+        state['rainflow_counter'] = {name: to_builtin(value) for name, value in vars(self.rainflow_counter).items()}
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """
+
+        :param state: dictionary returned by state()
+        :return: DegradationTracker in this state
+        """
+        tracker = cls(state['chemistry'], alpha_sei=state['alpha_sei'], beta_sei=state['beta_sei'],
+                      delta=state['delta'])
+        tracker.__dict__.update({name: value for name, value in state.items()
+                                 if name not in ('peak_detector', 'rainflow_counter')})
+        tracker.peak_detector.__dict__.update(state['peak_detector'])
+        tracker.rainflow_counter.__dict__.update(state['rainflow_counter'])
+        tracker.rainflow_counter.residue = list(tracker.rainflow_counter.residue)
+        tracker.rainflow_counter.positions = list(tracker.rainflow_counter.positions)
+        tracker.residue_stress = list(tracker.residue_stress)
+        return tracker
+
+    def degradation(self):
+        """
+
+        :return: tuple (calendar degradation, cycling degradation), linearised
+        """
+        if self.n_samples == 0:
+            return 0., 0.
+
+        cal_degradation = time_deg_model(self.stress_time)
+        cyc_degradation = self.closed_cycles_stress + self.residue_stress[-1]
+
+        return cal_degradation, cyc_degradation
+
+    def linearised_degradation(self):
+        cal_degradation, cyc_degradation = self.degradation()
+        return cal_degradation + cyc_degradation
+
+    def soh(self):
+        """
+
+        :return: state of health (between 0 and 1) given by the nonlinear general model
+        """
+        return 1 - nonlinear_general_model(self.alpha_sei, self.beta_sei, self.linearised_degradation())
+
+
+if __name__ == '__main__':
+    # check: degradation of a tracker fed by chunks against final_degradation_model, at a varying temperature
+    from degradation_model.degradation_model import final_degradation_model
+
+    rng = np.random.default_rng(0)
+    n = 50000
+    time_v = np.cumsum(rng.uniform(30, 90, n))
+    soc_v = np.clip(50 + np.cumsum(rng.normal(0, 1, n)), 0, 100)
+    T_v = 25 + 10 * np.sin(time_v / 86400.) + rng.normal(0, 1, n)
+
+    for chemistry in ('NMC', 'LMO', 'LFP'):
+        tracker = DegradationTracker(chemistry)
+        bounds = np.unique(np.concatenate(([0], rng.integers(0, n, 100), [n])))
+        for first, stop in zip(bounds[:-1], bounds[1:]):
+            if stop - first == 1:
+                tracker.update(time_v[first], soc_v[first], T_v[first])
+            else:
+                tracker.update_many(time_v[first:stop], soc_v[first:stop], T_v[first:stop])
+
+        expected = final_degradation_model(time_v, soc_v, T_v, None, chemistry, gap_policy='interpolate')
+        errors = [abs(computed - value) / value for computed, value in zip(tracker.degradation(), expected)]
+        print('{}: relative error of the calendar degradation {:.2e}, of the cycling degradation {:.2e}'
+              .format(chemistry, *errors))
+        assert max(errors) < 1e-9
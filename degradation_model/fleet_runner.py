@@ -0,0 +1,115 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module computes the degradation of the state of charge profiles of a fleet of batteries on several cores.
+
+The profiles are concatenated in a shared memory block (see shared_arrays), and the results written by
+the workers in another one: a task only holds the descriptors of the blocks and the offsets of its profiles,
+so that sending the tasks costs neither the pickling of the profiles nor copies of them in the workers.
+Each task runs batch_degradation_model on views of a contiguous range of profiles.
+
+Usage:
+    cal_degradation, cyc_degradation = fleet_degradation(soc_profiles, T=25, times=86400, chemistry='NMC')
+"""
+
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from degradation_model.degradation_model import batch_degradation_model
+from degradation_model.shared_arrays import SharedArrays, attach
+
+
+def fleet_task(task):
+    """ Degradation of a range of profiles, run in a worker process of fleet_degradation
+
+    :param task: tuple (descriptor of the concatenated profiles, descriptor of the (n x 2) result array,
+                 offsets of the profiles of the task, index of its first profile, T, times, chemistry, delta)
+    """
+    soc_block, result_block, offsets, first, T, times, chemistry, delta = task
+    soc = attach(soc_block)
+    result = attach(result_block)
+
+    profiles = [soc[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    cal_degradation, cyc_degradation = batch_degradation_model(profiles, T, times, chemistry, delta=delta)
+
+    result[first:first + len(profiles), 0] = cal_degradation
+    result[first:first + len(profiles), 1] = cyc_degradation
+
+
+def fleet_degradation(soc_profiles, T, times, chemistry, delta=0.1, processes=None, n_tasks=None):
+    """ batch_degradation_model of many profiles, in worker processes sharing the profiles and the results
+
+    :param soc_profiles: list of state of charge vectors in %
+    :param T: temperature in °C
+    :param times: time of each profile in second (array, or scalar for profiles of the same duration)
+    :param chemistry: either NMC, LMO or LFP
+    :param delta: hysteresis of the peak detection in %
+    :param processes: number of worker processes (number of cores if None)
+    :param n_tasks: number of tasks, i.e. of ranges of profiles (4 per process if None)
+    :return: tuple of arrays (calendar degradation, cycling degradation), one value per profile
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if n_tasks is None:
+        n_tasks = 4 * processes
+
+    n_profiles = len(soc_profiles)
+    if n_profiles == 0:
+        return np.zeros(0), np.zeros(0)
+
+    times = np.broadcast_to(np.asarray(times, dtype=float), (n_profiles,))
+    offsets = np.concatenate(([0], np.cumsum([len(soc_v) for soc_v in soc_profiles]))).astype(np.int64)
+
+    # ranges of profiles of about the same number of samples
+    bounds = np.searchsorted(offsets, np.linspace(0, offsets[-1], n_tasks + 1), side='left')
+    bounds = np.unique(np.concatenate(([0], bounds, [n_profiles])))
+
+    with SharedArrays() as shared:
+        # the profiles keep their float type, e.g. float32; lists and integer profiles are stored as floats
+        dtype = np.result_type(np.float32, *[getattr(soc_v, 'dtype', float) for soc_v in soc_profiles])
+        soc_block, soc = shared.empty(offsets[-1], dtype)
+        for i, soc_v in enumerate(soc_profiles):
+            soc[offsets[i]:offsets[i + 1]] = soc_v
+        result_block, result = shared.empty((n_profiles, 2), float)
+        del soc
+
+        tasks = [(soc_block, result_block, offsets[first:stop + 1].tolist(), first, T, times[first:stop], chemistry,
+                  delta) for first, stop in zip(bounds[:-1], bounds[1:])]
+
+        with Pool(processes=min(processes, len(tasks))) as pool:
+            pool.map(fleet_task, tasks)
+
+        cal_degradation = result[:, 0].copy()
+        cyc_degradation = result[:, 1].copy()
+        del result
+
+    return cal_degradation, cyc_degradation
+
+
+if __name__ == '__main__':
+    # check: same results as batch_degradation_model, and time of the tasks sent with the profiles or the blocks
+    import pickle
+    import time
+
+    rng = np.random.default_rng(0)
+    n_days = 365
+    profiles = [np.clip(50 + np.cumsum(rng.normal(0, 1, 86400 // 60)), 0, 100) for _ in range(n_days)]
+
+    start = time.perf_counter()
+    serial = batch_degradation_model(profiles, 25, 86400., 'NMC')
+    print('serial: {:.2f} s'.format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    parallel = fleet_degradation(profiles, 25, 86400., 'NMC')
+    print('shared memory: {:.2f} s'.format(time.perf_counter() - start))
+
+    print('pickled profiles: {} bytes'.format(len(pickle.dumps(profiles))))
+    assert np.array_equal(serial[0], parallel[0]) and np.array_equal(serial[1], parallel[1])
+
+    # float32 profiles are shared in float32
+    profiles = [soc_v.astype(np.float32) for soc_v in profiles]
+    serial = batch_degradation_model(profiles, 25, 86400., 'NMC')
+    parallel = fleet_degradation(profiles, 25, 86400., 'NMC')
+    assert np.array_equal(serial[0], parallel[0]) and np.array_equal(serial[1], parallel[1])
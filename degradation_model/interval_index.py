@@ -0,0 +1,184 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module answers queries of the degradation over arbitrary intervals of a state of charge log,
+e.g. a contract period or a month, without counting the cycles of the interval again.
+
+DegradationIndex is built once per log. The cycles are counted on the turning points of the whole log,
+kept in a segment tree whose nodes hold a rainflow summary of their turning points:
+- the stress of the cycles closed by the four point rule (rainflow_stack with virtual_bottom), i.e. the
+  cycles enclosed by larger ranges on both sides, which are closed whatever the turning points around
+- the residue of these turning points (a list of turning points)
+Two adjacent summaries merge by counting the concatenation of their residues with the same rule, so that
+the summary of an interval is the merge of O(log n) nodes. The cycles of the interval are then the cycles
+of its summary, and the ones of rainflow on its residue (the half cycles of the residue included).
+
+The calendar degradation is given by cumulative sums of the state of charge, in O(1).
+
+The degradation of [t1, t2) is the one of final_degradation_model on the samples of the interval, except that:
+- the turning points are the ones of the whole log in the interval, instead of the ones detected on the
+  samples of the interval (which differ by the points near the bounds of the interval)
+- the time of the calendar degradation is the duration of the interval within the log, so that the
+  durations of adjacent intervals add up
+- the cycles stresses are summed in another order (the results differ by rounding errors)
+
+Usage:
+    index = DegradationIndex(time_v, soc_v, chemistry='NMC')
+    cal_degradation, cyc_degradation = index.degradation(t1, t2, T=25)
+"""
+
+import sys
+
+import numpy as np
+
+import lib.rainflow.rainflow as rf
+from degradation_model.degradation_model import soc_stress_model, temp_stress_model, time_deg_model
+from degradation_model.degradation_tracker import cycle_stress
+from degradation_model.soc_compression import turning_points
+
+EMPTY_SUMMARY = (0., [])
+
+
+class DegradationIndex:
+    def __init__(self, time_v, soc_v, chemistry, delta=0.1):
+        """
+
+        :param time_v: time vector in second, increasing
+        :param soc_v: state of charge vector in %
+        :param chemistry: either NMC, LMO or LFP
+        :param delta: hysteresis of the peak detection, in % of state of charge
+        """
+        if chemistry not in ('NMC', 'LMO', 'LFP'):
+            sys.exit('The chemistry must be either NMC, LMO or LFP')
+
+        self.time_v = np.asarray(time_v, dtype=float)
+        soc_v = np.asarray(soc_v)
+        if len(soc_v) == 0:
+            sys.exit('The state of charge series is empty')
+        if len(self.time_v) != len(soc_v):
+            sys.exit('The time and state of charge vectors must have the same length')
+
+        self.chemistry = chemistry
+        self.delta = delta
+
+        # calendar degradation: cumulative sums of the state of charge
+        self.cumulative_soc = np.concatenate(([0.], np.cumsum(soc_v, dtype=np.float64)))
+
+        # cycling degradation: segment tree of the turning points, the leaf i being the turning point i
+        self.tp_index, tp_value, _ = turning_points(soc_v, delta)
+        self.size = 1
+        while self.size < len(self.tp_index):
+            self.size *= 2
+
+        self.nodes = [EMPTY_SUMMARY] * (2 * self.size)
+        for i, value in enumerate(tp_value.tolist()):
+            self.nodes[self.size + i] = (0., [value])
+        for i in range(self.size - 1, 0, -1):
+            self.nodes[i] = self.merge(self.nodes[2 * i], self.nodes[2 * i + 1])
+
+    def merge(self, left, right):
+        """
+
+        :param left: summary (stress of the closed cycles, residue) of turning points
+        :param right: summary of the turning points which follow them
+        :return: summary of the turning points of both
+        """
+        if len(left[1]) == 0:
+            return right
+        if len(right[1]) == 0:
+            return left
+
+        values = left[1] + right[1]
+        out, residue, _ = rf.rainflow_stack(values, range(len(values)), virtual_bottom=True)
+        stress = left[0] + right[0]
+        if len(out[0]) > 0:
+            stress += np.sum(cycle_stress(self.chemistry, np.array(out[0]) / 100, np.array(out[1]) / 100))
+        return stress, residue
+
+    def summary(self, first, stop):
+        """
+
+        :param first: index of the first turning point
+        :param stop: index after the last turning point
+        :return: summary of the turning points first to stop excluded, merged from O(log n) nodes
+        """
+        left = EMPTY_SUMMARY
+        right = EMPTY_SUMMARY
+        first += self.size
+        stop += self.size
+        while first < stop:
+            if first & 1:
+                left = self.merge(left, self.nodes[first])
+                first += 1
+            if stop & 1:
+                stop -= 1
+                right = self.merge(self.nodes[stop], right)
+            first //= 2
+            stop //= 2
+        return self.merge(left, right)
+
+    def cycles_stress(self, first, stop):
+        """
+
+        :param first: index of the first turning point
+        :param stop: index after the last turning point
+        :return: cycling degradation of these turning points, without the temperature stress
+        """
+        stress, residue = self.summary(first, stop)
+
+        # cycles of the residue, counted from its start
+        if len(residue) > 1:
+            array_out = rf.rainflow(np.array(residue))
+            stress += np.sum(array_out[3] * cycle_stress(self.chemistry, array_out[0] / 100, array_out[1] / 100))
+        return stress
+
+    def degradation(self, t1, t2, T):
+        """
+
+        :param t1: start of the interval, in second
+        :param t2: end of the interval (excluded), in second
+        :param T: temperature in °C
+        :return: tuple (calendar degradation, cycling degradation) of the interval, linearised
+        """
+        # samples of the interval
+        first, stop = np.searchsorted(self.time_v, [t1, t2], side='left')
+        if stop <= first:
+            return 0., 0.
+
+        temp_stress = temp_stress_model(T)
+
+        duration = min(t2, self.time_v[-1]) - max(t1, self.time_v[0])
+        mean_soc = (self.cumulative_soc[stop] - self.cumulative_soc[first]) / (stop - first)
+        cal_degradation = time_deg_model(duration) * soc_stress_model(mean_soc / 100) * temp_stress
+
+        tp_first, tp_stop = np.searchsorted(self.tp_index, [first, stop], side='left')
+        cyc_degradation = self.cycles_stress(tp_first, tp_stop) * temp_stress
+
+        return cal_degradation, cyc_degradation
+
+
+if __name__ == '__main__':
+    # check: queries of random intervals against the counting of their turning points
+    rng = np.random.default_rng(0)
+    n = 20000
+    soc = np.clip(50 + np.cumsum(rng.normal(0, 1, n)), 0, 100)
+    time = np.cumsum(rng.uniform(30, 90, n))
+    index = DegradationIndex(time, soc, 'NMC')
+    print('{} turning points'.format(len(index.tp_index)))
+
+    max_error = 0.
+    for _ in range(500):
+        t1, t2 = np.sort(rng.uniform(time[0] - 1000, time[-1] + 1000, 2))
+        cal, cyc = index.degradation(t1, t2, 25)
+
+        first, stop = np.searchsorted(time, [t1, t2])
+        tp = index.tp_index[(index.tp_index >= first) & (index.tp_index < stop)]
+        expected = 0.
+        if len(tp) > 1:
+            array_out = rf.rainflow(soc[tp])
+            expected = np.sum(array_out[3] * cycle_stress('NMC', array_out[0] / 100, array_out[1] / 100)) \
+                * temp_stress_model(25)
+        max_error = max(max_error, abs(cyc - expected) / max(expected, 1e-300))
+
+    print('max relative error of the cycling degradation: {:.2e}'.format(max_error))
+    assert max_error < 1e-9
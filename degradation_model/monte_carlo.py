@@ -0,0 +1,321 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module simulates the lifetime of a battery under an uncertain future usage (Monte Carlo).
+
+Each path of the simulation is a sequence of daily state of charge profiles drawn by a seeded generator:
+- MarkovDispatch: the regime of each day (idle, one or two cycles) follows a Markov chain, with random
+  depths of discharge and mean states of charge; the profiles of consecutive days join
+- BlockBootstrap: blocks of consecutive days drawn with replacement from a historical log
+The days of a path are generated by blocks of BLOCK_DAYS days and fed to a DegradationTracker, which carries
+the peak detection and the rainflow residue across the blocks: the path is counted as one continuous series,
+so that the cycles spanning several days and the changes between days are counted. The calendar stress is
+integrated over time, as by the tracker. The state of health is given by the nonlinear general model, on a grid
+of points_per_year points per year.
+
+The end of life is the first day at which the degradation reaches the end of life degradation. It isn't
+searched by bisection, since the degradation of a path isn't necessarily monotonic: the half cycles of the
+rainflow residue are replaced when the residue changes, possibly by cycles of a lower stress.
+
+The paths are simulated in chunks, in worker processes; each path has its own seed, spawned from the seed
+of the simulation, so that the results don't depend on the number of processes nor on the size of the chunks.
+A worker holds the profiles of one block of days, the state of its tracker and one degradation value per day
+of the path being simulated, i.e. a memory of BLOCK_DAYS x samples_per_day + number of days values, instead of
+the profiles of the whole path (number of days x samples_per_day values).
+
+Usage, from the root of the project:
+    $ python -m degradation_model.monte_carlo --paths 1000 --years 15 --generator markov
+    $ python -m degradation_model.monte_carlo --generator bootstrap --history profile.csv --block-days 7
+"""
+
+import argparse
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from degradation_model.degradation_model import nonlinear_general_model
+from degradation_model.degradation_tracker import DegradationTracker
+from degradation_model.sensitivity import END_OF_LIFE_DEGRADATION, end_of_life_degradation
+
+SECONDS_PER_DAY = 86400
+DAYS_PER_YEAR = 365
+BLOCK_DAYS = 30  # number of days of the profiles generated at once
+
+
+# -------- Generators of daily profiles ----------------------------------
+
+class MarkovDispatch:
+    def __init__(self, transition=((0.5, 0.4, 0.1), (0.2, 0.6, 0.2), (0.1, 0.4, 0.5)), depth=(20., 80.),
+                 mean_soc=(40., 60.), noise=1., samples_per_day=96):
+        """
+
+        :param transition: transition probabilities between the regimes of consecutive days
+                           (idle, one cycle, two cycles), one row per regime of the previous day
+        :param depth: bounds of the depth of discharge of the cycles of a day, in %
+        :param mean_soc: bounds of the mean state of charge of a day, in %
+        :param noise: standard deviation of the noise of the state of charge, in %
+        :param samples_per_day: number of samples of a day
+        """
+        self.transition = np.asarray(transition, dtype=float)
+        if self.transition.shape != (3, 3) or not np.allclose(np.sum(self.transition, axis=1), 1):
+            sys.exit('The transition matrix must be a 3 x 3 matrix whose rows sum to 1')
+
+        self.depth = depth
+        self.mean_soc = mean_soc
+        self.noise = noise
+        self.samples_per_day = samples_per_day
+
+    def days(self, rng, n_days, block_days=None):
+        """ The state of charge rests at the top of the cycles of a day (at its mean if the day is idle), and moves
+        linearly over the day from the rest level of the previous day to the one of the day, so that the profile
+        is continuous at the day boundaries.
+
+        :param rng: numpy Generator
+        :param n_days: number of days
+        :param block_days: number of days of the blocks (all the days in one block if None)
+        :return: iterator over (block_days x samples_per_day) arrays of states of charge in %, the last one being
+                 shorter if block_days doesn't divide n_days
+        """
+        cumulative = np.cumsum(self.transition, axis=1)
+        fraction = np.arange(self.samples_per_day) / self.samples_per_day
+
+        # regime and rest level of the day before the block
+        regime = 0
+        previous = None
+        for first in range(0, n_days, block_days or max(n_days, 1)):
+            n = min(block_days or n_days, n_days - first)
+
+            # regime of each day: number of cycles
+            draws = rng.random(n)
+            n_cycles = np.empty(n, dtype=np.int64)
+            for d in range(n):
+                regime = min(int(np.searchsorted(cumulative[regime], draws[d], side='right')), 2)
+                n_cycles[d] = regime
+
+            depth = rng.uniform(self.depth[0], self.depth[1], n)
+            mean_soc = rng.uniform(self.mean_soc[0], self.mean_soc[1], n)
+
+            # rest level of each day, and of the day before
+            level = mean_soc + np.where(n_cycles > 0, depth / 2, 0.)
+            previous_level = np.concatenate((level[:1] if previous is None else [previous], level[:-1]))
+            previous = level[-1]
+
+            base = previous_level[:, np.newaxis] + (level - previous_level)[:, np.newaxis] * fraction
+            soc = base - depth[:, np.newaxis] / 2 * (1 - np.cos(n_cycles[:, np.newaxis] * 2 * np.pi * fraction)) \
+                + self.noise * rng.standard_normal((n, self.samples_per_day))
+            yield np.clip(soc, 0., 100.)
+
+
+class BlockBootstrap:
+    def __init__(self, historical_days, block_days=7):
+        """
+
+        :param historical_days: (number of days x samples per day) array of states of charge in %,
+                                see daily_profiles
+        :param block_days: number of consecutive days of a block
+        """
+        self.historical_days = np.asarray(historical_days, dtype=float)
+        if self.historical_days.ndim != 2 or len(self.historical_days) == 0:
+            sys.exit('The historical profiles must be a non empty (days x samples) array')
+
+        self.block_days = min(block_days, len(self.historical_days))
+        self.samples_per_day = self.historical_days.shape[1]
+
+    def days(self, rng, n_days, block_days=None):
+        """
+
+        :param rng: numpy Generator
+        :param n_days: number of days
+        :param block_days: number of days of the blocks (all the days in one block if None)
+        :return: iterator over (block_days x samples_per_day) arrays of states of charge in %, the last one being
+                 shorter if block_days doesn't divide n_days
+        """
+        # the days left of the last bootstrap block drawn
+        index = np.empty(0, dtype=np.int64)
+        for first in range(0, n_days, block_days or max(n_days, 1)):
+            n = min(block_days or n_days, n_days - first)
+
+            n_blocks = -(-(n - len(index)) // self.block_days)
+            starts = rng.integers(0, len(self.historical_days) - self.block_days + 1, n_blocks)
+            index = np.concatenate((index, (starts[:, np.newaxis] + np.arange(self.block_days)).ravel()))
+            yield self.historical_days[index[:n]]
+            index = index[n:]
+
+
+def daily_profiles(time_v, soc_v, samples_per_day=96):
+    """
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param samples_per_day: number of samples of a day
+    :return: (number of complete days x samples_per_day) array of the log resampled on a regular grid
+    """
+    time_v = np.asarray(time_v, dtype=float)
+    n_days = int((time_v[-1] - time_v[0]) // SECONDS_PER_DAY)
+    if n_days == 0:
+        sys.exit('The historical log must cover at least one day')
+
+    grid = time_v[0] + np.arange(n_days * samples_per_day) * (SECONDS_PER_DAY / samples_per_day)
+    return np.interp(grid, time_v, np.asarray(soc_v, dtype=float)).reshape(n_days, samples_per_day)
+
+
+# -------- Simulation -----------------------------------------------------
+
+class MonteCarloResult:
+    def __init__(self, time, soh, lifetime):
+        """
+
+        :param time: times of the state of health curves, in year
+        :param soh: (number of paths x number of times) array of state of health (between 0 and 1)
+        :param lifetime: time until the end of life of each path, in year
+        """
+        self.time = time
+        self.soh = soh
+        self.lifetime = lifetime
+
+    def soh_percentiles(self, percentiles=(5, 50, 95)):
+        """
+
+        :return: (number of percentiles x number of times) array of state of health
+        """
+        return np.percentile(self.soh, percentiles, axis=0)
+
+    def lifetime_percentiles(self, percentiles=(5, 50, 95)):
+        return np.percentile(self.lifetime, percentiles)
+
+
+def simulate_path(seed, generator, n_days, T, chemistry, delta, alpha_sei, beta_sei, grid_days, deg_eol):
+    """
+
+    :param seed: numpy SeedSequence of the path
+    :param grid_days: days at the end of which the state of health is evaluated
+    :param deg_eol: linearised degradation at the end of life
+    :return: tuple (state of health at the end of the days of grid_days, lifetime in year)
+    """
+    tracker = DegradationTracker(chemistry, alpha_sei=alpha_sei, beta_sei=beta_sei, delta=delta)
+
+    # cumulative degradation at the end of each day, the path being counted as one series
+    deg = np.empty(n_days)
+    d = 0
+    for block in generator.days(np.random.default_rng(seed), n_days, block_days=BLOCK_DAYS):
+        samples_per_day = block.shape[1]
+        sample_time = SECONDS_PER_DAY / samples_per_day
+        for soc_v in block:
+            tracker.update_many(sample_time * (samples_per_day * d + np.arange(samples_per_day)), soc_v, T)
+            deg[d] = tracker.linearised_degradation()
+            d += 1
+
+    soh = 1 - nonlinear_general_model(alpha_sei, beta_sei, deg[grid_days - 1])
+
+    # end of life: linear interpolation within the first day which reaches it,
+    # or extrapolation at the mean rate of the path
+    reached = np.flatnonzero(deg >= deg_eol)
+    d = int(reached[0]) if len(reached) > 0 else n_days
+    if d < n_days:
+        previous = deg[d - 1] if d > 0 else 0.
+        lifetime_days = d + (deg_eol - previous) / (deg[d] - previous)
+    else:
+        lifetime_days = n_days * deg_eol / deg[-1]
+
+    return soh, lifetime_days / DAYS_PER_YEAR
+
+
+def simulate_chunk(task):
+    """ Simulation of a chunk of paths, run in a worker process of monte_carlo_lifetime
+
+    :param task: tuple (seeds of the paths, arguments of simulate_path after the seed)
+    :return: list of the outputs of simulate_path
+    """
+    seeds, args = task
+    return [simulate_path(seed, *args) for seed in seeds]
+
+
+def monte_carlo_lifetime(generator, n_paths=1000, years=15, T=25, chemistry='NMC', delta=0.1,
+                         alpha_sei=5.87e-02, beta_sei=1.06e+02, points_per_year=12, end_of_life=END_OF_LIFE_DEGRADATION,
+                         seed=0, processes=None, chunk_size=16):
+    """
+
+    :param generator: generator of daily profiles (MarkovDispatch, BlockBootstrap)
+    :param n_paths: number of paths
+    :param years: duration of a path in year
+    :param T: temperature in °C
+    :param chemistry: either NMC, LMO or LFP
+    :param delta: hysteresis of the peak detection in %
+    :param alpha_sei: parameter of the nonlinear general model
+    :param beta_sei: parameter of the nonlinear general model
+    :param points_per_year: number of points per year of the state of health curves
+    :param end_of_life: degradation at the end of life (between 0 and 1)
+    :param seed: seed of the simulation
+    :param processes: number of worker processes; None uses all the cores, 1 runs the paths in the current process
+    :param chunk_size: number of paths of a task
+    :return: MonteCarloResult
+    """
+    n_days = int(round(years * DAYS_PER_YEAR))
+    n_points = max(int(round(years * points_per_year)), 1)
+    grid_days = np.maximum(np.round(np.arange(1, n_points + 1) * n_days / n_points).astype(np.int64), 1)
+    deg_eol = float(end_of_life_degradation(alpha_sei, beta_sei, end_of_life))
+
+    seeds = np.random.SeedSequence(seed).spawn(n_paths)
+    args = (generator, n_days, T, chemistry, delta, alpha_sei, beta_sei, grid_days, deg_eol)
+    tasks = [(seeds[first:first + chunk_size], args) for first in range(0, n_paths, chunk_size)]
+
+    # the results are stored as the chunks are completed
+    soh = np.empty((n_paths, n_points))
+    lifetime = np.empty(n_paths)
+
+    def store(chunks):
+        i = 0
+        for chunk in chunks:
+            for path_soh, path_lifetime in chunk:
+                soh[i] = path_soh
+                lifetime[i] = path_lifetime
+                i += 1
+
+    if processes == 1:
+        store(simulate_chunk(task) for task in tasks)
+    else:
+        with Pool(processes) as pool:
+            store(pool.imap(simulate_chunk, tasks))
+
+    return MonteCarloResult(grid_days / DAYS_PER_YEAR, soh, lifetime)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo simulation of the lifetime of a battery over '
+                                                 'stochastic dispatch profiles')
+    parser.add_argument('--paths', type=int, default=1000, help='number of simulated paths')
+    parser.add_argument('--years', type=float, default=15, help='duration of a path in year')
+    parser.add_argument('--generator', default='markov', choices=['markov', 'bootstrap'])
+    parser.add_argument('--history', help='.csv file of time and state of charge, resampled by --generator bootstrap')
+    parser.add_argument('--block-days', type=int, default=7, help='number of days of the bootstrap blocks')
+    parser.add_argument('--samples-per-day', type=int, default=96)
+    parser.add_argument('--temperature', type=float, default=25)
+    parser.add_argument('--chemistry', default='NMC', choices=['NMC', 'LMO', 'LFP'])
+    parser.add_argument('--delta', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, help='number of worker processes (all the cores by default)')
+    args = parser.parse_args()
+
+    if args.generator == 'bootstrap':
+        if args.history is None:
+            parser.error('--generator bootstrap needs a --history file')
+        from degradation_model.data_io import read_soc_csv, time_in_seconds
+        t, soc = read_soc_csv(args.history)
+        day_generator = BlockBootstrap(daily_profiles(time_in_seconds(t), soc, args.samples_per_day),
+                                       block_days=args.block_days)
+    else:
+        day_generator = MarkovDispatch(samples_per_day=args.samples_per_day)
+
+    result = monte_carlo_lifetime(day_generator, n_paths=args.paths, years=args.years, T=args.temperature,
+                                  chemistry=args.chemistry, delta=args.delta, seed=args.seed,
+                                  processes=args.processes)
+
+    print('{} paths of {:g} years ({} generator)'.format(args.paths, args.years, args.generator))
+    print('years to 80 % state of health: 5 % {:.2f}, median {:.2f}, 95 % {:.2f}'
+          .format(*result.lifetime_percentiles()))
+    print('state of health [%]:  year      5 %   median     95 %')
+    bands = 100 * result.soh_percentiles()
+    for k in range(0, len(result.time)):
+        if np.isclose(result.time[k], np.round(result.time[k])):
+            print('                     {:4.0f}   {:6.2f}   {:6.2f}   {:6.2f}'.format(result.time[k], *bands[:, k]))
@@ -0,0 +1,272 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module estimates the degradation of the cells of a battery pack from the pack state of charge and
+temperature traces, the weakest cell setting the end of life of the pack.
+
+The cells are described by arrays (one value per cell):
+- soc_offsets: state of charge offset of the cell, in %
+- capacities: capacity of the cell relative to the nominal capacity: for the same current, a cell of capacity
+  c swings 1/c times the swing of the pack, around the state of charge balance_soc at which the cells are balanced
+- temperature_offsets: thermal gradient, i.e. offset of the cell temperature over the pack temperature, in °C
+  (or a (cells x samples) array of offsets varying over time)
+so that the state of charge of the cell i is balance_soc + (soc_v - balance_soc) / c_i + soc_offsets_i.
+
+The state of charge of a cell is an increasing affine function of the pack state of charge: the cells have the
+turning points of the pack trace detected with a hysteresis of delta * c_i, and their cycles are the ones of
+the pack, scaled and shifted. So the peak detection runs once on the samples, with the smallest hysteresis of
+the cells, then again only on these turning points for the other hystereses; the rainflow counting runs once
+per distinct capacity; and the stress models are evaluated for all the cells at once, by broadcasting.
+
+The degradation so far isn't rescaled by later temperatures: the stress of each cycle is the one of the mean
+temperature of the cell over the samples of the cycle, and the temperature stress of the calendar degradation
+is integrated over time (trapezoidal rule). With a constant temperature, the degradation of a cell at the end
+of the trace is the one of final_degradation_model on its state of charge trace (up to rounding errors).
+
+Usage:
+    result = pack_degradation(time_v, soc_v, T_v, 'NMC', soc_offsets=offsets, capacities=capacities,
+                              temperature_offsets=gradients)
+    result.soh()            # (cells x points) state of health of each cell
+    result.limiting_cell()  # cell of least remaining capacity at each point
+"""
+
+import sys
+
+import numpy as np
+
+import lib.rainflow.rainflow as rf
+from degradation_model.degradation_model import soc_stress_model, temp_stress_model, time_deg_model, \
+                                                nonlinear_general_model, cycle_temperature
+from degradation_model.degradation_tracker import cycle_stress
+from degradation_model.soc_compression import turning_points
+
+CHUNK_SIZE = 1e7  # number of elements of the (cell x cycle) matrices
+
+
+class PackResult:
+    def __init__(self, time, capacities, cal_degradation, cyc_degradation, alpha_sei=5.87e-02, beta_sei=1.06e+02):
+        """
+
+        :param time: times of the points, in second
+        :param capacities: initial capacity of each cell, relative to the nominal capacity
+        :param cal_degradation: (cells x points) calendar degradation (linearised)
+        :param cyc_degradation: (cells x points) cycling degradation (linearised)
+        :param alpha_sei: parameter of the nonlinear general model
+        :param beta_sei: parameter of the nonlinear general model
+        """
+        self.time = time
+        self.capacities = capacities
+        self.cal_degradation = cal_degradation
+        self.cyc_degradation = cyc_degradation
+        self.alpha_sei = alpha_sei
+        self.beta_sei = beta_sei
+
+    def linearised_degradation(self):
+        return self.cal_degradation + self.cyc_degradation
+
+    def soh(self):
+        """
+
+        :return: (cells x points) state of health of each cell (between 0 and 1), relative to its initial capacity
+        """
+        return 1 - nonlinear_general_model(self.alpha_sei, self.beta_sei, self.linearised_degradation())
+
+    def remaining_capacity(self):
+        """
+
+        :return: (cells x points) remaining capacity of each cell, relative to the nominal capacity
+        """
+        return self.capacities[:, np.newaxis] * self.soh()
+
+    def limiting_cell(self):
+        """
+
+        :return: index of the cell of least remaining capacity, at each point
+        """
+        return np.argmin(self.remaining_capacity(), axis=0)
+
+    def pack_capacity(self):
+        """
+
+        :return: remaining capacity of the pack (its weakest cell) relative to the nominal capacity, at each point
+        """
+        return np.min(self.remaining_capacity(), axis=0)
+
+
+def shared_turning_points(soc_v, deltas):
+    """ Turning points of a trace for several hystereses, detected once on the samples
+
+    :param soc_v: state of charge vector
+    :param deltas: array of hystereses
+    :return: dictionary hysteresis -> tuple (indices, values) of the turning points
+    """
+    deltas = np.unique(deltas)
+    tp_index, tp_value, _ = turning_points(soc_v, deltas[0])
+    tps = {deltas[0]: (tp_index, tp_value)}
+    if len(deltas) == 1:
+        return tps
+
+    # the turning points of a larger hysteresis are the ones of the turning points of the smallest one,
+    # followed by the extremes of the samples after the last one, which aren't confirmed turning points yet
+    last = tp_index[-1] + 1 if len(tp_index) > 0 else 0
+    tail = soc_v[last:]
+    tail_index = np.unique([last + np.argmin(tail), last + np.argmax(tail), len(soc_v) - 1])
+    index = np.concatenate((tp_index, tail_index))
+    value = np.concatenate((tp_value, soc_v[tail_index]))
+
+    for delta in deltas[1:]:
+        d_index, d_value, _ = turning_points(value, delta, x=index)
+        tps[delta] = (d_index, d_value)
+    return tps
+
+
+def pack_degradation(time_v, soc_v, T_v, chemistry, soc_offsets=0., capacities=1., temperature_offsets=0.,
+                     balance_soc=50., delta=0.1, alpha_sei=5.87e-02, beta_sei=1.06e+02, n_points=100):
+    """
+
+    :param time_v: time vector in second
+    :param soc_v: pack state of charge vector in %
+    :param T_v: pack temperature vector in °C, or a scalar
+    :param chemistry: either NMC, LMO or LFP
+    :param soc_offsets: state of charge offset of each cell, in %
+    :param capacities: capacity of each cell relative to the nominal capacity
+    :param temperature_offsets: temperature offset of each cell in °C, or (cells x samples) array of offsets
+    :param balance_soc: pack state of charge at which the cells are balanced, in %
+    :param delta: hysteresis of the peak detection of the cells, in % of state of charge
+    :param alpha_sei: parameter of the nonlinear general model
+    :param beta_sei: parameter of the nonlinear general model
+    :param n_points: number of points of the degradation curves, evenly spaced over the samples
+    :return: PackResult
+    """
+    if chemistry not in ('NMC', 'LMO', 'LFP'):
+        sys.exit('The chemistry must be either NMC, LMO or LFP')
+
+    time_v = np.asarray(time_v, dtype=float)
+    soc_v = np.asarray(soc_v, dtype=float)
+    n = len(soc_v)
+    if n == 0:
+        sys.exit('The state of charge series is empty')
+    if len(time_v) != n:
+        sys.exit('The time and state of charge vectors must have the same length')
+    T_v = np.broadcast_to(np.asarray(T_v, dtype=float), (n,))
+
+    temperature_offsets = np.asarray(temperature_offsets, dtype=float)
+    cell_offsets = temperature_offsets if temperature_offsets.ndim < 2 else temperature_offsets[:, 0]
+    soc_offsets, capacities, cell_offsets = np.broadcast_arrays(np.atleast_1d(np.asarray(soc_offsets, dtype=float)),
+                                                                np.atleast_1d(np.asarray(capacities, dtype=float)),
+                                                                np.atleast_1d(cell_offsets))
+    n_cells = len(capacities)
+    if np.any(capacities <= 0):
+        sys.exit('The capacities of the cells must be positive')
+
+    # state of charge of the cells: offset + scale * soc_v
+    scale = 1 / capacities
+    offset = balance_soc * (1 - scale) + soc_offsets
+
+    # points of the curves
+    index = np.unique(np.round(np.linspace(0, n - 1, n_points)).astype(np.int64))
+    n_samples = index + 1
+
+    # ---- calendar degradation ----
+    # integral of the temperature stress of each cell over time, by chunks of cells
+    dt = np.diff(time_v)
+    stress_time = np.empty((n_cells, len(index)))
+    chunk = max(int(CHUNK_SIZE // n), 1)
+    for first in range(0, n_cells, chunk):
+        c = slice(first, first + chunk)
+        if temperature_offsets.ndim == 2:
+            stress = temp_stress_model(T_v + temperature_offsets[c])
+        else:
+            stress = temp_stress_model(T_v + cell_offsets[c, np.newaxis])
+        integral = np.cumsum((stress[:, :-1] + stress[:, 1:]) / 2 * dt, axis=1)
+        stress_time[c] = np.concatenate((np.zeros((len(stress), 1)), integral), axis=1)[:, index]
+
+    mean_soc = np.cumsum(soc_v)[index] / n_samples
+    cell_mean_soc = offset[:, np.newaxis] + scale[:, np.newaxis] * mean_soc
+    cal_degradation = time_deg_model(stress_time) * soc_stress_model(cell_mean_soc / 100)
+
+    # ---- cycling degradation ----
+    # hysteresis of the cells on the pack trace
+    pack_delta = delta * capacities
+    tps = shared_turning_points(soc_v, pack_delta)
+
+    if temperature_offsets.ndim == 2:
+        cumulative_offsets = np.concatenate((np.zeros((n_cells, 1)), np.cumsum(temperature_offsets, axis=1)),
+                                            axis=1)
+
+    cyc_stress = np.zeros((n_cells, len(index)))
+    for d, (tp_index, tp_value) in tps.items():
+        if len(tp_value) < 2:
+            continue
+        array_out, start, end = rf.rainflow(tp_value, return_indices=True, index_ext=tp_index)
+        lrange, mean, count = array_out[0], array_out[1], array_out[3]
+
+        # mean pack temperature over the samples of each cycle
+        cycle_T = cycle_temperature(T_v, start, end)
+
+        # point of the curves at which each cycle is counted
+        point = np.searchsorted(index, end, side='left')
+
+        cells = np.flatnonzero(pack_delta == d)
+        chunk = max(int(CHUNK_SIZE // max(len(lrange), 1)), 1)
+        for first in range(0, len(cells), chunk):
+            c = cells[first:first + chunk]
+            if temperature_offsets.ndim == 2:
+                cell_T = cycle_T + (cumulative_offsets[c][:, end + 1] - cumulative_offsets[c][:, start]) \
+                    / (end - start + 1)
+            else:
+                cell_T = cycle_T + cell_offsets[c, np.newaxis]
+            stress = count * cycle_stress(chemistry, scale[c, np.newaxis] * lrange / 100,
+                                          (offset[c, np.newaxis] + scale[c, np.newaxis] * mean) / 100) \
+                * temp_stress_model(cell_T)
+            rows = np.arange(len(c))[:, np.newaxis] * len(index) + point
+            cyc_stress[c] = np.bincount(rows.ravel(), weights=stress.ravel(),
+                                        minlength=len(c) * len(index)).reshape(len(c), len(index))
+
+    cyc_degradation = np.cumsum(cyc_stress, axis=1)
+
+    return PackResult(time_v[index], capacities, cal_degradation, cyc_degradation,
+                      alpha_sei=alpha_sei, beta_sei=beta_sei)
+
+
+if __name__ == '__main__':
+    # check: degradation of each cell at the end of the trace against final_degradation_model on its trace
+    from degradation_model.degradation_model import final_degradation_model
+
+    rng = np.random.default_rng(0)
+    n = 20000
+    time = 60. * np.arange(n)
+    soc = np.clip(50 + np.cumsum(rng.normal(0, 1, n)), 10, 90)
+    n_cells = 96
+    offsets = rng.normal(0, 1, n_cells)
+    capacities = np.round(rng.normal(1, 0.02, n_cells), 2)
+    gradients = rng.normal(0, 2, n_cells)
+
+    result = pack_degradation(time, soc, 25., 'NMC', soc_offsets=offsets, capacities=capacities,
+                              temperature_offsets=gradients)
+    print('{} cells, {} distinct capacities'.format(n_cells, len(np.unique(capacities))))
+    print('limiting cell at the end: {}, pack capacity {:.4f}'.format(result.limiting_cell()[-1],
+                                                                      result.pack_capacity()[-1]))
+
+    max_error = 0.
+    for i in range(n_cells):
+        cell_soc = 50. + (soc - 50.) / capacities[i] + offsets[i]
+        expected = final_degradation_model(time, cell_soc, 25. + gradients[i], time[-1] - time[0], 'NMC')
+        for computed, value in zip((result.cal_degradation[i, -1], result.cyc_degradation[i, -1]), expected):
+            max_error = max(max_error, abs(computed - value) / value)
+
+    print('max relative error against final_degradation_model: {:.2e}'.format(max_error))
+    assert max_error < 1e-9
+
+    # varying temperature: cycling degradation against final_degradation_model with a temperature vector
+    T_v = 25 + 10 * np.sin(time / 86400.)
+    result = pack_degradation(time, soc, T_v, 'NMC', soc_offsets=offsets, capacities=capacities,
+                              temperature_offsets=gradients)
+    max_error = 0.
+    for i in range(n_cells):
+        cell_soc = 50. + (soc - 50.) / capacities[i] + offsets[i]
+        _, expected = final_degradation_model(time, cell_soc, T_v + gradients[i], None, 'NMC', gap_policy='hold')
+        max_error = max(max_error, abs(result.cyc_degradation[i, -1] - expected) / expected)
+
+    print('varying temperature, max relative error of the cycling degradation: {:.2e}'.format(max_error))
+    assert max_error < 1e-9
@@ -0,0 +1,276 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module runs batches of independent least square fits across a process pool.
+
+It is used to estimate the uncertainty of the fitted model parameters by bootstrap:
+each replicate is a copy of the experimental data set which is either
+- resampled by pairs: the data points are drawn with replacement
+- resampled by residuals: the residuals of the point estimate are drawn with replacement
+  and added back to the fitted model
+and is fitted again, starting from the point estimate (warm start).
+
+The parameter samples are returned as numpy arrays, one value per replicate, so that they
+can be broadcast through the degradation models, e.g. nonlinear_general_model.
+
+It also solves a same fit from many starting points (multi-start), for models whose
+convergence depends on the initial values, and reports on the convergence of the starts.
+
+Finally, it provides the helpers used by the fit classes to refit only the data sets which
+changed when observations are appended to the data files (refit_changed), and the fit of the
+calendar model under one condition shared by the calendar fit classes (fit_calendar_curve).
+"""
+
+import numpy as np
+import sys
+from multiprocessing import Pool
+from lmfit import minimize
+from degradation_model.degradation_model import nonlinear_general_model, residuals_nonlinear_cal_model
+
+
+def valid_observations(x, y):
+    """
+
+    :param x: explanatory variable of the data set
+    :param y: observed variable of the data set
+    :return: tuple (x, y) of float arrays without the observations where x or y is missing
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    valid = ~(np.isnan(x) | np.isnan(y))
+    return x[valid], y[valid]
+
+
+def same_observations(x_old, y_old, x_new, y_new):
+    """ Tells whether a data set is unchanged, in which case its fit doesn't need to be run again
+
+    :return: True if both data sets have the same valid observations
+    """
+    x_old, y_old = valid_observations(x_old, y_old)
+    x_new, y_new = valid_observations(x_new, y_new)
+    return np.array_equal(x_old, x_new) and np.array_equal(y_old, y_new)
+
+
+def refit_changed(fit, x_old, y_old, conditions_old, params_old, x, y, conditions, initial_params):
+    """ Refits the data sets (one per condition, e.g. temperature) whose observations changed, starting from their
+    previous optimum; the data sets of new conditions are fitted from initial_params
+
+    :param fit: function fit(x, y_i, params) returning the optimised parameters of a data set
+    :param x_old: previous explanatory variable, shared by the data sets
+    :param y_old: list of the previous observed variables, one per condition
+    :param conditions_old: list of the previous conditions
+    :param params_old: list of the previous optimised parameters, one per condition
+    :param x: updated explanatory variable
+    :param y: list of the updated observed variables
+    :param conditions: list of the updated conditions
+    :param initial_params: initial values of the parameters of the new conditions
+    :return: tuple (list of the optimised parameters, one per updated condition, list of the refitted conditions)
+    """
+    opt_param_sets = []
+    refitted = []
+    for i in range(0, len(conditions)):
+        if conditions[i] in conditions_old:
+            j = conditions_old.index(conditions[i])
+            if same_observations(x_old, y_old[j], x, y[i]):
+                opt_params_i = params_old[j]
+            else:
+                opt_params_i = fit(x, y[i], params_old[j])
+                refitted.append(conditions[i])
+        else:
+            opt_params_i = fit(x, y[i], initial_params)
+            refitted.append(conditions[i])
+
+        opt_param_sets.append(opt_params_i)
+
+    return opt_param_sets, refitted
+
+
+def fit_calendar_curve(t_data, SoH_data_i, params):
+    """ Fit of the nonlinear calendar model to the remaining capacity under one condition
+
+    :param t_data: time in year
+    :param SoH_data_i: remaining capacity over time under one condition (temperature or state of charge)
+    :param params: initial values of the parameters
+    :return: optimised parameters
+    """
+    out = minimize(fcn=residuals_nonlinear_cal_model,
+                   params=params,
+                   args=(t_data, SoH_data_i, 1),
+                   nan_policy='omit',
+                   method='least_squares')
+    return out.params
+
+
+def fit_task(task):
+    """ Runs one least square minimisation. Defined at module level so that it can be sent to worker processes.
+
+    :param task: tuple (residuals, params, args, method, nan_policy)
+    :return: array of the optimised values of all parameters, in the order of params
+    """
+    residuals, params, args, method, nan_policy = task
+    out = minimize(fcn=residuals, params=params, args=args, method=method, nan_policy=nan_policy)
+    return np.array([out.params[name].value for name in out.params])
+
+
+def fit_task_report(task):
+    """ Runs one least square minimisation and reports on its convergence.
+    A start at which the residuals can't be evaluated is reported as not converged.
+
+    :param task: tuple (residuals, params, args, method, nan_policy)
+    :return: tuple (array of the optimised values, chi-square, success flag, number of function evaluations)
+    """
+    residuals, params, args, method, nan_policy = task
+    with np.errstate(all='ignore'):
+        try:
+            out = minimize(fcn=residuals, params=params, args=args, method=method, nan_policy=nan_policy)
+        except ValueError:  # raised by lmfit when the residuals contain NaN
+            return np.full(len(params), np.nan), np.inf, False, 0
+
+    values = np.array([out.params[name].value for name in out.params])
+    return values, out.chisqr, out.success, out.nfev
+
+
+def map_fit_tasks(worker, tasks, processes=None):
+    """
+
+    :param worker: function applied to each task (fit_task or fit_task_report)
+    :param tasks: list of fit tasks
+    :param processes: number of worker processes; None uses all the cores, 1 runs the fits in the current process
+    :return: list of the outputs of worker, in the order of tasks
+    """
+    if processes == 1:
+        return [worker(task) for task in tasks]
+
+    with Pool(processes) as pool:
+        return pool.map(worker, tasks, chunksize=max(1, len(tasks) // (4 * (processes or 8))))
+
+
+def run_fit_tasks(tasks, processes=None):
+    """
+
+    :param tasks: list of fit tasks, see fit_task
+    :param processes: number of worker processes; None uses all the cores, 1 runs the fits in the current process
+    :return: (number of tasks x number of parameters) array of optimised values
+    """
+    return np.array(map_fit_tasks(fit_task, tasks, processes=processes))
+
+
+def bootstrap_tasks(residuals, params, x, y, n_replicates=200, resampling='residuals', seed=None,
+                    method='least_squares', nan_policy='raise'):
+    """ Builds the fit tasks of a bootstrap around a point estimate.
+
+    :param residuals: residuals function with signature residuals(params, x, y, eps_data)
+    :param params: lmfit Parameters at the point estimate, used as initial values of every replicate
+    :param x: explanatory variable of the data set
+    :param y: observed variable of the data set
+    :param n_replicates: number of bootstrap replicates
+    :param resampling: either 'residuals' or 'pairs'
+    :param seed: seed or numpy Generator of the resampling
+    :param method: minimisation method passed to lmfit
+    :param nan_policy: nan policy passed to lmfit
+    :return: list of fit tasks
+    """
+    rng = np.random.default_rng(seed)
+
+    # missing observations are not resampled
+    x, y = valid_observations(x, y)
+
+    if resampling == 'residuals':
+        res = residuals(params, x, y, 1)
+        # the residuals functions of degradation_model are either (y - model) or (model - y),
+        # their sign with respect to y is used to put the resampled residuals back onto the data
+        sign = residuals(params, x, y + 1, 1) - res
+    elif resampling != 'pairs':
+        sys.exit("resampling must be either 'residuals' or 'pairs'")
+
+    tasks = []
+    for k in range(0, n_replicates):
+        if resampling == 'pairs':
+            index = rng.integers(0, len(x), len(x))
+            args = (x[index], y[index], 1)
+        else:
+            res_k = rng.choice(res, size=len(res), replace=True)
+            args = (x, y + (res_k - res) / sign, 1)
+
+        tasks.append((residuals, params, args, method, nan_policy))
+
+    return tasks
+
+
+def bootstrap_fit(residuals, params, x, y, n_replicates=200, resampling='residuals', seed=None,
+                  method='least_squares', nan_policy='raise', processes=None):
+    """ Bootstrap of a single least square fit.
+
+    :return: dictionary giving, for each parameter, the array of its values over the replicates
+    """
+    tasks = bootstrap_tasks(residuals, params, x, y, n_replicates=n_replicates, resampling=resampling,
+                            seed=seed, method=method, nan_policy=nan_policy)
+    samples = run_fit_tasks(tasks, processes=processes)
+
+    return {name: samples[:, i] for i, name in enumerate(params)}
+
+
+def soh_percentile_bands(alpha_sei, beta_sei, deg, percentiles=(5, 50, 95)):
+    """ Percentiles of the state of health over parameter samples
+
+    :param alpha_sei: array of samples of alpha_sei (or a scalar)
+    :param beta_sei: array of samples of beta_sei (or a scalar)
+    :param deg: array of linearised degradation at which the state of health is evaluated
+    :param percentiles: percentiles to compute
+    :return: (number of percentiles x len(deg)) array of state of health, between 0 and 1
+    """
+    alpha_sei = np.atleast_1d(alpha_sei)[:, np.newaxis]
+    beta_sei = np.atleast_1d(beta_sei)[:, np.newaxis]
+    deg = np.atleast_1d(deg)[np.newaxis, :]
+
+    soh = 1 - nonlinear_general_model(alpha_sei, beta_sei, deg)
+    return np.percentile(soh, percentiles, axis=0)
+
+
+def multi_start_fit(residuals, starting_params, args, method='leastsq', processes=None, rtol=1e-3):
+    """ Solves a least square fit from several starting points in parallel and keeps the best solution.
+
+    :param residuals: residuals function
+    :param starting_params: list of lmfit Parameters, one per starting point
+    :param args: arguments passed to the residuals function
+    :param method: minimisation method passed to lmfit
+    :param processes: number of worker processes; None uses all the cores
+    :param rtol: relative tolerance on the chi-square for a start to be considered as reaching the best solution
+    :return: tuple (lmfit Parameters of the best solution, convergence report)
+             the convergence report is a dictionary with:
+             - n_starts, n_converged (number of starts whose minimisation succeeded with a finite chi-square)
+             - n_at_best (number of converged starts reaching the best chi-square within rtol)
+             - best_chisqr, best_start (index of the best start)
+             - initial_values, values ((n_starts x number of parameters) arrays), chisqr, success and nfev arrays
+    """
+    tasks = [(residuals, params, args, method, 'raise') for params in starting_params]
+    results = map_fit_tasks(fit_task_report, tasks, processes=processes)
+
+    values = np.array([result[0] for result in results])
+    chisqr = np.array([result[1] for result in results], dtype=float)
+    success = np.array([result[2] for result in results], dtype=bool) & np.isfinite(chisqr)
+    nfev = np.array([result[3] for result in results])
+
+    if not np.any(success):
+        sys.exit("None of the " + str(len(tasks)) + " starting points converged")
+
+    best_start = int(np.argmin(np.where(success, chisqr, np.inf)))
+    best_chisqr = chisqr[best_start]
+
+    best_params = starting_params[best_start].copy()
+    for i, name in enumerate(best_params):
+        best_params[name].value = values[best_start, i]
+
+    report = {'n_starts': len(tasks),
+              'n_converged': int(np.sum(success)),
+              'n_at_best': int(np.sum(success & (chisqr <= best_chisqr * (1 + rtol) + np.finfo(float).tiny))),
+              'best_chisqr': best_chisqr,
+              'best_start': best_start,
+              'initial_values': np.array([[params[name].value for name in params] for params in starting_params]),
+              'values': values,
+              'chisqr': chisqr,
+              'success': success,
+              'nfev': nfev}
+
+    return best_params, report
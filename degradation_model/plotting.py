@@ -0,0 +1,281 @@
+# -*- coding: UTF-8 -*-
+
+""" This module gathers the plots of the project.
+
+It is the only module importing matplotlib: the classes of the numerical core and of the fits
+import it lazily in their plot methods, so that they can be used without matplotlib.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from matplotlib import cm
+from mpl_toolkits.mplot3d import Axes3D  # registers the 3d projection
+from degradation_model.data_io import read_dst_data
+from degradation_model.degradation_model import nonlinear_cycle_model, nonlinear_cal_model, emp_deg_model, \
+                                                exp_deg_model, soc_stress_model, temp_stress_model
+from degradation_model.stress_surface_representation import stress_grid
+
+
+# -------- Cycle counting ---------------------------------------------
+
+
+def soc_profile_plot(cycle_counter, ax):
+    ax.plot(cycle_counter.data['t'], cycle_counter.data['series'], label="x")
+    ax.set_ylabel('State of charge [%]')
+    ax.set_xlabel('time [s]')
+    ax.set_title('SoC profile - ' + cycle_counter.title)
+
+    plt.draw()
+
+
+def turning_point_plot(cycle_counter, ax):
+    ax.plot(cycle_counter.data['series'], label='turning points')
+
+    ax.scatter(np.array(cycle_counter.max_points)[:, 0], np.array(cycle_counter.max_points)[:, 1],
+               color='red', label="max")
+    ax.scatter(np.array(cycle_counter.min_points)[:, 0], np.array(cycle_counter.min_points)[:, 1],
+               color='blue', label="min")
+    ax.set_ylabel('State of charge [%]')
+    ax.set_xlabel('time series')
+
+    plt.xticks([])
+    plt.legend()
+    plt.title('Series of extracted peaks')
+    plt.tight_layout()
+    plt.draw()
+
+
+# -------- DST cycles -------------------------------------------------
+
+
+def plot_DST_deg_model(dst_cycle_deg, ax, color, label):
+    SoH = 100*(1-np.array(dst_cycle_deg.v_degradation))
+
+    ax.plot(dst_cycle_deg.num_DST_cycles_linspace, SoH, 'x-', color=color, label=label)
+    ax.set_ylim([60, 100])
+    ax.set_xlim([0, 9000])
+    ax.set_xlabel('DST cycle')
+    ax.set_ylabel('State of Health [%]')
+    ax.set_title('Degradation model')
+    ax.grid(color='k', linestyle=':', linewidth=1, alpha=0.3)
+    plt.xticks(np.arange(0, 9000, 1000))
+
+    plt.tight_layout()
+    plt.legend()
+    plt.draw()
+
+
+def plot_DST_profile(dst_cycle_deg, ax1, ax2):
+    ax1.plot(dst_cycle_deg.time_v, dst_cycle_deg.c_rate_v, '-', label='')
+    ax1.set_xlabel('time [s]')
+    ax1.set_ylabel('C-rate')
+    ax1.set_title('C-rate profile')
+    plt.tight_layout()
+
+    ax2.plot(dst_cycle_deg.time_v, dst_cycle_deg.soc_v, '-', label='')
+    ax2.set_xlabel('time [s]')
+    ax2.set_ylabel('State of Charge [%]')
+    ax2.set_title('State of charge profile')
+    plt.tight_layout()
+
+    plt.draw()
+
+
+def plot_DST_experimental_data(ax, data_folder_path):
+    v_soc_min = [25, 40, 25, 50, 25, 45, 65]
+    v_soc_max = [100, 100, 85, 100, 75, 75, 75]
+    colors = ['red', 'blue', 'green', 'orange', 'purple', 'black', 'grey', 'brown']
+
+    for i in range(0, 7):
+        path = data_folder_path + "DST_" + str(v_soc_min[i]) + '_' + str(v_soc_max[i]) + '.csv'
+        cycles, soh = read_dst_data(path)
+        label = str(v_soc_min[i]) + '-' + str(v_soc_max[i]) + ' at 20°C'
+
+        ax.plot(cycles, soh, 'x-', label=label, color=colors[i])
+        ax.set_xlabel('DST cycle')
+        ax.set_ylabel('State of Health [%]')
+        ax.set_ylim([60, 100])
+        ax.set_xlim([0, 9000])
+        plt.xticks(np.arange(0, 9000, 1000))
+
+        ax.set_title('Experimental data')
+        ax.grid(color='k', linestyle=':', linewidth=1, alpha=0.3)
+
+        plt.tight_layout()
+        plt.legend()
+        plt.draw()
+
+
+# -------- Model fits -------------------------------------------------
+
+
+def plot_sei_model(sei_fit, ax):
+    # solution
+    cycle_num_linspace = np.linspace(sei_fit.data['N'].min(), sei_fit.data['N'].max(), 100)
+    degradation_model = nonlinear_cycle_model(cycle_num_linspace,
+                                              sei_fit.alpha_sei,
+                                              sei_fit.beta_sei,
+                                              sei_fit.deg_per_cycle)
+    capa_model = 100-100*degradation_model
+
+    # plot
+    ax.plot(cycle_num_linspace, capa_model, 'r-', label='SEI model')
+    ax.plot(sei_fit.data['N'], 100 * sei_fit.data['SoC'], 'bx', label='experimental data')
+
+    ax.set_xlabel('Cycle number')
+    ax.set_ylabel('State of Charge [%]')
+    ax.set_ylim([75, 100])
+    ax.set_xlim([0, None])
+
+    plt.title('SEI model fit')
+    plt.legend()
+    plt.tight_layout()
+    plt.draw()
+
+
+def plot_dod_graph(cyc_deg_model_fit, ax):
+    """ Plots the results of the data fit """
+    i = 0
+
+    for file in cyc_deg_model_fit.data_file_paths:
+        # solution
+        dod_linspace = np.linspace(1, 100, 100)
+
+        k_d1 = cyc_deg_model_fit.opt_params[i * 3]
+        k_d2 = cyc_deg_model_fit.opt_params[i * 3 + 1]
+        k_d3 = cyc_deg_model_fit.opt_params[i * 3 + 2]
+
+        if cyc_deg_model_fit.chemistry[i] == "LFP":
+            stress_dod_model_emp = exp_deg_model(dod_linspace / 100, k_d1, k_d2)
+        else:
+            stress_dod_model_emp = emp_deg_model(dod_linspace / 100, k_d1, k_d2, k_d3)
+
+        # plot
+        ax.plot(dod_linspace,
+                0.2 * np.divide(1, stress_dod_model_emp),
+                '-',
+                label=cyc_deg_model_fit.chemistry[i],
+                color=cyc_deg_model_fit.colors[i])
+        # ax.plot(cyc_deg_model_fit.dod_v[i]*100, cyc_deg_model_fit.cyc_nb_v[i], 'kx', label='', alpha=0.4)
+
+        # index incrementation
+        i = i + 1
+
+    ax.set_xlabel('Depth of Discharge [%]')
+    ax.set_ylabel('Cycle No.')
+    ax.set_xlim([0, 100])
+    ax.set_title('Cycle count at 80% state of Health')
+
+    plt.yscale('log')
+    plt.legend()
+    plt.tight_layout()  # without it, the text overlap
+    plt.draw()
+
+
+def plot_soc_stress_model(soc_stress_model_fit, ax):
+    soc_linspace = np.linspace(0, 100, 500)
+    stress_model_soc = soc_stress_model(soc=soc_linspace / 100,
+                                        k_soc=soc_stress_model_fit.k_SoC,
+                                        s_ref=soc_stress_model_fit.S_REF)
+
+    ax.plot(soc_linspace, stress_model_soc, 'b-')
+
+    ax.set_xlabel('State of Charge [%]')
+    ax.set_ylabel('Stress')
+    ax.set_title('State of Charge stress model')
+
+    plt.tight_layout()  # without it, the text overlap
+    plt.draw()
+
+
+def plot_soc_SEI_fit(soc_stress_model_fit, ax):
+    t_linspace = np.linspace(soc_stress_model_fit.t_data.min(), soc_stress_model_fit.t_data.max(), 100)
+
+    for i in range(0, len(soc_stress_model_fit.list_deg_per_time_unit)):
+        model = nonlinear_cal_model(t=t_linspace,
+                                    alpha_sei=soc_stress_model_fit.params['alpha_sei'],
+                                    beta_sei=soc_stress_model_fit.params['beta_sei'],
+                                    deg_per_time_unit=soc_stress_model_fit.list_deg_per_time_unit[i])
+        label = 'SoC=' + str(soc_stress_model_fit.SoH_op_data[i]) + '%'
+
+        ax.plot(t_linspace, 100 * (1 - model), '-', label=label, color=soc_stress_model_fit.colors[i])
+        ax.plot(soc_stress_model_fit.t_data, 100 * soc_stress_model_fit.SoH_data[i], 'kx', label='')
+
+    ax.set_xlabel('t [year]')
+    ax.set_ylabel('State of charge [%]')
+    ax.set_ylim([None, 100])
+    ax.set_xlim([0, None])
+    ax.set_title('Calendar degradation at 25°C')
+
+    plt.legend()
+    plt.tight_layout()  # without it, the text overlap
+    plt.draw()
+
+
+def plot_temp_stress_model(temp_stress_model_fit, ax):
+    T_linspace = np.linspace(-20, 60, 100)
+    stress_model_T = temp_stress_model(T=T_linspace, k_T=temp_stress_model_fit.k_T, T_ref=temp_stress_model_fit.T_REF)
+
+    ax.plot(T_linspace, stress_model_T, 'b-')
+    ax.set_xlabel('Temperature [°C]')
+    ax.set_ylabel('Stress')
+    ax.set_title('Temperature stress model')
+
+    plt.tight_layout()  # without it, the text overlap
+    plt.draw()
+
+
+def plot_temp_SEI_fit(temp_stress_model_fit, ax):
+    t_linspace = np.linspace(temp_stress_model_fit.t_data.min(), temp_stress_model_fit.t_data.max(), 100)
+
+    for i in range(0, len(temp_stress_model_fit.list_deg_per_time_unit)):
+        model = nonlinear_cal_model(t=t_linspace,
+                                    alpha_sei=temp_stress_model_fit.params['alpha_sei'],
+                                    beta_sei=temp_stress_model_fit.params['beta_sei'],
+                                    deg_per_time_unit=temp_stress_model_fit.list_deg_per_time_unit[i])
+        label = 'T=' + str(temp_stress_model_fit.T_op_data[i]) + '°C'
+
+        ax.plot(t_linspace, 100*(1-model), '-', label=label, color=temp_stress_model_fit.colors[i])
+
+        ax.plot(temp_stress_model_fit.t_data, 100*temp_stress_model_fit.SoH_data[i], 'kx', label='')
+
+    ax.set_xlabel('t [year]')
+    ax.set_ylabel('State of charge [%]')
+    ax.set_ylim([None, 100])
+    ax.set_xlim([0, None])
+    ax.set_title('Calendar degradation at 50% SoC')
+
+    plt.legend()
+    plt.tight_layout()  # without it, the text overlap
+    plt.draw()
+
+
+# -------- Stress surface ---------------------------------------------
+
+
+def surface_stress_plot(ax, include_voltage_stress):
+
+    # axes definition
+    soc = np.arange(0, 100, 1)
+    temp = np.arange(-5, 50, 1)
+    soc_mesh, temp_mesh = np.meshgrid(soc, temp)
+
+    # stress calculation
+    stress_surface = stress_grid(soc/100, temp, include_voltage_stress=include_voltage_stress)
+
+    # Plot the surface.
+    ax.plot_surface(soc_mesh, temp_mesh, stress_surface, cmap=cm.jet, rstride=1, cstride=1)
+
+    # Adjust the viewing angle.
+    ax.view_init(elev=5.0, azim=230.0)
+
+    ax.set_xlabel('State of charge [%]')
+    ax.set_ylabel('Temperature [°C]')
+    if include_voltage_stress:
+        ax.set_zlabel(r'$S_{cyc}(\sigma, T) = S_\sigma(\sigma).S_T(T).S_V(\sigma)$', rotation=90)
+    else:
+        ax.set_zlabel(r'$S_{cal}(\sigma, T) = S_\sigma(\sigma).S_T(T)$', rotation=90)
+
+    ax.zaxis.set_rotate_label(False)  # disable automatic rotation
+    # fig.colorbar(surf, shrink=0.5, aspect=5)
@@ -0,0 +1,194 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module provides opt-in instrumentation of the degradation pipeline.
+
+The classes of the pipeline (CycleCounter, final_degradation_model, degradation_estimation)
+take a collector argument. A collector has two methods:
+- stage(name): context manager around a stage of the pipeline (reading, peak detection, rainflow, stress)
+- count(name, value): adds value to a counter (input samples, turning points, cycles)
+
+The default collector, NULL_COLLECTOR, does nothing, so that the instrumentation costs
+a method call per stage when it is disabled. ProfileCollector records, for each input file:
+- the wall time of each stage
+- the bytes allocated by each stage (peak of the memory traced by tracemalloc during the stage)
+- the counters
+and prints a report. Any object with the same two methods can be used as a collector.
+
+Usage:
+    collector = ProfileCollector()
+    with collector.file('profile.csv'):
+        final_degradation_model(time_v, soc_v, T, time, chemistry, collector=collector)
+    print(collector.report())
+"""
+
+import time
+import tracemalloc
+
+
+class NullStage:
+    """ Context manager which does nothing """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class NullCollector:
+    """ Collector used when the instrumentation is disabled """
+
+    enabled = False
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def count(self, name, value):
+        pass
+
+    def file(self, name):
+        return NULL_STAGE
+
+
+NULL_COLLECTOR = NullCollector()
+
+
+def get_collector(collector):
+    """
+
+    :param collector: collector or None
+    :return: the collector, or NULL_COLLECTOR if it is None
+    """
+    if collector is None:
+        return NULL_COLLECTOR
+    return collector
+
+
+class Stage:
+    """ Context manager measuring a stage for a ProfileCollector """
+
+    def __init__(self, collector, name):
+        self.collector = collector
+        self.name = name
+        self.t0 = 0
+        self.mem0 = 0
+        self.peak = 0
+
+    def __enter__(self):
+        stack = self.collector.stack
+        if self.collector.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if len(stack) > 0:
+                # the peak of the enclosing stage is kept before being reset
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.mem0 = current
+            self.peak = current
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.t0
+        stack = self.collector.stack
+        stack.pop()
+
+        allocated = 0
+        if self.collector.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            allocated = self.peak - self.mem0
+            if len(stack) > 0:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            tracemalloc.reset_peak()
+
+        self.collector.record(self.name, elapsed, allocated)
+        return False
+
+
+class FileScope:
+    """ Context manager attributing the measurements to a file for a ProfileCollector """
+
+    def __init__(self, collector, name):
+        self.collector = collector
+        self.name = name
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.collector.current_file
+        self.collector.current_file = self.name
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.collector.current_file = self.previous
+        return False
+
+
+class ProfileCollector:
+    """ Collector recording the wall time and allocated bytes of the stages, and the counters, per file """
+
+    enabled = True
+
+    def __init__(self, trace_memory=True):
+        """
+
+        :param trace_memory: if True, the bytes allocated by each stage are measured with tracemalloc,
+                             which slows the pipeline down
+        """
+        self.trace_memory = trace_memory and hasattr(tracemalloc, 'reset_peak')  # Python >= 3.9
+        self.current_file = None
+        self.stack = []
+        self.files = {}  # file name -> {'stages': {name: {'calls', 'time_s', 'bytes'}}, 'counters': {name: value}}
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def file(self, name):
+        return FileScope(self, name)
+
+    def entry(self):
+        if self.current_file not in self.files:
+            self.files[self.current_file] = {'stages': {}, 'counters': {}}
+        return self.files[self.current_file]
+
+    def record(self, name, elapsed, allocated):
+        stages = self.entry()['stages']
+        if name not in stages:
+            stages[name] = {'calls': 0, 'time_s': 0., 'bytes': 0}
+        stages[name]['calls'] += 1
+        stages[name]['time_s'] += elapsed
+        stages[name]['bytes'] = max(stages[name]['bytes'], allocated)
+
+    def count(self, name, value):
+        counters = self.entry()['counters']
+        counters[name] = counters.get(name, 0) + value
+
+    def stop(self):
+        """ Stops tracing the memory """
+        if self.trace_memory:
+            tracemalloc.stop()
+            self.trace_memory = False
+
+    def report(self):
+        """
+
+        :return: text report giving, for each file, the time, number of calls and bytes allocated
+                 (maximum over the calls) of each stage, and the counters
+        """
+        lines = []
+        for file_name, entry in self.files.items():
+            lines.append('---- ' + (str(file_name) if file_name is not None else '(no file)') + ' ----')
+            lines.append('  {:16s} {:>8s} {:>12s} {:>12s}'.format('stage', 'calls', 'time [s]', 'alloc [MB]'))
+            for name, stage in entry['stages'].items():
+                lines.append('  {:16s} {:8d} {:12.4f} {:12.2f}'.format(name, stage['calls'], stage['time_s'],
+                                                                       stage['bytes'] / 1e6))
+            for name, value in entry['counters'].items():
+                lines.append('  {:16s} {:>8}'.format(name, value))
+        return '\n'.join(lines)
@@ -0,0 +1,197 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module writes tables of results incrementally: the rows are appended and flushed as they are
+produced, so that long runs don't keep their results in memory, and an interrupted run leaves
+the rows written so far.
+
+Two formats:
+- csv: one .csv file with a header line
+- columnar: a directory with one binary file per column (raw little endian values, e.g. <name>.f8)
+  and a schema.json file of the names and types of the columns; a column is read with
+  numpy.fromfile, or all of them with read_columnar
+
+The columns are given as a list of (name, type) tuples, the type being a numpy type, e.g. 'f8' or 'i8'.
+
+The position of a writer (position) can be saved, and an output reopened with append=True
+truncated back to it (truncate), e.g. to resume an estimation from a checkpoint.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# columns of the outputs of the estimations (degradation_estimation.py, checkpointed_estimation)
+WINDOW_COLUMNS = [('file_id', 'i8'), ('window', 'i8'), ('t_start', 'f8'), ('t_end', 'f8'),
+                  ('cal_degradation', 'f8'), ('cyc_degradation', 'f8'),
+                  ('linearised_degradation', 'f8'), ('nonlinear_degradation', 'f8')]
+
+FILE_COLUMNS = [('file_id', 'i8'), ('n_samples', 'i8'), ('n_turning_points', 'i8'), ('t_start', 'f8'), ('t_end', 'f8'),
+                ('cal_degradation', 'f8'), ('cyc_degradation', 'f8'),
+                ('linearised_degradation', 'f8'), ('nonlinear_degradation', 'f8')]
+
+
+class ResultWriter:
+    def __init__(self, path, columns, append=False):
+        """
+
+        :param path: path of the output (file or directory, depending on the format)
+        :param columns: list of (name, numpy type) tuples
+        :param append: if True, the rows are appended to an existing output, which must have the same columns
+        """
+        self.path = path
+        self.columns = [(name, np.dtype(dtype).newbyteorder('<')) for name, dtype in columns]
+        self.append = append
+        self.n_rows = 0
+
+    def write(self, rows):
+        """ Appends rows to the output, and flushes them
+
+        :param rows: dictionary column name -> scalar or array of the values of the rows
+        """
+        values = [np.atleast_1d(np.asarray(rows[name], dtype=dtype)) for name, dtype in self.columns]
+        n_rows = max(len(v) for v in values)
+        values = [np.broadcast_to(v, (n_rows,)) for v in values]
+        self.write_values(values)
+        self.n_rows += n_rows
+
+    def write_values(self, values):
+        raise NotImplementedError
+
+    def position(self):
+        """
+
+        :return: list of the sizes of the files of the output, in byte
+        """
+        raise NotImplementedError
+
+    def truncate(self, position):
+        """ Drops the rows written after a position
+
+        :param position: position returned by position()
+        """
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvResultWriter(ResultWriter):
+    def __init__(self, path, columns, append=False):
+        ResultWriter.__init__(self, path, columns, append=append)
+
+        header = ','.join(name for name, _ in self.columns)
+        if append and os.path.isfile(path) and os.path.getsize(path) > 0:
+            with open(path) as fp:
+                if fp.readline().strip() != header:
+                    sys.exit('The columns of ' + path + ' are not ' + header)
+            self.fp = open(path, 'a')
+        else:
+            self.fp = open(path, 'w')
+            self.fp.write(header + '\n')
+            self.fp.flush()
+
+        # repr precision for the floats, so that they read back as the same values
+        self.fmt = ['%d' if dtype.kind in 'iub' else '%.17g' for _, dtype in self.columns]
+
+    def write_values(self, values):
+        np.savetxt(self.fp, np.rec.fromarrays(values), fmt=self.fmt, delimiter=',')
+        self.fp.flush()
+
+    def position(self):
+        return [self.fp.tell()]
+
+    def truncate(self, position):
+        self.fp.truncate(position[0])
+
+    def close(self):
+        self.fp.close()
+
+
+class ColumnarResultWriter(ResultWriter):
+    def __init__(self, path, columns, append=False):
+        ResultWriter.__init__(self, path, columns, append=append)
+
+        schema = {'version': FORMAT_VERSION,
+                  'columns': [{'name': name, 'dtype': dtype.str} for name, dtype in self.columns]}
+        schema_path = os.path.join(path, 'schema.json')
+
+        if append and os.path.isfile(schema_path):
+            with open(schema_path) as fp:
+                if json.load(fp)['columns'] != schema['columns']:
+                    sys.exit('The columns of ' + path + ' are not ' + ', '.join(name for name, _ in self.columns))
+            mode = 'ab'
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            with open(schema_path, 'w') as fp:
+                json.dump(schema, fp, indent=2)
+            mode = 'wb'
+
+        self.fps = [open(column_path(path, name, dtype), mode) for name, dtype in self.columns]
+
+    def write_values(self, values):
+        for fp, v, (_, dtype) in zip(self.fps, values, self.columns):
+            fp.write(np.ascontiguousarray(v, dtype=dtype).tobytes())
+            fp.flush()
+
+    def position(self):
+        return [fp.tell() for fp in self.fps]
+
+    def truncate(self, position):
+        for fp, size in zip(self.fps, position):
+            fp.truncate(size)
+
+    def close(self):
+        for fp in self.fps:
+            fp.close()
+
+
+FORMATS = {'csv': CsvResultWriter, 'columnar': ColumnarResultWriter}
+EXTENSIONS = {'csv': '.csv', 'columnar': ''}
+
+
+def column_path(path, name, dtype):
+    return os.path.join(path, '{}.{}{}'.format(name, dtype.kind, dtype.itemsize))
+
+
+def open_result_writer(path, columns, output_format='csv', append=False):
+    """
+
+    :param path: path of the output, without extension
+    :param columns: list of (name, numpy type) tuples
+    :param output_format: either csv or columnar
+    :param append: if True, the rows are appended to an existing output
+    :return: ResultWriter
+    """
+    if output_format not in FORMATS:
+        sys.exit('The output format must be either ' + ', '.join(FORMATS))
+    return FORMATS[output_format](path + EXTENSIONS[output_format], columns, append=append)
+
+
+def read_columnar(path):
+    """
+
+    :param path: directory of a columnar output
+    :return: dictionary column name -> array; the rows of a write interrupted in the middle are dropped
+    """
+    with open(os.path.join(path, 'schema.json')) as fp:
+        schema = json.load(fp)
+
+    columns = {}
+    for column in schema['columns']:
+        dtype = np.dtype(column['dtype'])
+        columns[column['name']] = np.fromfile(column_path(path, column['name'], dtype), dtype=dtype)
+
+    n_rows = min([len(v) for v in columns.values()] + [np.iinfo(np.int64).max])
+    return {name: v[:n_rows] for name, v in columns.items()}
@@ -0,0 +1,254 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module computes the sensitivity of the state of health and of the lifetime of a battery to the
+parameters of the stress models, for thousands of parameter sets at once.
+
+The cycles of the state of charge profile are counted once. The stress models are then evaluated
+with arrays of parameters: each cycle stress is a matrix (parameter set x cycle) which is summed over the
+cycles, chunk of parameter sets by chunk of parameter sets. The parameters are:
+- k_soc: state of charge stress (soc_stress_model)
+- k_T: temperature stress (temp_stress_model)
+- k_v: voltage stress (voltage_stress_model)
+- k_t: calendar degradation per second (time_deg_model)
+- alpha_sei, beta_sei: SEI formation of the nonlinear general model
+The depth of discharge model of the chemistry isn't varied.
+
+The parameter sets are drawn by latin_hypercube or sobol_design (scipy needed) within bounds, e.g.
+default_bounds(0.2) for +/- 20 % around the nominal parameters.
+
+Usage, from the root of the project:
+    $ python -m degradation_model.sensitivity profile.csv --samples 10000 --temperature 25 --chemistry NMC
+"""
+
+import argparse
+import numpy as np
+import sys
+
+from degradation_model.cycle_counting_algorithm import CycleCounter
+from degradation_model.degradation_model import dod_deg_model, soc_stress_model, temp_stress_model, \
+    voltage_stress_model, time_deg_model, nonlinear_general_model
+
+PARAMETERS = ('k_soc', 'k_T', 'k_v', 'k_t', 'alpha_sei', 'beta_sei')
+
+NOMINAL = {'k_soc': 1.01e+00,
+           'k_T': 6.71e-02,
+           'k_v': 10.2,
+           'k_t': 4.11e-10,
+           'alpha_sei': 5.87e-02,
+           'beta_sei': 1.06e+02}
+
+END_OF_LIFE_DEGRADATION = 0.2  # 80 % of the initial capacity
+
+CHUNK_SIZE = 1e7  # number of elements of the (parameter set x cycle) matrices
+
+
+# -------- Designs of experiments --------------------------------------
+
+def default_bounds(relative=0.2):
+    """
+
+    :param relative: relative variation around the nominal parameters
+    :return: dictionary parameter -> (lower bound, upper bound)
+    """
+    return {name: (NOMINAL[name] * (1 - relative), NOMINAL[name] * (1 + relative)) for name in PARAMETERS}
+
+
+def scale_design(unit_samples, bounds):
+    """
+
+    :param unit_samples: (n_samples x n_parameters) array of samples in [0, 1)
+    :param bounds: dictionary parameter -> (lower bound, upper bound), in the order of the columns
+    :return: dictionary parameter -> array of samples
+    """
+    samples = {}
+    for i, (name, (lower, upper)) in enumerate(bounds.items()):
+        samples[name] = lower + (upper - lower) * unit_samples[:, i]
+    return samples
+
+
+def latin_hypercube(bounds, n_samples, seed=0):
+    """
+
+    :param bounds: dictionary parameter -> (lower bound, upper bound)
+    :param n_samples: number of parameter sets
+    :param seed: seed of the random generator
+    :return: dictionary parameter -> array of samples; each range is split into n_samples strata,
+             each of which is sampled once
+    """
+    rng = np.random.RandomState(seed)
+    unit_samples = np.empty((n_samples, len(bounds)))
+    for i in range(0, len(bounds)):
+        unit_samples[:, i] = (rng.permutation(n_samples) + rng.uniform(size=n_samples)) / n_samples
+    return scale_design(unit_samples, bounds)
+
+
+def sobol_design(bounds, n_samples, seed=0):
+    """
+
+    :param bounds: dictionary parameter -> (lower bound, upper bound)
+    :param n_samples: number of parameter sets, preferably a power of 2
+    :param seed: seed of the scrambling
+    :return: dictionary parameter -> array of samples of a scrambled Sobol sequence
+    """
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        sys.exit('The Sobol design needs scipy >= 1.7')
+
+    unit_samples = qmc.Sobol(d=len(bounds), scramble=True, seed=seed).random(n_samples)
+    return scale_design(unit_samples, bounds)
+
+
+# -------- Sensitivity -------------------------------------------------
+
+def end_of_life_degradation(alpha_sei, beta_sei, end_of_life=END_OF_LIFE_DEGRADATION, tol=1e-12):
+    """ Inverse of the nonlinear general model: linearised degradation at which the degradation reaches end_of_life
+
+    The nonlinear general model is increasing and concave: Newton's method from 0 converges from below.
+
+    :param alpha_sei: coefficient alpha of the SEI model, scalar or array
+    :param beta_sei: coefficient beta of the SEI model, scalar or array
+    :param end_of_life: degradation at the end of life (between 0 and 1)
+    :return: linearised degradation, with the shape of alpha_sei and beta_sei
+    """
+    alpha_sei, beta_sei = np.broadcast_arrays(np.asarray(alpha_sei, dtype=float), np.asarray(beta_sei, dtype=float))
+    deg = np.zeros(alpha_sei.shape)
+    for _ in range(0, 100):
+        f = nonlinear_general_model(alpha_sei, beta_sei, deg) - end_of_life
+        df = alpha_sei * beta_sei * np.exp(- beta_sei * deg) + (1 - alpha_sei) * np.exp(-deg)
+        step = f / df
+        deg = deg - step
+        if np.all(np.abs(step) <= tol * np.maximum(deg, 1.)):
+            break
+    return deg[()]
+
+
+class SensitivityResult:
+    def __init__(self, samples, cal_degradation, cyc_degradation, time):
+        """
+
+        :param samples: dictionary parameter -> array of the parameter sets
+        :param cal_degradation: calendar degradation (linearised) of each parameter set
+        :param cyc_degradation: cycling degradation (linearised) of each parameter set
+        :param time: time of the profile in second
+        """
+        self.samples = samples
+        self.cal_degradation = cal_degradation
+        self.cyc_degradation = cyc_degradation
+        self.time = time
+
+    def linearised_degradation(self):
+        return self.cal_degradation + self.cyc_degradation
+
+    def soh(self):
+        """
+
+        :return: state of health (between 0 and 1) at the end of the profile, for each parameter set
+        """
+        return 1 - nonlinear_general_model(self.samples['alpha_sei'], self.samples['beta_sei'],
+                                           self.linearised_degradation())
+
+    def lifetime(self, end_of_life=END_OF_LIFE_DEGRADATION):
+        """
+
+        :param end_of_life: degradation at the end of life (between 0 and 1)
+        :return: time in second until the end of life when the profile is repeated, for each parameter set
+        """
+        deg_eol = end_of_life_degradation(self.samples['alpha_sei'], self.samples['beta_sei'], end_of_life)
+        return deg_eol / self.linearised_degradation() * self.time
+
+    def rank_correlations(self, output):
+        """ Spearman rank correlation of each parameter with an output: a first order measure of sensitivity
+
+        :param output: array of an output for each parameter set, e.g. lifetime()
+        :return: dictionary parameter -> rank correlation (between -1 and 1)
+        """
+        def ranks(x):
+            r = np.empty(len(x))
+            r[np.argsort(x, kind='mergesort')] = np.arange(len(x))
+            return r
+
+        output_ranks = ranks(output)
+        return {name: np.corrcoef(ranks(values), output_ranks)[0, 1] for name, values in self.samples.items()}
+
+
+def sensitivity(time_v, soc_v, T, time, chemistry, samples, delta=0.1):
+    """
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param T: temperature in °C
+    :param time: time of the profile in second
+    :param chemistry: either NMC, LMO or LFP
+    :param samples: dictionary parameter -> array of parameter sets; the missing parameters are nominal
+    :param delta: hysteresis of the peak detection in %
+    :return: SensitivityResult
+    """
+    n_sets = max([len(np.atleast_1d(values)) for values in samples.values()] + [1])
+    full_samples = {}
+    for name in PARAMETERS:
+        values = np.asarray(samples.get(name, NOMINAL[name]), dtype=float)
+        full_samples[name] = np.broadcast_to(values, (n_sets,)).copy()
+    unknown = set(samples) - set(PARAMETERS)
+    if len(unknown) > 0:
+        sys.exit('Unknown parameters: ' + ', '.join(sorted(unknown)))
+
+    # cycles counting, once for all the parameter sets
+    cycle_counter = CycleCounter(time_v=time_v, soc_v=soc_v, delta=delta)
+    cycle_counter.rainflow_process()
+
+    k_soc = full_samples['k_soc']
+    temp_stress = temp_stress_model(T, k_T=full_samples['k_T'])
+
+    cal_degradation = time_deg_model(time, k_t=full_samples['k_t']) \
+        * soc_stress_model(cycle_counter.mean_soc, k_soc=k_soc) * temp_stress
+
+    cyc_degradation = np.zeros(n_sets)
+    n_cycles = len(cycle_counter.arr_n)
+    if n_cycles > 0:
+        arr_soc_mean = cycle_counter.arr_soc_mean
+        deg_per_cycle = cycle_counter.arr_n * dod_deg_model(chemistry, cycle_counter.arr_dod)
+
+        # (parameter set x cycle) matrices, by chunks of parameter sets
+        chunk = max(int(CHUNK_SIZE // n_cycles), 1)
+        for first in range(0, n_sets, chunk):
+            rows = slice(first, first + chunk)
+            stress = soc_stress_model(arr_soc_mean, k_soc=k_soc[rows, np.newaxis]) \
+                * voltage_stress_model(arr_soc_mean, k_v=full_samples['k_v'][rows, np.newaxis])
+            cyc_degradation[rows] = np.dot(stress, deg_per_cycle)
+        cyc_degradation *= temp_stress
+
+    return SensitivityResult(full_samples, cal_degradation, cyc_degradation, time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sensitivity of the state of health and lifetime to the stress '
+                                                 'model parameters')
+    parser.add_argument('profile', help='.csv file of time (in second or dates) and state of charge (in %)')
+    parser.add_argument('--samples', type=int, default=4096, help='number of parameter sets')
+    parser.add_argument('--design', default='lhs', choices=['lhs', 'sobol'])
+    parser.add_argument('--relative', type=float, default=0.2, help='relative variation of the parameters')
+    parser.add_argument('--temperature', type=float, default=25)
+    parser.add_argument('--chemistry', default='NMC', choices=['NMC', 'LMO', 'LFP'])
+    parser.add_argument('--delta', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from degradation_model.data_io import read_soc_csv, time_in_seconds
+    t, soc = read_soc_csv(args.profile)
+    t = time_in_seconds(t)
+
+    design = latin_hypercube if args.design == 'lhs' else sobol_design
+    parameter_samples = design(default_bounds(args.relative), args.samples, seed=args.seed)
+
+    result = sensitivity(t, soc, args.temperature, t[-1] - t[0], args.chemistry, parameter_samples,
+                         delta=args.delta)
+    lifetime_years = result.lifetime() / (365 * 24 * 3600)
+
+    print('{} parameter sets ({} design, +/- {:.0f} %)'.format(args.samples, args.design, 100 * args.relative))
+    for name, output in (('state of health', result.soh()), ('lifetime [year]', lifetime_years)):
+        print('{}: 5 % {:.4g}, median {:.4g}, 95 % {:.4g}'.format(name, *np.percentile(output, [5, 50, 95])))
+    print('rank correlation with the lifetime:')
+    for name, correlation in sorted(result.rank_correlations(lifetime_years).items(), key=lambda x: -abs(x[1])):
+        print('    {:10} {:+.3f}'.format(name, correlation))
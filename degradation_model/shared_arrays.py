@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module shares numpy arrays with worker processes through multiprocessing.shared_memory blocks,
+so that the workers read their inputs and write their results without copying nor pickling them.
+
+Lifecycle of the blocks:
+- the parent process creates the blocks in a SharedArrays context (share, empty); they are unlinked at the
+  end of the context, also when an exception is raised, and must not be used afterwards
+- the tasks sent to the workers only hold block descriptors (name, shape and type of the array),
+  a few bytes whatever the size of the array
+- a worker attaches a block by its descriptor (attach) the first time it needs it, and keeps it attached
+  until it exits; the views of a task are numpy arrays over the block, e.g. attach(descriptor)[first:stop]
+
+The memory of a block is mapped once by every process which attaches it, and is counted once.
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_attached = {}  # blocks attached by the current process, by name
+
+
+class SharedArrays:
+    def __init__(self):
+        self.blocks = []
+
+    def empty(self, shape, dtype=float):
+        """
+
+        :param shape: shape of the array
+        :param dtype: numpy type of the array
+        :return: tuple (descriptor of the block, array over the block), the array being uninitialised
+        """
+        dtype = np.dtype(dtype)
+        n_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        block = shared_memory.SharedMemory(create=True, size=max(n_bytes, 1))
+        self.blocks.append(block)
+
+        descriptor = (block.name, tuple(np.atleast_1d(shape).tolist()), dtype.str)
+        return descriptor, np.ndarray(descriptor[1], dtype=dtype, buffer=block.buf)
+
+    def share(self, array):
+        """
+
+        :param array: array copied in a new block
+        :return: tuple (descriptor of the block, array over the block)
+        """
+        array = np.asarray(array)
+        descriptor, view = self.empty(array.shape, array.dtype)
+        view[...] = array
+        return descriptor, view
+
+    def close(self):
+        """ Unlinks the blocks, and releases the ones without remaining views (the others are released with
+        their last view); the results must be copied out of the blocks before """
+        for block in self.blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach(descriptor):
+    """
+
+    :param descriptor: descriptor of a block, returned by SharedArrays.empty or SharedArrays.share
+    :return: array over the block, attached by the current process if it wasn't yet
+    """
+    name, shape, dtype = descriptor
+    block = _attached.get(name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
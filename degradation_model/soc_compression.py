@@ -0,0 +1,312 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module compresses state of charge series before the cycle counting.
+
+The rainflow counting only depends on the turning points which survive the hysteresis (delta)
+of the peak detection, and the calendar degradation only on the mean state of charge.
+A series is therefore reduced, without loss for final_degradation_model, to:
+- its turning points: index of the sample, state of charge, and whether it is a maximum
+- the number of samples and the sum of the states of charge
+- the first and last times
+Between two turning points (a segment), the number of samples, the sum of the states of charge,
+the duration and the time integral of the state of charge stress (trapezoidal rule) are kept as well,
+so that the calendar stress of parts of the series can be evaluated.
+
+The compressed series is saved in a numpy .npz file, and scored with compressed_degradation_model,
+which gives the same result as final_degradation_model on the original series, at the same delta.
+With integrated=True, the calendar degradation is the one of integrated_cal_degradation_model instead,
+i.e. the state of charge stress integrated over time rather than the stress of the mean state of charge.
+
+A series read as runs of constant state of charge (degradation_model.soc_runs) is compressed by
+compress_runs, with a cost proportional to the number of runs instead of the number of samples.
+
+Usage, from the root of the project:
+    $ python -m degradation_model.soc_compression compress profile.csv profile.npz --delta 0.1
+    $ python -m degradation_model.soc_compression score profile.npz --temperature 25 --chemistry NMC --integrated
+"""
+
+import argparse
+import numpy as np
+import sys
+
+import lib.peak_det.peak_det as pkd
+from degradation_model.cycle_counting_algorithm import CycleCounter
+from degradation_model.degradation_model import cycle_counter_degradation, soc_stress_model, temp_stress_model, \
+                                                time_deg_model
+
+FORMAT_VERSION = 2
+
+
+def segment_sums(values, starts, n):
+    """ Sums of values over the segments [starts[i], starts[i+1]), the last one ending at n
+
+    :param values: array
+    :param starts: increasing array of the first indices of the segments (segments can be empty)
+    :param n: end of the last segment
+    :return: array of the sums, one per segment
+    """
+    ends = np.append(starts[1:], n)
+    sums = np.zeros(len(starts))
+    not_empty = ends > starts
+    if np.any(not_empty):
+        sums[not_empty] = np.add.reduceat(values[:n], starts[not_empty])
+    return sums
+
+
+class CompressedSoC:
+    def __init__(self, delta, n_samples, soc_sum, t_start, t_end, tp_index, tp_value, tp_is_max,
+                 seg_count, seg_soc_sum, seg_duration, seg_stress_integral):
+        """
+
+        :param delta: hysteresis of the peak detection, in % of state of charge
+        :param n_samples: number of samples of the series
+        :param soc_sum: sum of the states of charge of the series, in %
+        :param t_start: first time of the series, in second
+        :param t_end: last time of the series, in second
+        :param tp_index: indices of the turning points in the series
+        :param tp_value: states of charge of the turning points, in %
+        :param tp_is_max: True for the maxima, False for the minima
+        :param seg_count: number of samples of each segment; the segment i starts at the i-th turning point,
+                          or at the first sample for the segment before the first turning point
+        :param seg_soc_sum: sum of the states of charge of each segment, in %
+        :param seg_duration: duration of each segment, until the first sample of the next one, in second
+        :param seg_stress_integral: time integral of the state of charge stress (soc_stress_model) over each
+                                    segment, in second
+        """
+        self.delta = delta
+        self.n_samples = n_samples
+        self.soc_sum = soc_sum
+        self.t_start = t_start
+        self.t_end = t_end
+
+        self.tp_index = np.asarray(tp_index, dtype=np.int64)
+        self.tp_value = np.asarray(tp_value, dtype=float)
+        self.tp_is_max = np.asarray(tp_is_max, dtype=bool)
+
+        self.seg_count = np.asarray(seg_count, dtype=np.int64)
+        self.seg_soc_sum = np.asarray(seg_soc_sum, dtype=float)
+        self.seg_duration = np.asarray(seg_duration, dtype=float)
+        self.seg_stress_integral = np.asarray(seg_stress_integral, dtype=float)
+
+    def turning_points(self):
+        """
+
+        :return: tuple (max points, min points) as returned by peakdet, i.e. (n x 2) arrays of index and value
+        """
+        points = np.column_stack((self.tp_index, self.tp_value))
+        return points[self.tp_is_max], points[~self.tp_is_max]
+
+    def duration(self):
+        return self.t_end - self.t_start
+
+    def mean_soc(self):
+        """
+
+        :return: mean of the states of charge of the samples, in %
+        """
+        return self.soc_sum / self.n_samples
+
+    def compression_ratio(self):
+        """
+
+        :return: number of samples per stored turning point
+        """
+        return self.n_samples / max(len(self.tp_value), 1)
+
+    def save(self, path):
+        np.savez(path, format_version=FORMAT_VERSION, delta=self.delta, n_samples=self.n_samples,
+                 soc_sum=self.soc_sum, t_start=self.t_start, t_end=self.t_end,
+                 tp_index=self.tp_index, tp_value=self.tp_value, tp_is_max=self.tp_is_max,
+                 seg_count=self.seg_count, seg_soc_sum=self.seg_soc_sum, seg_duration=self.seg_duration,
+                 seg_stress_integral=self.seg_stress_integral)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            if int(data['format_version']) != FORMAT_VERSION:
+                sys.exit('Unsupported format version of compressed state of charge: '
+                         + str(int(data['format_version'])))
+
+            return CompressedSoC(delta=float(data['delta']),
+                                 n_samples=int(data['n_samples']),
+                                 soc_sum=data['soc_sum'][()],
+                                 t_start=data['t_start'][()],
+                                 t_end=data['t_end'][()],
+                                 tp_index=data['tp_index'],
+                                 tp_value=data['tp_value'],
+                                 tp_is_max=data['tp_is_max'],
+                                 seg_count=data['seg_count'],
+                                 seg_soc_sum=data['seg_soc_sum'],
+                                 seg_duration=data['seg_duration'],
+                                 seg_stress_integral=data['seg_stress_integral'])
+
+
+def turning_points(soc_v, delta, x=None):
+    """
+
+    :param soc_v: state of charge vector in %
+    :param delta: hysteresis of the peak detection, in % of state of charge
+    :param x: indices of the samples of soc_v (0, 1, 2... if None)
+    :return: tuple (indices, values, is_max) of the turning points, in the order of the series
+    """
+    max_points, min_points = pkd.peakdet(soc_v, delta=delta, x=x)
+    max_points = np.reshape(max_points, (-1, 2))
+    min_points = np.reshape(min_points, (-1, 2))
+
+    tp_index = np.concatenate((max_points[:, 0], min_points[:, 0])).astype(np.int64)
+    tp_value = np.concatenate((max_points[:, 1], min_points[:, 1]))
+    tp_is_max = np.concatenate((np.ones(len(max_points), dtype=bool), np.zeros(len(min_points), dtype=bool)))
+    order = np.argsort(tp_index, kind='stable')
+
+    return tp_index[order], tp_value[order], tp_is_max[order]
+
+
+def compress_soc(time_v, soc_v, delta=0.1):
+    """
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param delta: hysteresis of the peak detection, in % of state of charge
+    :return: CompressedSoC
+    """
+    time_v = np.asarray(time_v, dtype=float)
+    soc_v = np.asarray(soc_v)
+    n = len(soc_v)
+
+    if n == 0:
+        sys.exit('The state of charge series is empty')
+    if len(time_v) != n:
+        sys.exit('The time and state of charge vectors must have the same length')
+
+    tp_index, tp_value, tp_is_max = turning_points(soc_v, delta)
+
+    # segments between the turning points
+    starts = np.unique(np.concatenate(([0], tp_index)))
+    ends = np.append(starts[1:], n)
+    seg_count = ends - starts
+    seg_soc_sum = segment_sums(soc_v.astype(float), starts, n)
+
+    last = np.minimum(ends, n - 1)
+    seg_duration = time_v[last] - time_v[starts]
+
+    # trapezoidal rule: the interval between the samples k and k+1 belongs to the segment of the sample k
+    stress = soc_stress_model(soc_v.astype(float) / 100)
+    areas = (stress[:-1] + stress[1:]) / 2 * np.diff(time_v)
+    seg_stress_integral = segment_sums(areas, starts, n - 1)
+
+    return CompressedSoC(delta=delta,
+                         n_samples=n,
+                         soc_sum=np.sum(soc_v, dtype=np.float64),
+                         t_start=time_v[0],
+                         t_end=time_v[-1],
+                         tp_index=tp_index,
+                         tp_value=tp_value,
+                         tp_is_max=tp_is_max,
+                         seg_count=seg_count,
+                         seg_soc_sum=seg_soc_sum,
+                         seg_duration=seg_duration,
+                         seg_stress_integral=seg_stress_integral)
+
+
+def compress_runs(runs, delta=0.1):
+    """ Compression of a state of charge series given as runs of constant state of charge,
+    with a cost proportional to the number of runs
+
+    :param runs: SoCRuns
+    :param delta: hysteresis of the peak detection, in % of state of charge
+    :return: CompressedSoC, equal to the one of compress_soc on the samples (up to rounding errors)
+    """
+    # a repeated value doesn't change the state of peakdet: the turning points are found on the runs,
+    # at the index of the first sample of their run
+    tp_index, tp_value, tp_is_max = turning_points(runs.soc, delta, x=runs.start_index)
+
+    # segments between the turning points, as runs
+    starts = np.unique(np.concatenate(([runs.start_index[0]], tp_index)))
+    run_starts = np.searchsorted(runs.start_index, starts)
+    n_runs = runs.n_runs()
+
+    seg_count = segment_sums(runs.count, run_starts, n_runs).astype(np.int64)
+    seg_soc_sum = segment_sums(runs.soc_sums(), run_starts, n_runs)
+    seg_duration = np.append(runs.start_time[run_starts[1:]], runs.t_end()) - runs.start_time[run_starts]
+    seg_stress_integral = segment_sums(runs.soc_stress_integrals(), run_starts, n_runs)
+
+    return CompressedSoC(delta=delta,
+                         n_samples=runs.n_samples(),
+                         soc_sum=np.sum(runs.soc_sums()),
+                         t_start=runs.t_start(),
+                         t_end=runs.t_end(),
+                         tp_index=tp_index - runs.start_index[0],
+                         tp_value=tp_value,
+                         tp_is_max=tp_is_max,
+                         seg_count=seg_count,
+                         seg_soc_sum=seg_soc_sum,
+                         seg_duration=seg_duration,
+                         seg_stress_integral=seg_stress_integral)
+
+
+def compressed_degradation_model(compressed, T, time, chemistry, delta=None, collector=None, integrated=False):
+    """ final_degradation_model of the original series, from its compressed form
+
+    :param compressed: CompressedSoC
+    :param T: temperature in °C
+    :param time: time in second
+    :param chemistry: either NMC, LMO or LFP
+    :param delta: hysteresis of the peak detection; it must be the one of the compression (which is used if None)
+    :param collector: collector of profiling measurements, see degradation_model.profiling (disabled if None)
+    :param integrated: if True, the calendar degradation is the one of integrated_cal_degradation_model on the
+                       original series (time is then unused)
+    :return: tuple (calendar degradation, cycling degradation)
+    """
+    if delta is not None and delta != compressed.delta:
+        sys.exit('The series was compressed with delta = ' + str(compressed.delta)
+                 + ', it can''t be scored with delta = ' + str(delta))
+
+    cycle_counter = CycleCounter.from_compressed(compressed, collector=collector)
+    cal_degradation, cyc_degradation = cycle_counter_degradation(cycle_counter, T, time, chemistry,
+                                                                 collector=collector)
+    if integrated:
+        cal_degradation = time_deg_model(np.sum(compressed.seg_stress_integral)) * temp_stress_model(T)
+    return cal_degradation, cyc_degradation
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compression of state of charge series')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_compress = subparsers.add_parser('compress', help='compresses a .csv file of time and state of charge')
+    parser_compress.add_argument('csv')
+    parser_compress.add_argument('npz')
+    parser_compress.add_argument('--delta', type=float, default=0.1)
+    parser_compress.add_argument('--runs', action='store_true',
+                                 help='reads the file by chunks, as runs of constant state of charge')
+
+    parser_score = subparsers.add_parser('score', help='degradation of a compressed series')
+    parser_score.add_argument('npz')
+    parser_score.add_argument('--temperature', type=float, default=25)
+    parser_score.add_argument('--chemistry', default='NMC')
+    parser_score.add_argument('--integrated', action='store_true',
+                              help='integrates the state of charge stress over time for the calendar degradation')
+
+    args = parser.parse_args()
+
+    if args.command == 'compress':
+        if args.runs:
+            from degradation_model.data_io import read_soc_csv_runs
+            compressed_soc = compress_runs(read_soc_csv_runs(args.csv), delta=args.delta)
+        else:
+            from degradation_model.data_io import read_soc_csv, time_in_seconds
+            t, soc = read_soc_csv(args.csv)
+            compressed_soc = compress_soc(time_in_seconds(t), soc, delta=args.delta)
+        compressed_soc.save(args.npz)
+        print('{} samples compressed into {} turning points (ratio {:.0f})'.format(
+            compressed_soc.n_samples, len(compressed_soc.tp_value), compressed_soc.compression_ratio()))
+    elif args.command == 'score':
+        compressed_soc = CompressedSoC.load(args.npz)
+        cal_deg, cyc_deg = compressed_degradation_model(compressed_soc, args.temperature,
+                                                        compressed_soc.duration(), args.chemistry,
+                                                        integrated=args.integrated)
+        print('calendar degradation: {:.6e}'.format(cal_deg))
+        print('cycling degradation:  {:.6e}'.format(cyc_deg))
+    else:
+        parser.print_help()
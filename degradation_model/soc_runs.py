@@ -0,0 +1,138 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module represents state of charge logs as runs of constant state of charge.
+
+A battery idle at a constant state of charge logs the same value for hours. The consecutive
+samples of a same value make a run, stored as:
+- start_index: index of its first sample in the log
+- start_time: time of its first sample, in second
+- duration: time between its first and last samples, in second (0 for a run of one sample)
+- soc: state of charge, in %
+- count: number of samples
+The log between two runs varies linearly (trapezoidal rule) from the state of charge of the first run
+to the one of the second run.
+
+The peak detection gives the same turning points on the runs as on the samples, since a repeated value
+never changes the state of peakdet: the turning points, the mean state of charge and the time integral of
+the state of charge stress (see integrated_cal_degradation_model) are computed with a cost proportional to
+the number of runs. See soc_compression.compress_runs for the cycle counting of runs, and
+data_io.read_soc_csv_runs for the encoding of a file by chunks.
+"""
+
+import numpy as np
+import sys
+
+from degradation_model.degradation_model import soc_stress_model
+
+
+class SoCRuns:
+    def __init__(self, start_index, start_time, duration, soc, count):
+        self.start_index = np.asarray(start_index, dtype=np.int64)
+        self.start_time = np.asarray(start_time, dtype=float)
+        self.duration = np.asarray(duration, dtype=float)
+        self.soc = np.asarray(soc, dtype=float)
+        self.count = np.asarray(count, dtype=np.int64)
+
+    def n_runs(self):
+        return len(self.soc)
+
+    def n_samples(self):
+        return int(np.sum(self.count))
+
+    def t_start(self):
+        return self.start_time[0]
+
+    def t_end(self):
+        return self.start_time[-1] + self.duration[-1]
+
+    def soc_sums(self):
+        """
+
+        :return: sum of the states of charge of the samples of each run
+        """
+        return self.soc * self.count
+
+    def mean_soc(self):
+        """
+
+        :return: mean of the states of charge of the samples, in %
+        """
+        return np.sum(self.soc_sums()) / self.n_samples()
+
+    def gaps(self):
+        """
+
+        :return: time between the last sample of each run and the first sample of the next one (0 for the last run)
+        """
+        return np.append(self.start_time[1:] - (self.start_time[:-1] + self.duration[:-1]), 0.)
+
+    def soc_stress_integrals(self):
+        """
+
+        :return: time integral of the state of charge stress (soc_stress_model) over each run and the gap which
+                 follows it, in second; over a gap, the stress varies linearly (trapezoidal rule)
+        """
+        stress = soc_stress_model(self.soc / 100)
+        next_stress = np.append(stress[1:], stress[-1])
+        return stress * self.duration + (stress + next_stress) / 2 * self.gaps()
+
+    def to_samples(self):
+        """ Decodes the runs into samples; the times of the samples inside a run are evenly spaced
+
+        :return: tuple (time vector in second, state of charge vector in %)
+        """
+        soc_v = np.repeat(self.soc, self.count)
+        position = np.arange(len(soc_v)) - np.repeat(self.start_index - self.start_index[0], self.count)
+        step = np.where(self.count > 1, self.duration / np.maximum(self.count - 1, 1), 0.)
+        time_v = np.repeat(self.start_time, self.count) + position * np.repeat(step, self.count)
+        return time_v, soc_v
+
+
+def encode_runs(time_v, soc_v, first_index=0):
+    """
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param first_index: index of the first sample in the log
+    :return: SoCRuns
+    """
+    time_v = np.asarray(time_v, dtype=float)
+    soc_v = np.asarray(soc_v, dtype=float)
+
+    if len(soc_v) == 0:
+        sys.exit('The state of charge series is empty')
+    if len(time_v) != len(soc_v):
+        sys.exit('The time and state of charge vectors must have the same length')
+
+    starts = np.concatenate(([0], np.flatnonzero(soc_v[1:] != soc_v[:-1]) + 1))
+    lasts = np.append(starts[1:], len(soc_v)) - 1
+
+    return SoCRuns(start_index=starts + first_index,
+                   start_time=time_v[starts],
+                   duration=time_v[lasts] - time_v[starts],
+                   soc=soc_v[starts],
+                   count=lasts - starts + 1)
+
+
+def concatenate_runs(runs_list):
+    """ Concatenates the runs of consecutive parts of a log; a run split between parts is merged
+
+    :param runs_list: list of SoCRuns, in the order of the log
+    :return: SoCRuns
+    """
+    start_index = np.concatenate([runs.start_index for runs in runs_list])
+    start_time = np.concatenate([runs.start_time for runs in runs_list])
+    end_time = np.concatenate([runs.start_time + runs.duration for runs in runs_list])
+    soc = np.concatenate([runs.soc for runs in runs_list])
+    count = np.concatenate([runs.count for runs in runs_list])
+
+    # runs of a same value only follow each other at the boundaries of the parts
+    starts = np.concatenate(([0], np.flatnonzero(soc[1:] != soc[:-1]) + 1))
+    lasts = np.append(starts[1:], len(soc)) - 1
+
+    return SoCRuns(start_index=start_index[starts],
+                   start_time=start_time[starts],
+                   duration=end_time[lasts] - start_time[starts],
+                   soc=soc[starts],
+                   count=np.add.reduceat(count, starts))
@@ -24,10 +24,10 @@ Comments:  - S_ref is defined in the code, and should be around 40-50% SoC
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-from pandas import read_csv
-from degradation_model.degradation_model import nonlinear_cal_model, residuals_nonlinear_cal_model, soc_stress_model
-from lmfit import minimize, Parameters, fit_report
+from degradation_model.data_io import read_calendar_data
+from degradation_model.degradation_model import residuals_nonlinear_cal_model
+from degradation_model.parallel_fit import bootstrap_tasks, run_fit_tasks, refit_changed, fit_calendar_curve
+from lmfit import Parameters, fit_report
 
 
 class SoCStressModelFit:
@@ -35,30 +35,31 @@ class SoCStressModelFit:
     colors = ['red', 'blue', 'green', 'orange', 'purple', 'black', 'grey', 'brown']
 
     def __init__(self, data_file_path, alpha_sei=5.87e-02, beta_sei=1.06e+02):
-        df_cal_data = read_csv(data_file_path)
+        self.t_data, self.SoH_op_data, self.SoH_data = self.read_data(data_file_path)
 
-        self.t_data = df_cal_data['time[year]']
-
-        # extracts the SoH from the columns' name
-        self.SoH_op_data = [int(x.split('=')[1][:-1]) for x in df_cal_data.columns[1:]]
-
-        self.number_of_SoC = len(df_cal_data.columns) - 1  # count the number of SoC at which we have data
+        self.number_of_SoC = len(self.SoH_op_data)  # count the number of SoC at which we have data
 
         self.alpha_sei = alpha_sei
         self.beta_sei = beta_sei
 
-        self.SoH_data = []
         self.params = Parameters()
 
-        for i in range(1, self.number_of_SoC + 1):  # the first column is skipped (that's the time in year)
-            self.SoH_data.append(df_cal_data.iloc[:, i])
-
         self.list_deg_per_time_unit = []
+        self.opt_param_sets = []
         self.k_SoC = []
 
         self.least_square_fit()
         self.print_results()
 
+    @staticmethod
+    def read_data(data_file_path):
+        """
+
+        :param data_file_path: path of the calendar data file
+        :return: tuple (time in year, list of SoC in %, list of the remaining capacity series at each SoC)
+        """
+        return read_calendar_data(data_file_path)
+
     def least_square_fit(self):
 
         self.params.add('alpha_sei', value=self.alpha_sei, vary=False)
@@ -67,60 +68,104 @@ class SoCStressModelFit:
 
         # least square algorithm
         for i in range(0, self.number_of_SoC):
-            deg_per_cyc_i = minimize(fcn=residuals_nonlinear_cal_model,
-                                     params=self.params,
-                                     args=(self.t_data, self.SoH_data[i], 1),
-                                     method='least_squares')
-            self.list_deg_per_time_unit.append(deg_per_cyc_i.params['deg_per_time_unit'].value)
-
+            opt_params_i = self.fit_at_soc(self.t_data, self.SoH_data[i], self.params)
+            self.list_deg_per_time_unit.append(opt_params_i['deg_per_time_unit'].value)
+            self.opt_param_sets.append(opt_params_i)
+
+        self.calculate_k_SoC()
+
+    @staticmethod
+    def fit_at_soc(t_data, SoH_data_i, params):
+        """
+
+        :param t_data: time in year
+        :param SoH_data_i: remaining capacity over time at one state of charge
+        :param params: initial values of the parameters
+        :return: optimised parameters
+        """
+        return fit_calendar_curve(t_data, SoH_data_i, params)
+
+    def update(self, data_file_path):
+        """ Refits the model after observations have been appended to the data file.
+        Only the states of charge whose data changed are refitted, starting from their previous optimum;
+        states of charge which are new in the data file are fitted from the default initial values.
+
+        :param data_file_path: path of the updated data file
+        :return: list of the states of charge (in %) which have been refitted
+        """
+        t_data, SoH_op_data, SoH_data = self.read_data(data_file_path)
+
+        opt_param_sets, refitted = refit_changed(self.fit_at_soc, self.t_data, self.SoH_data, self.SoH_op_data,
+                                                 self.opt_param_sets, t_data, SoH_data, SoH_op_data, self.params)
+        list_deg_per_time_unit = [opt_params_i['deg_per_time_unit'].value for opt_params_i in opt_param_sets]
+
+        self.t_data = t_data
+        self.SoH_op_data = SoH_op_data
+        self.SoH_data = SoH_data
+        self.number_of_SoC = len(SoH_op_data)
+        self.list_deg_per_time_unit = list_deg_per_time_unit
+        self.opt_param_sets = opt_param_sets
+
+        if len(refitted) > 0:
+            self.calculate_k_SoC()
+            self.print_results()
+
+        return refitted
+
+    def calculate_k_SoC(self):
         # retrieves the index at which the reference temperature is stored in T
         index_SoH_REF = self.SoH_op_data.index(50)
 
+        k_SoC = []
         for i in [x for x in range(self.number_of_SoC) if x != index_SoH_REF]:
             k_SoC_i = np.log(self.list_deg_per_time_unit[i] / self.list_deg_per_time_unit[index_SoH_REF]) / (self.SoH_op_data[i]/100 - self.S_REF)
-            self.k_SoC.append(k_SoC_i)
+            k_SoC.append(k_SoC_i)
 
-        self.k_SoC = np.mean(self.k_SoC)  # average of the k_SoC coefficients to get a more precise value
+        self.k_SoC = np.mean(k_SoC)  # average of the k_SoC coefficients to get a more precise value
 
-    def plot_model(self, ax):
-        soc_linspace = np.linspace(0, 100, 500)
-        stress_model_soc = soc_stress_model(soc=soc_linspace / 100, k_soc=self.k_SoC, s_ref=self.S_REF)
+    def bootstrap(self, n_replicates=200, resampling='residuals', seed=None, processes=None):
+        """ Bootstrap of the calendar fits at each state of charge, warm started from the point estimates.
+        k_SoC is recalculated for each replicate.
 
-        ax.plot(soc_linspace, stress_model_soc, 'b-')
+        :param n_replicates: number of bootstrap replicates
+        :param resampling: either 'residuals' or 'pairs'
+        :param seed: seed of the resampling
+        :param processes: number of worker processes; None uses all the cores
+        :return: dictionary with the (n_replicates x number of SoC) array of deg_per_time_unit samples
+                 and the array of k_SoC samples
+        """
+        rng = np.random.default_rng(seed)
 
-        ax.set_xlabel('State of Charge [%]')
-        ax.set_ylabel('Stress')
-        ax.set_title('State of Charge stress model')
+        tasks = []
+        for i in range(0, self.number_of_SoC):
+            tasks += bootstrap_tasks(residuals=residuals_nonlinear_cal_model,
+                                     params=self.opt_param_sets[i],
+                                     x=self.t_data,
+                                     y=self.SoH_data[i],
+                                     n_replicates=n_replicates,
+                                     resampling=resampling,
+                                     seed=rng)
 
-        # plt.title('State of charge stress model')
-        plt.tight_layout()  # without it, the text overlap
-        plt.draw()
+        samples = run_fit_tasks(tasks, processes=processes)
 
-    def plot_SEI_fit_at_T(self, ax):
-        t_linspace = np.linspace(self.t_data.min(), self.t_data.max(), 100)
+        index_deg = list(self.params).index('deg_per_time_unit')
+        deg_per_time_unit = np.transpose(np.reshape(samples[:, index_deg], (self.number_of_SoC, n_replicates)))
 
-        for i in range(0, len(self.list_deg_per_time_unit)):
-            model = nonlinear_cal_model(t=t_linspace,
-                                        alpha_sei=self.params['alpha_sei'],
-                                        beta_sei=self.params['beta_sei'],
-                                        deg_per_time_unit=self.list_deg_per_time_unit[i])
-            label = 'SoC=' + str(self.SoH_op_data[i]) + '%'
+        index_SoH_REF = self.SoH_op_data.index(50)
+        others = [x for x in range(self.number_of_SoC) if x != index_SoH_REF]
+        k_SoC = np.log(deg_per_time_unit[:, others] / deg_per_time_unit[:, [index_SoH_REF]]) \
+            / (np.array(self.SoH_op_data)[others] / 100 - self.S_REF)
 
-            ax.plot(t_linspace, 100 * (1 - model), 'r-', label=label, color=self.colors[i])
-            ax.plot(self.t_data, 100 * self.SoH_data[i], 'kx', label='')
+        return {'deg_per_time_unit': deg_per_time_unit, 'k_SoC': np.mean(k_SoC, axis=1)}
 
-        ax.set_xlabel('t [year]')
-        ax.set_ylabel('State of charge [%]')
-        ax.set_ylim([None, 100])
-        ax.set_xlim([0, None])
-        ax.set_title('Calendar degradation at 25°C')
+    def plot_model(self, ax):
+        from degradation_model.plotting import plot_soc_stress_model
+        plot_soc_stress_model(self, ax)
 
-        # plt.title('Calendar degradation fit')
-        plt.legend()
-        plt.tight_layout()  # without it, the text overlap
-        plt.draw()
+    def plot_SEI_fit_at_T(self, ax):
+        from degradation_model.plotting import plot_soc_SEI_fit
+        plot_soc_SEI_fit(self, ax)
 
     def print_results(self):
         print('---- SoC stress model -----------')
         print("k_SoC = " + '{:.2e}'.format(self.k_SoC))
-
@@ -1,55 +1,64 @@
 # -*- coding: UTF-8 -*-
 
-""" This module enables to plot the calendar and cycle stress function as a function of SoC and temperature """
+""" This module enables to calculate the calendar and cycle stress function as a function of SoC and temperature
 
-from matplotlib import cm
-from matplotlib import pyplot as plt
-from mpl_toolkits.mplot3d import axes3d, Axes3D
+The stress surface is evaluated by broadcasting the stress models over the state of charge and temperature axes,
+and cached by its inputs, so that the same high resolution surface isn't calculated twice.
+It is plotted by surface_stress_plot, in degradation_model/plotting.py, which is also available from this module
+without importing matplotlib along with it.
+"""
+
+from functools import lru_cache
 from degradation_model.degradation_model import voltage_stress_model, soc_stress_model, temp_stress_model
 
 import numpy as np
+import sys
 
+CHEMISTRIES = ('NMC', 'LMO', 'LFP')
 
-def stress_function(soc, temp, include_voltage_stress):
-    if include_voltage_stress:
-        stress = voltage_stress_model(soc) * soc_stress_model(soc) * temp_stress_model(temp)
-    else:
-        stress = voltage_stress_model(0) * soc_stress_model(soc) * temp_stress_model(temp)
-    return stress
 
+def stress_grid(soc_axis, temp_axis, chemistry='NMC', include_voltage_stress=False):
+    """ Stress surface over a grid of states of charge and temperatures
 
-def function_of_meshgrid(X, Y, include_voltage_stress, K):
-    gram_matrix = np.zeros((X.shape[0], Y.shape[1]))
+    :param soc_axis: states of charge (between 0 and 1)
+    :param temp_axis: temperatures in °C
+    :param chemistry: either NMC, LMO or LFP; the stress models currently share the same parameters
+                      for all chemistries, the chemistry is checked and is part of the cache key
+    :param include_voltage_stress: if True, the cycle stress (including the voltage stress) is calculated,
+                                   otherwise the calendar stress
+    :return: read-only (len(temp_axis) x len(soc_axis)) array of stress, with the same layout as
+             np.meshgrid(soc_axis, temp_axis)
+    """
+    if chemistry not in CHEMISTRIES:
+        sys.exit('The chemistry input of stress_grid isn''t valid')
 
-    for i, x in enumerate(X):
-        for j, y in enumerate(np.matrix.transpose(Y)):
-            gram_matrix[i, j] = K(x[j], y[i], include_voltage_stress)
-    return gram_matrix
+    soc_axis = np.ascontiguousarray(soc_axis, dtype=float)
+    temp_axis = np.ascontiguousarray(temp_axis, dtype=float)
 
+    # arrays aren't hashable, their bytes are used as cache key
+    return _stress_grid(soc_axis.tobytes(), temp_axis.tobytes(), chemistry, bool(include_voltage_stress))
 
-def surface_stress_plot(ax, include_voltage_stress):
 
-    # axes definition
-    soc = np.arange(0, 100, 1)
-    temp = np.arange(-5, 50, 1)
-    soc_mesh, temp_mesh = np.meshgrid(soc, temp)
+@lru_cache(maxsize=32)
+def _stress_grid(soc_bytes, temp_bytes, chemistry, include_voltage_stress):
+    soc = np.frombuffer(soc_bytes)[np.newaxis, :]
+    temp = np.frombuffer(temp_bytes)[:, np.newaxis]
 
-    # stress calculation
-    stress_surface = function_of_meshgrid(soc_mesh/100, temp_mesh, include_voltage_stress, stress_function)
+    stress = stress_function(soc, temp, include_voltage_stress)
+    stress = np.broadcast_to(stress, (temp.shape[0], soc.shape[1])).copy()
 
-    # Plot the surface.
-    ax.plot_surface(soc_mesh, temp_mesh, stress_surface, cmap=cm.jet, rstride=1, cstride=1)
+    stress.flags.writeable = False  # the cached array is shared between the callers
+    return stress
 
-    # Adjust the viewing angle.
-    ax.view_init(elev=5.0, azim=230.0)
 
-    ax.set_xlabel('State of charge [%]')
-    ax.set_ylabel('Temperature [°C]')
+def stress_function(soc, temp, include_voltage_stress):
     if include_voltage_stress:
-        ax.set_zlabel('$S_{cyc}(\sigma, T) = S_\sigma(\sigma).S_T(T).S_V(\sigma)$', rotation=90)
+        stress = voltage_stress_model(soc) * soc_stress_model(soc) * temp_stress_model(temp)
     else:
-        ax.set_zlabel('$S_{cal}(\sigma, T) = S_\sigma(\sigma).S_T(T)$', rotation=90)
+        stress = voltage_stress_model(0) * soc_stress_model(soc) * temp_stress_model(temp)
+    return stress
 
-    ax.zaxis.set_rotate_label(False)  # disable automatic rotation
-    # fig.colorbar(surf, shrink=0.5, aspect=5)
 
+def surface_stress_plot(ax, include_voltage_stress):
+    from degradation_model.plotting import surface_stress_plot
+    surface_stress_plot(ax, include_voltage_stress)
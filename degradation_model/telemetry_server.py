@@ -0,0 +1,310 @@
+# -*- coding: UTF-8 -*-
+
+"""
+asyncio server ingesting the telemetry of many batteries and answering state of health queries.
+
+Each battery has a DegradationTracker. The clients send lines of ASCII text over TCP or a Unix socket:
+- SAMPLE <battery_id> <timestamp> <soc> <temperature>   no answer (unless the line is invalid)
+- OPEN <battery_id> <chemistry>                          -> OK <battery_id>
+- QUERY <battery_id>                                     -> SOH <battery_id> <soh> <linearised> <cal> <cyc> <samples>
+- STATS                                                  -> STATS <key>=<value> ...
+Errors are answered with ERR <message>. The timestamp is in second, the state of charge in %
+and the temperature in °C. A battery which isn't opened uses the chemistry of the server.
+
+The event loop only parses the lines: the samples are appended to per battery buffers,
+and a consumer task hands all the buffered samples over to a single worker thread,
+which updates the trackers. The samples received while the worker is busy make the next batch,
+so that the batches grow with the load.
+
+Backpressure: when more than max_pending samples are waiting for the worker, the connections stop
+reading their socket until the worker catches up, which in turn slows the clients down (TCP flow control).
+
+A query waits until the samples of its battery received before it are processed, so that it reflects every
+sample sent beforehand on the same connection, without waiting for the backlog of the other batteries.
+
+The lines longer than the limit of the stream reader (64 kB) are skipped and answered with an error.
+So are the samples with a value which isn't finite, or a timestamp which isn't later than the last
+sample of their battery, since they would corrupt the degradation of the battery for good.
+An open battery without samples has the state of health of a new cell.
+
+Usage, from the root of the project:
+    $ python -m degradation_model.telemetry_server --port 8765
+and, to drive it with synthetic telemetry:
+    $ python -m benchmarks.telemetry_client --port 8765 --batteries 100
+"""
+
+import argparse
+import asyncio
+import math
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from degradation_model.degradation_tracker import DegradationTracker
+
+
+class TelemetryServer:
+    def __init__(self, chemistry='NMC', delta=0.1, max_pending=100000):
+        """
+
+        :param chemistry: chemistry of the batteries which aren't opened with another one
+        :param delta: hysteresis of the peak detection, in % of state of charge
+        :param max_pending: number of samples waiting for the worker above which the connections stop reading
+        """
+        self.chemistry = chemistry
+        self.delta = delta
+        self.max_pending = max_pending
+
+        self.trackers = {}  # battery id -> DegradationTracker, only used by the worker thread
+        self.chemistries = {}  # battery id -> chemistry
+        self.battery_ids = set()  # batteries opened or sending samples, only used by the event loop
+        self.pending = {}  # battery id -> (timestamps, socs, temperatures) lists
+        self.n_pending = 0
+        self.battery_received = {}  # battery id -> number of samples received
+        self.battery_processed = {}  # battery id -> number of samples processed
+        self.last_timestamps = {}  # battery id -> timestamp of the last sample received
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.data_ready = None
+        self.processed = None
+
+        # metrics
+        self.start_time = time.perf_counter()
+        self.n_received = 0
+        self.n_processed = 0
+        self.n_batches = 0
+        self.n_queries = 0
+        self.query_time = 0.
+        self.max_query_time = 0.
+        self.n_backpressure = 0
+        self.n_connections = 0
+        self.n_errors = 0
+
+    # -------- worker thread --------------------------------------------
+
+    def process_batch(self, batch):
+        """ Updates the trackers with a batch of samples. Runs in the worker thread.
+
+        :param batch: dictionary battery id -> (timestamps, socs, temperatures) lists
+        """
+        for battery_id, (timestamps, socs, temperatures) in batch.items():
+            tracker = self.trackers.get(battery_id)
+            if tracker is None:
+                tracker = DegradationTracker(self.chemistries.get(battery_id, self.chemistry), delta=self.delta)
+                self.trackers[battery_id] = tracker
+            tracker.update_many(timestamps, socs, temperatures)
+
+    def query_tracker(self, battery_id):
+        """ Runs in the worker thread, so that the tracker isn't read while it is updated """
+        tracker = self.trackers.get(battery_id)
+        if tracker is None:
+            return None
+        cal_degradation, cyc_degradation = tracker.degradation()
+        return tracker.soh(), cal_degradation + cyc_degradation, cal_degradation, cyc_degradation, tracker.n_samples
+
+    # -------- event loop -----------------------------------------------
+
+    async def consume(self):
+        """ Hands the buffered samples over to the worker thread, batch after batch """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.data_ready.wait()
+            self.data_ready.clear()
+
+            batch = self.pending
+            n_batch = self.n_pending
+            self.pending = {}
+            self.n_pending = 0
+
+            try:
+                await loop.run_in_executor(self.executor, self.process_batch, batch)
+            except Exception as error:
+                # the samples of the batch are lost, but the server keeps running
+                self.n_errors += 1
+                print('Batch of {} samples failed: {!r}'.format(n_batch, error))
+
+            self.n_processed += n_batch
+            self.n_batches += 1
+            for battery_id, buffers in batch.items():
+                self.battery_processed[battery_id] = self.battery_processed.get(battery_id, 0) + len(buffers[0])
+            async with self.processed:
+                self.processed.notify_all()
+
+    async def wait_processed(self, n_received):
+        """ Waits until the first n_received samples are processed """
+        async with self.processed:
+            await self.processed.wait_for(lambda: self.n_processed >= n_received)
+
+    async def wait_battery_processed(self, battery_id, n_received):
+        """ Waits until the first n_received samples of a battery are processed """
+        async with self.processed:
+            await self.processed.wait_for(lambda: self.battery_processed.get(battery_id, 0) >= n_received)
+
+    def add_sample(self, fields):
+        battery_id = fields[1]
+        sample = (float(fields[2]), float(fields[3]), float(fields[4]))
+        if not all(math.isfinite(x) for x in sample):
+            raise ValueError('the timestamp, state of charge and temperature must be finite')
+        last_timestamp = self.last_timestamps.get(battery_id)
+        if last_timestamp is not None and sample[0] <= last_timestamp:
+            raise ValueError('the timestamp must be later than the last one of battery {} ({!r})'.format(
+                battery_id, last_timestamp))
+        self.last_timestamps[battery_id] = sample[0]
+
+        buffers = self.pending.get(battery_id)
+        if buffers is None:
+            buffers = ([], [], [])
+            self.pending[battery_id] = buffers
+            self.battery_ids.add(battery_id)
+        buffers[0].append(sample[0])
+        buffers[1].append(sample[1])
+        buffers[2].append(sample[2])
+
+        self.n_pending += 1
+        self.n_received += 1
+        self.battery_received[battery_id] = self.battery_received.get(battery_id, 0) + 1
+        self.data_ready.set()
+
+    async def query(self, battery_id):
+        t0 = time.perf_counter()
+
+        await self.wait_battery_processed(battery_id, self.battery_received.get(battery_id, 0))
+        result = await asyncio.get_running_loop().run_in_executor(self.executor, self.query_tracker, battery_id)
+
+        elapsed = time.perf_counter() - t0
+        self.n_queries += 1
+        self.query_time += elapsed
+        self.max_query_time = max(self.max_query_time, elapsed)
+
+        if result is None:
+            if battery_id not in self.battery_ids:
+                return 'ERR unknown battery ' + battery_id
+            result = (1., 0., 0., 0., 0)  # open battery without samples
+        # repr gives the shortest string which reads back as the same float
+        return 'SOH {} {!r} {!r} {!r} {!r} {}'.format(battery_id, *[float(x) for x in result[:4]], result[4])
+
+    def stats(self):
+        """
+
+        :return: dictionary of the throughput metrics
+        """
+        elapsed = time.perf_counter() - self.start_time
+        return {'uptime_s': round(elapsed, 3),
+                'connections': self.n_connections,
+                'batteries': len(self.battery_ids),
+                'received': self.n_received,
+                'processed': self.n_processed,
+                'pending': self.n_pending,
+                'batches': self.n_batches,
+                'mean_batch': round(self.n_processed / self.n_batches, 1) if self.n_batches > 0 else 0,
+                'throughput_per_s': round(self.n_processed / elapsed, 1) if elapsed > 0 else 0,
+                'queries': self.n_queries,
+                'mean_query_ms': round(1000 * self.query_time / self.n_queries, 3) if self.n_queries > 0 else 0,
+                'max_query_ms': round(1000 * self.max_query_time, 3),
+                'backpressure_waits': self.n_backpressure,
+                'errors': self.n_errors}
+
+    @staticmethod
+    async def read_line(reader):
+        """
+
+        :return: next line of the stream (empty at its end), or None if the line is longer than the limit
+                 of the reader, in which case the line is skipped
+        """
+        too_long = False
+        while True:
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError as error:
+                line = error.partial
+            except asyncio.LimitOverrunError as error:
+                # the bytes of the line before the limit are skipped, until the end of the line
+                too_long = True
+                await reader.readexactly(error.consumed)
+                continue
+            return None if too_long else line
+
+    async def handle_connection(self, reader, writer):
+        self.n_connections += 1
+        try:
+            while True:
+                line = await self.read_line(reader)
+                if line is None:
+                    self.n_errors += 1
+                    writer.write(b'ERR line too long\n')
+                    await writer.drain()
+                    continue
+                if not line:
+                    break
+
+                fields = line.decode('ascii', errors='replace').split()
+                if len(fields) == 0:
+                    continue
+
+                command = fields[0].upper()
+                try:
+                    if command == 'SAMPLE' and len(fields) == 5:
+                        self.add_sample(fields)
+                        if self.n_pending >= self.max_pending:
+                            # stops reading the socket until the worker catches up
+                            self.n_backpressure += 1
+                            await self.wait_processed(self.n_received - self.max_pending // 2)
+                        continue
+                    elif command == 'QUERY' and len(fields) == 2:
+                        answer = await self.query(fields[1])
+                    elif command == 'OPEN' and len(fields) == 3:
+                        if fields[2] not in ('NMC', 'LMO', 'LFP'):
+                            raise ValueError('the chemistry must be either NMC, LMO or LFP')
+                        if fields[1] in self.battery_ids:
+                            raise ValueError('battery ' + fields[1] + ' is already open')
+                        self.chemistries[fields[1]] = fields[2]
+                        self.battery_ids.add(fields[1])
+                        answer = 'OK ' + fields[1]
+                    elif command == 'STATS' and len(fields) == 1:
+                        answer = 'STATS ' + ' '.join('{}={}'.format(k, v) for k, v in self.stats().items())
+                    else:
+                        raise ValueError('invalid command: ' + ' '.join(fields))
+                except ValueError as error:
+                    self.n_errors += 1
+                    answer = 'ERR ' + str(error)
+
+                writer.write((answer + '\n').encode('ascii', errors='replace'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.n_connections -= 1
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.data_ready = asyncio.Event()
+        self.processed = asyncio.Condition()
+        consumer = asyncio.ensure_future(self.consume())
+
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            consumer.cancel()
+            self.executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Telemetry ingestion and state of health server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='path of a Unix socket, used instead of TCP')
+    parser.add_argument('--chemistry', default='NMC', choices=['NMC', 'LMO', 'LFP'])
+    parser.add_argument('--delta', type=float, default=0.1)
+    parser.add_argument('--max-pending', type=int, default=100000)
+    args = parser.parse_args()
+
+    telemetry_server = TelemetryServer(chemistry=args.chemistry, delta=args.delta, max_pending=args.max_pending)
+    try:
+        asyncio.run(telemetry_server.serve(host=args.host, port=args.port, unix_path=args.unix))
+    except KeyboardInterrupt:
+        pass
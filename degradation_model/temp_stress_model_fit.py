@@ -25,10 +25,10 @@ Comments:  - T_ref is defined in the code, and should be around 20-25°C
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
-from pandas import read_csv
-from lmfit import minimize, Parameters, fit_report
-from degradation_model.degradation_model import nonlinear_cal_model, residuals_nonlinear_cal_model, temp_stress_model
+from lmfit import Parameters, fit_report
+from degradation_model.data_io import read_calendar_data
+from degradation_model.degradation_model import residuals_nonlinear_cal_model
+from degradation_model.parallel_fit import bootstrap_tasks, run_fit_tasks, refit_changed, fit_calendar_curve
 
 
 class TempStressModelFit:
@@ -41,27 +41,30 @@ class TempStressModelFit:
         self.beta_sei = beta_sei
 
         # data importation
-        df_cal_data = read_csv(data_file_path)
+        t_data, T_op_data, SoH_data = self.read_data(data_file_path)
 
-        T_op_data = [int(x.split('=')[1]) for x in df_cal_data.columns[1:]]
-        # extracts the temperatures from the columns' name
+        self.number_of_temp = len(T_op_data)  # count the number of temperature at which we have data
 
-        self.number_of_temp = len(df_cal_data.columns) - 1  # count the number of temperature at which we have data
-
-        SoH_data = []
-        for i in range(1, self.number_of_temp + 1):  # the first column is skipped (that's the time in year)
-            SoH_data.append(df_cal_data.iloc[:, i])
-
-        self.t_data = df_cal_data['time[year]']
+        self.t_data = t_data
         self.T_op_data = T_op_data
         self.SoH_data = SoH_data
         self.k_T = []
         self.list_deg_per_time_unit = []
+        self.opt_param_sets = []
         self.params = Parameters()
 
         self.least_square_fit()
         self.print_results()
 
+    @staticmethod
+    def read_data(data_file_path):
+        """
+
+        :param data_file_path: path of the calendar data file
+        :return: tuple (time in year, list of temperatures, list of the remaining capacity series at each temperature)
+        """
+        return read_calendar_data(data_file_path)
+
     def least_square_fit(self):
 
         self.params.add('alpha_sei', value=self.alpha_sei, vary=False)
@@ -70,13 +73,51 @@ class TempStressModelFit:
 
         # least square algorithm
         for i in range(0, self.number_of_temp):
-            deg_per_time_unit_i = minimize(fcn=residuals_nonlinear_cal_model,
-                                           params=self.params,
-                                           args=(self.t_data, self.SoH_data[i], 1),
-                                           # nan_policy='omit',
-                                           method='least_squares')
-            self.list_deg_per_time_unit.append(deg_per_time_unit_i.params['deg_per_time_unit'].value)
+            opt_params_i = self.fit_at_temperature(self.t_data, self.SoH_data[i], self.params)
+            self.list_deg_per_time_unit.append(opt_params_i['deg_per_time_unit'].value)
+            self.opt_param_sets.append(opt_params_i)
+
+        self.calculate_k_T()
+
+    @staticmethod
+    def fit_at_temperature(t_data, SoH_data_i, params):
+        """
+
+        :param t_data: time in year
+        :param SoH_data_i: remaining capacity over time at one temperature
+        :param params: initial values of the parameters
+        :return: optimised parameters
+        """
+        return fit_calendar_curve(t_data, SoH_data_i, params)
+
+    def update(self, data_file_path):
+        """ Refits the model after observations have been appended to the data file.
+        Only the temperatures whose data changed are refitted, starting from their previous optimum;
+        temperatures which are new in the data file are fitted from the default initial values.
+
+        :param data_file_path: path of the updated data file
+        :return: list of the temperatures which have been refitted
+        """
+        t_data, T_op_data, SoH_data = self.read_data(data_file_path)
+
+        opt_param_sets, refitted = refit_changed(self.fit_at_temperature, self.t_data, self.SoH_data, self.T_op_data,
+                                                 self.opt_param_sets, t_data, SoH_data, T_op_data, self.params)
+        list_deg_per_time_unit = [opt_params_i['deg_per_time_unit'].value for opt_params_i in opt_param_sets]
+
+        self.t_data = t_data
+        self.T_op_data = T_op_data
+        self.SoH_data = SoH_data
+        self.number_of_temp = len(T_op_data)
+        self.list_deg_per_time_unit = list_deg_per_time_unit
+        self.opt_param_sets = opt_param_sets
+
+        if len(refitted) > 0:
+            self.calculate_k_T()
+            self.print_results()
+
+        return refitted
 
+    def calculate_k_T(self):
         index_T_REF = self.T_op_data.index(25)  # retrieve the index at which the reference temperature is stored in T
 
         k_T = []
@@ -86,47 +127,49 @@ class TempStressModelFit:
 
         self.k_T = np.mean(k_T)  # average of the k_T coefficients to get a more precise value
 
-    def plot_model(self, ax):
-        T_linspace = np.linspace(-20, 60, 100)
-        stress_model_T = temp_stress_model(T=T_linspace, k_T=self.k_T, T_ref=self.T_REF)
+    def bootstrap(self, n_replicates=200, resampling='residuals', seed=None, processes=None):
+        """ Bootstrap of the calendar fits at each temperature, warm started from the point estimates.
+        k_T is recalculated for each replicate.
 
-        ax.plot(T_linspace, stress_model_T, 'b-')
-        ax.set_xlabel('Temperature [°C]')
-        ax.set_ylabel('Stress')
-        ax.set_title('Temperature stress model')
+        :param n_replicates: number of bootstrap replicates
+        :param resampling: either 'residuals' or 'pairs'
+        :param seed: seed of the resampling
+        :param processes: number of worker processes; None uses all the cores
+        :return: dictionary with the (n_replicates x number of temperatures) array of deg_per_time_unit samples
+                 and the array of k_T samples
+        """
+        rng = np.random.default_rng(seed)
 
-        # plt.title('Temperature Stress model')
-        plt.tight_layout()  # without it, the text overlap
-        plt.draw()
+        tasks = []
+        for i in range(0, self.number_of_temp):
+            tasks += bootstrap_tasks(residuals=residuals_nonlinear_cal_model,
+                                     params=self.opt_param_sets[i],
+                                     x=self.t_data,
+                                     y=self.SoH_data[i],
+                                     n_replicates=n_replicates,
+                                     resampling=resampling,
+                                     seed=rng)
 
-    def plot_SEI_fit_at_T(self, ax):
-        t_linspace = np.linspace(self.t_data.min(), self.t_data.max(), 100)
+        samples = run_fit_tasks(tasks, processes=processes)
 
-        for i in range(0, len(self.list_deg_per_time_unit)):
-            model = nonlinear_cal_model(t=t_linspace,
-                                        alpha_sei=self.params['alpha_sei'],
-                                        beta_sei=self.params['beta_sei'],
-                                        deg_per_time_unit=self.list_deg_per_time_unit[i])
-            label = 'T=' + str(self.T_op_data[i]) + '°C'
+        index_deg = list(self.params).index('deg_per_time_unit')
+        deg_per_time_unit = np.transpose(np.reshape(samples[:, index_deg], (self.number_of_temp, n_replicates)))
 
-            ax.plot(t_linspace, 100*(1-model), 'r-', label=label, color=self.colors[i])
+        index_T_REF = self.T_op_data.index(self.T_REF)
+        others = [x for x in range(self.number_of_temp) if x != index_T_REF]
+        k_T = np.log(deg_per_time_unit[:, others] / deg_per_time_unit[:, [index_T_REF]]) \
+            / (np.array(self.T_op_data)[others] - self.T_REF)
 
-            ax.plot(self.t_data, 100*self.SoH_data[i], 'kx', label='')
+        return {'deg_per_time_unit': deg_per_time_unit, 'k_T': np.mean(k_T, axis=1)}
 
-        ax.set_xlabel('t [year]')
-        ax.set_ylabel('State of charge [%]')
-        ax.set_ylim([None, 100])
-        ax.set_xlim([0, None])
-        ax.set_title('Calendar degradation at 50% SoC')
+    def plot_model(self, ax):
+        from degradation_model.plotting import plot_temp_stress_model
+        plot_temp_stress_model(self, ax)
 
-        # plt.title('Calendar degradation fit')
-        plt.legend()
-        plt.tight_layout()  # without it, the text overlap
-        plt.draw()
+    def plot_SEI_fit_at_T(self, ax):
+        from degradation_model.plotting import plot_temp_SEI_fit
+        plot_temp_SEI_fit(self, ax)
 
     def print_results(self):
         print('---- Temperature stress model ---')
         print("k_T = " + '{:.2e}'.format(self.k_T))
-
-
-
@@ -0,0 +1,197 @@
+# -*- coding: UTF-8 -*-
+
+"""
+This module computes the temperature of a cell from its C-rate profile (lumped thermal model), so that the
+temperature stress of the degradation model follows the power of the profile instead of a fixed temperature.
+
+The cell is a lumped thermal capacitance heated by its Joule losses and cooled by the ambient:
+    m c dT/dt = R I^2 - hA (T - T_ambient),    I = C-rate * capacity
+Over each time step, the C-rate and the ambient temperature are held (zero order hold), which gives the
+exact recurrence
+    T[k] = a[k] T[k-1] + (1 - a[k]) T_eq[k],   a[k] = exp(-dt[k] / tau),   tau = m c / hA
+where T_eq = T_ambient + R I^2 / hA is the steady state temperature. The recurrence is solved without a loop
+over the time steps (linear_recurrence), by blocks of closed form cumulative sums.
+
+The default parameters are the ones of a typical 18650 cell (2.5 Ah, 20 mOhm, 45 g) in natural convection.
+
+thermal_degradation_model is final_degradation_model at the cell temperature:
+- the temperature stress of each cycle is the one of the mean temperature of the samples of the cycle
+- the calendar stress (state of charge and temperature stress) is integrated over time, as by
+  integrated_cal_degradation_model; the time model being linear in time, the integral over the profile is
+  scaled to the calendar time when the profile is repeated
+Over one profile, it gives the degradation of final_degradation_model(..., gap_policy='interpolate') with the
+cell temperature.
+"""
+
+import numpy as np
+import sys
+
+from degradation_model.cycle_counting_algorithm import CycleCounter
+from degradation_model.degradation_model import cyc_degradation_model, cycle_temperature, \
+                                                integrated_cal_degradation_model, soc_stress_model, \
+                                                temp_stress_model, time_deg_model
+
+KELVIN = 273.15
+
+MAX_DECAY = 36.  # exp(-36) is below the machine epsilon: the older terms don't contribute further
+BLOCK_EXPONENT = 600.  # largest exponent of the closed form of a block, so that exp doesn't overflow
+BLOCK_SIZE = 4096
+
+DEFAULT_THERMAL = {'capacity': 2.5,  # Ah
+                   'resistance': 0.02,  # Ohm
+                   'mass': 0.045,  # kg
+                   'specific_heat': 1000.,  # J/(kg K)
+                   'h_area': 0.1}  # W/K, heat transfer coefficient times the surface of the cell
+
+
+def linear_recurrence(log_a, b, x0=0.):
+    """ Solves x[k] = exp(log_a[k]) * x[k-1] + b[k], with x[-1] = x0
+
+    The steps are split into blocks, whose solution is the closed form
+        x[k] = exp(S[k]) * (x_start + cumsum(b * exp(-S))[k]),   S = cumsum(log_a)
+    computed for all the blocks at once; the starts of the blocks are the solution of the same recurrence
+    over the blocks. The cumulative sums are accurate when the b have a constant sign.
+
+    :param log_a: array of the logarithms of the coefficients (negative or zero)
+    :param b: array of the inputs
+    :param x0: initial value
+    :return: array x
+    """
+    log_a = np.maximum(np.asarray(log_a, dtype=float), -MAX_DECAY)
+    b = np.asarray(b, dtype=float)
+    n = len(b)
+    if n == 0:
+        return np.empty(0)
+
+    decay = -np.min(log_a)
+    block_size = BLOCK_SIZE if decay * BLOCK_SIZE <= BLOCK_EXPONENT else max(int(BLOCK_EXPONENT // decay), 2)
+    n_blocks = -(-n // block_size)
+    pad = n_blocks * block_size - n
+
+    cumulative_log_a = np.cumsum(np.concatenate((log_a, np.zeros(pad))).reshape(n_blocks, block_size), axis=1)
+    decays = np.exp(cumulative_log_a)
+    local = decays * np.cumsum(np.concatenate((b, np.zeros(pad))).reshape(n_blocks, block_size)
+                               / decays, axis=1)
+
+    # value before each block
+    if n_blocks == 1:
+        starts = np.array([x0], dtype=float)
+    else:
+        ends = linear_recurrence(cumulative_log_a[:, -1], local[:, -1], x0)
+        starts = np.concatenate(([x0], ends[:-1]))
+
+    return (local + decays * starts[:, np.newaxis]).ravel()[:n]
+
+
+def cell_temperature(time_v, c_rate_v, T_ambient, T_initial=None, capacity=2.5, resistance=0.02, mass=0.045,
+                     specific_heat=1000., h_area=0.1):
+    """
+
+    :param time_v: time vector in second
+    :param c_rate_v: C-rate of each sample, held over the time step which ends at the sample
+    :param T_ambient: ambient temperature in °C, scalar or vector
+    :param T_initial: temperature of the cell at the first sample in °C (the ambient temperature if None)
+    :param capacity: capacity of the cell in Ah
+    :param resistance: internal resistance of the cell in Ohm
+    :param mass: mass of the cell in kg
+    :param specific_heat: specific heat capacity of the cell in J/(kg K)
+    :param h_area: heat transfer coefficient times the surface of the cell, in W/K
+    :return: temperature vector of the cell in °C
+    """
+    time_v = np.asarray(time_v, dtype=float)
+    c_rate_v = np.asarray(c_rate_v, dtype=float)
+    n = len(time_v)
+    if len(c_rate_v) != n:
+        sys.exit('The time and C-rate vectors must have the same length')
+    if n == 0:
+        return np.empty(0)
+    if min(mass, specific_heat, h_area) <= 0:
+        sys.exit('The mass, specific heat and heat transfer coefficient of the cell must be positive')
+
+    T_ambient = np.broadcast_to(np.asarray(T_ambient, dtype=float), (n,))
+    if T_initial is None:
+        T_initial = T_ambient[0]
+
+    dt = np.diff(time_v)
+    if np.any(dt < 0):
+        sys.exit('The timestamps must be increasing')
+
+    tau = mass * specific_heat / h_area
+    current = c_rate_v[1:] * capacity
+    T_eq = T_ambient[1:] + resistance * current ** 2 / h_area
+
+    # in kelvin, so that the inputs of the recurrence are positive
+    log_a = -dt / tau
+    temperature = linear_recurrence(log_a, -np.expm1(log_a) * (T_eq + KELVIN), T_initial + KELVIN) - KELVIN
+
+    return np.concatenate(([T_initial], temperature))
+
+
+def thermal_degradation_model(time_v, soc_v, c_rate_v, T_ambient, time, chemistry, delta=0.1, thermal=None,
+                              title=''):
+    """ final_degradation_model at the temperature of the cell given by its C-rate profile
+
+    :param time_v: time vector in second
+    :param soc_v: state of charge vector in %
+    :param c_rate_v: C-rate vector
+    :param T_ambient: ambient temperature in °C, scalar or vector
+    :param time: time in second of the calendar degradation (the profile being repeated)
+    :param chemistry: either NMC, LMO or LFP
+    :param delta: hysteresis of the peak detection in %
+    :param thermal: dictionary of the parameters of cell_temperature (DEFAULT_THERMAL if None)
+    :param title: title of the profile, see CycleCounter
+    :return: tuple (calendar degradation, cycling degradation, temperature vector of the cell in °C)
+    """
+    parameters = dict(DEFAULT_THERMAL)
+    parameters.update(thermal or {})
+    T_cell = cell_temperature(time_v, c_rate_v, T_ambient, **parameters)
+
+    cycle_counter = CycleCounter(time_v=time_v, soc_v=soc_v, delta=delta, title=title)
+    cycle_counter.rainflow_process()
+
+    # calendar degradation, with the calendar stress integrated over the profile, then repeated over time
+    time_v = np.asarray(time_v, dtype=float)
+    if time_v[-1] > time_v[0]:
+        cal_degradation = integrated_cal_degradation_model(time_v, soc_v, T_cell) * time / (time_v[-1] - time_v[0])
+    else:
+        stress = soc_stress_model(np.asarray(soc_v, dtype=float) / 100) * temp_stress_model(T_cell)
+        cal_degradation = time_deg_model(time) * np.mean(stress)
+
+    # cycling degradation, at the mean temperature of the samples of each cycle
+    arr_T = cycle_temperature(T_cell, cycle_counter.arr_start, cycle_counter.arr_end)
+    cyc_degradation = cyc_degradation_model(cycle_counter.arr_dod, cycle_counter.arr_n, cycle_counter.arr_soc_mean,
+                                            arr_T, chemistry)
+
+    return cal_degradation, cyc_degradation, T_cell
+
+
+if __name__ == '__main__':
+    # check of the recurrence against a loop, then cycling degradation of the DST profiles at a fixed temperature
+    # and at the cell temperature
+    from degradation_model.DST_cycle import dst_profile
+    from degradation_model.degradation_model import final_degradation_model
+
+    rng = np.random.default_rng(0)
+    for n, max_decay in ((1, 1.), (5000, 1e-3), (5000, 5.), (100000, 0.1)):
+        log_a = -rng.uniform(0, max_decay, n)
+        b = rng.uniform(0, 10, n)
+        expected = np.empty(n)
+        x = 300.
+        for k in range(n):
+            x = np.exp(log_a[k]) * x + b[k]
+            expected[k] = x
+        error = np.max(np.abs(linear_recurrence(log_a, b, 300.) - expected) / expected)
+        print('linear_recurrence, {} steps: max relative error {:.2e}'.format(n, error))
+        assert error < 1e-10
+
+    print('cycling degradation of one DST profile, ambient 25 °C:')
+    print('    range      fixed    thermal   max cell temperature')
+    for soc_min, soc_max in ((25, 100), (40, 100), (25, 85), (50, 100), (25, 75), (45, 75), (65, 75)):
+        time_v, soc_v, c_rate_v = dst_profile(soc_min, soc_max)
+        _, fixed = final_degradation_model(time_v, soc_v, 25, time_v[-1], 'NMC')
+        cal, thermal, T_cell = thermal_degradation_model(time_v, soc_v, c_rate_v, 25, time_v[-1] - time_v[0], 'NMC')
+        print('    {}-{}   {:.3e}  {:.3e}   {:.1f} °C'.format(soc_min, soc_max, fixed, thermal, np.max(T_cell)))
+
+        # same degradation as final_degradation_model with the vector of the cell temperatures
+        expected = final_degradation_model(time_v, soc_v, T_cell, None, 'NMC', gap_policy='interpolate')
+        assert np.allclose((cal, thermal), expected, rtol=1e-12, atol=0)
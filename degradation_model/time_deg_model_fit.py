@@ -13,31 +13,25 @@ Model: calendar_deg = time_deg_model(t) * soc_stress_model(SoC) * temp_stress_mo
 """
 
 import numpy as np
-from degradation_model.degradation_model import soc_stress_model, temp_stress_model, residuals_nonlinear_cal_model
-from lmfit import minimize, Parameters, fit_report
-from pandas import read_csv
+from degradation_model.degradation_model import soc_stress_model, temp_stress_model
+from degradation_model.data_io import read_calendar_data
+from degradation_model.parallel_fit import refit_changed, fit_calendar_curve
+from lmfit import Parameters
 
 class TimeDegModelFit:
     def __init__(self, data_file_path, alpha_sei=5.87e-02, beta_sei=1.06e+02):
         self.alpha_sei = alpha_sei
         self.beta_sei = beta_sei
 
-        df_cal_data = read_csv(data_file_path)
+        # same data format as the state of charge stress model
+        self.t_data, self.SoH_op_data, self.SoH_data = read_calendar_data(data_file_path)
 
-        self.t_data = df_cal_data['time[year]']
-
-        # extracts the SoH from the columns' name
-        self.SoH_op_data = [int(x.split('=')[1][:-1]) for x in df_cal_data.columns[1:]]
-
-        self.number_of_SoH = len(df_cal_data.columns) - 1  # count the number of SoH at which we have data
-
-        self.SoH_data = []
-        for i in range(1, self.number_of_SoH + 1):  # the first column is skipped (that's the time in year)
-            self.SoH_data.append(df_cal_data.iloc[:, i])
+        self.number_of_SoH = len(self.SoH_op_data)  # count the number of SoH at which we have data
 
         self.params = Parameters()
 
         self.deg_per_year = []
+        self.opt_param_sets = []
         self.list_k_t = []
         self.k_t = ''
 
@@ -51,18 +45,46 @@ class TimeDegModelFit:
         self.params.add('deg_per_time_unit', value=0.001, min=0, max=1)
 
         for i in range(0, self.number_of_SoH):
+            opt_params_i = fit_calendar_curve(self.t_data, self.SoH_data[i], self.params)
+
+            self.deg_per_year.append(opt_params_i['deg_per_time_unit'].value)
+            self.opt_param_sets.append(opt_params_i)
+
+        self.calculate_k_t()
+
+    def update(self, data_file_path):
+        """ Refits the model after observations have been appended to the data file.
+        Only the states of charge whose data changed are refitted, starting from their previous optimum.
 
-            deg_per_year_i = minimize(fcn=residuals_nonlinear_cal_model,
-                                      params=self.params,
-                                      args=(self.t_data, self.SoH_data[i], 1),
-                                      method='least_squares')
+        :param data_file_path: path of the updated data file
+        :return: list of the states of charge (in %) which have been refitted
+        """
+        t_data, SoH_op_data, SoH_data = read_calendar_data(data_file_path)
 
-            self.deg_per_year.append(deg_per_year_i.params['deg_per_time_unit'].value)
+        opt_param_sets, refitted = refit_changed(fit_calendar_curve, self.t_data, self.SoH_data, self.SoH_op_data,
+                                                 self.opt_param_sets, t_data, SoH_data, SoH_op_data, self.params)
+        deg_per_year = [opt_params_i['deg_per_time_unit'].value for opt_params_i in opt_param_sets]
 
+        self.t_data = t_data
+        self.SoH_op_data = SoH_op_data
+        self.SoH_data = SoH_data
+        self.number_of_SoH = len(SoH_op_data)
+        self.deg_per_year = deg_per_year
+        self.opt_param_sets = opt_param_sets
+
+        if len(refitted) > 0:
+            self.calculate_k_t()
+            self.print_results()
+
+        return refitted
+
+    def calculate_k_t(self):
+        self.list_k_t = []
+        for i in range(0, self.number_of_SoH):
             k_t_i = self.deg_per_year[i] / temp_stress_model(25) / soc_stress_model(self.SoH_op_data[i] / 100)
 
             self.list_k_t.append(k_t_i)
-            self.k_t = np.mean(self.list_k_t)
+        self.k_t = np.mean(self.list_k_t)
 
     def print_results(self):
         print('---- Time degradation model -----')
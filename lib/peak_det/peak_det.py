@@ -1,5 +1,8 @@
 import sys
-from numpy import NaN, Inf, arange, isscalar, asarray, array
+from array import array as typed_array
+from numpy import nan, inf, isscalar, asarray, array, empty, finfo, float32, float64, frombuffer
+
+CHUNK_SIZE = 100000  # number of samples converted at once to Python numbers
 
 
 def peakdet(v, delta, x=None):
@@ -26,16 +29,22 @@ def peakdet(v, delta, x=None):
     % Eli Billauer, 3.4.05 (Explicitly not copyrighted).
     % This function is released to the public domain; Any use is allowed.
 
+    The arrays have the float type of V when V is float32, so that the peaks of a float32 series
+    take half the memory, unless a position is too large to be exact in float32 (above 2**24).
+    Otherwise, they are float64.
+
     """
-    maxtab = []
-    mintab = []
+    v = asarray(v)
 
-    if x is None:
-        x = arange(len(v))
+    # the peaks are stored in typed arrays rather than lists of tuples, to bound the memory
+    typecode = 'f' if v.dtype == float32 else 'd'
+    maxpos, maxval = typed_array('d'), typed_array(typecode)
+    minpos, minval = typed_array('d'), typed_array(typecode)
 
-    v = asarray(v)
+    if x is not None:
+        x = asarray(x)
 
-    if len(v) != len(x):
+    if x is not None and len(v) != len(x):
         sys.exit('Input vectors v and x must have same length')
 
     if not isscalar(delta):
@@ -44,34 +53,121 @@ def peakdet(v, delta, x=None):
     if delta <= 0:
         sys.exit('Input argument delta must be positive')
 
-    mn, mx = Inf, -Inf
-    mnpos, mxpos = NaN, NaN
+    mn, mx = inf, -inf
+    mnpos, mxpos = nan, nan
 
     lookformax = True
 
-    for i in arange(len(v)):
-        this = v[i]
-        if this > mx:
-            mx = this
-            mxpos = x[i]
-        if this < mn:
-            mn = this
-            mnpos = x[i]
-
-        if lookformax:
-            if this < mx - delta:
-                maxtab.append((mxpos, mx))
-                mn = this
-                mnpos = x[i]
-                lookformax = False
+    # the samples are compared as Python numbers, which is faster than numpy scalars,
+    # and exact for float32 samples; they are converted by chunks to bound the memory
+    for first in range(0, len(v), CHUNK_SIZE):
+        values = v[first:first + CHUNK_SIZE].tolist()
+        if x is None:
+            positions = range(first, first + len(values))
         else:
-            if this > mn + delta:
-                mintab.append((mnpos, mn))
+            positions = x[first:first + CHUNK_SIZE].tolist()
+
+        for this, pos in zip(values, positions):
+            if this > mx:
                 mx = this
-                mxpos = x[i]
-                lookformax = True
+                mxpos = pos
+            if this < mn:
+                mn = this
+                mnpos = pos
+
+            if lookformax:
+                if this < mx - delta:
+                    maxpos.append(mxpos)
+                    maxval.append(mx)
+                    mn = this
+                    mnpos = pos
+                    lookformax = False
+            else:
+                if this > mn + delta:
+                    minpos.append(mnpos)
+                    minval.append(mn)
+                    mx = this
+                    mxpos = pos
+                    lookformax = True
+
+    dtype = float32 if typecode == 'f' else float64
+    if max(max(maxpos, default=0), max(minpos, default=0)) > 2 ** (finfo(float32).nmant + 1):
+        dtype = float64
+
+    return peak_table(maxpos, maxval, dtype), peak_table(minpos, minval, dtype)
+
+
+def peak_table(positions, values, dtype):
+    """
 
-    return array(maxtab), array(mintab)
+    :param positions: typed array of the positions of the peaks
+    :param values: typed array of the values of the peaks
+    :param dtype: float type of the table
+    :return: (number of peaks x 2) array of the positions and values
+    """
+    table = empty((len(values), 2), dtype=dtype)
+    table[:, 0] = frombuffer(positions, dtype=float64)
+    table[:, 1] = frombuffer(values, dtype=float32 if values.typecode == 'f' else float64)
+    return table
+
+
+class PeakDetector:
+    """
+    Incremental version of peakdet: the samples are given one by one,
+    and the peaks are returned as soon as peakdet would detect them.
+
+    Feeding all the samples of V to update gives the peaks of PEAKDET(V, DELTA), in the same order.
+    """
+
+    def __init__(self, delta):
+        if not isscalar(delta):
+            sys.exit('Input argument delta must be a scalar')
+
+        if delta <= 0:
+            sys.exit('Input argument delta must be positive')
+
+        self.delta = delta
+
+        self.mn, self.mx = inf, -inf
+        self.mnpos, self.mxpos = nan, nan
+
+        self.lookformax = True
+        self.index = 0  # position of the next sample, used when no position is given
+
+    def update(self, this, pos=None):
+        """
+
+        :param this: value of the new sample
+        :param pos: position of the new sample (its index in the series if None)
+        :return: None, or a tuple (position, value, is_max) of the detected peak
+        """
+        if pos is None:
+            pos = self.index
+        self.index += 1
+
+        if this > self.mx:
+            self.mx = this
+            self.mxpos = pos
+        if this < self.mn:
+            self.mn = this
+            self.mnpos = pos
+
+        if self.lookformax:
+            if this < self.mx - self.delta:
+                peak = (self.mxpos, self.mx, True)
+                self.mn = this
+                self.mnpos = pos
+                self.lookformax = False
+                return peak
+        else:
+            if this > self.mn + self.delta:
+                peak = (self.mnpos, self.mn, False)
+                self.mx = this
+                self.mxpos = pos
+                self.lookformax = True
+                return peak
+
+        return None
 
 
 if __name__ == "__main__":
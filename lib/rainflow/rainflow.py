@@ -43,12 +43,110 @@ Original c code notes:
 /*    the user can supply a the value of a partial damage cycle: uc_mult   */
 -------------------------------------------------------------------------------
 """
+from multiprocessing import Pool
 from numpy import fabs as fabs
 import numpy as np
+import os
+
+
+def rainflow_core(values, first, stop, a, ai, out, uc_mult=0.5, segment=0):
+    """ Rainflow counting of values[first:stop], without Goodman correction.
+        Shared by rainflow and rainflow_batch.
+
+        Args:
+            values (list): turning points, as a list of floats (faster to index than an array)
+            first (int): position of the first turning point to count
+            stop (int): position after the last turning point to count
+            a (list): temporary array of the algorithm, of length at least stop - first, reused between calls
+            ai (list): temporary array of the positions of the points of "a", same length as a
+            out (tuple): 6 lists to which the cycles are appended: load range, range mean, cycle count,
+                         position of the start, position of the end, segment
+
+        Keyword Args:
+            uc_mult (float): partial-load scaling [opt, default=0.5]
+            segment (int): segment id appended to the cycles [opt, default=0]
+    """
+    out_range, out_mean, out_count, out_start, out_end, out_segment = out
+
+    j = -1  # index of temporary array "a"
+
+    # loop through each turning point
+    for k in range(first, stop):
+
+        j += 1  # increment "a" counter
+        a[j] = values[k]  # put turning point into temporary array
+        ai[j] = k
+
+        while (j >= 2) and (abs(a[j - 1] - a[j - 2]) <= abs(a[j] - a[j - 1])):
+            lrange = abs(a[j - 1] - a[j - 2])
+
+            # partial range
+            if j == 2:
+                if lrange > 0:
+                    out_range.append(lrange)
+                    out_mean.append((a[0] + a[1]) / 2.)
+                    out_count.append(uc_mult)
+                    out_start.append(ai[0])
+                    out_end.append(ai[1])
+                    out_segment.append(segment)
+                a[0] = a[1]
+                a[1] = a[2]
+                ai[0] = ai[1]
+                ai[1] = ai[2]
+                j = 1
+
+            # full range
+            else:
+                if lrange > 0:
+                    out_range.append(lrange)
+                    out_mean.append((a[j - 1] + a[j - 2]) / 2.)
+                    out_count.append(1.00)
+                    out_start.append(ai[j - 2])
+                    out_end.append(ai[j])
+                    out_segment.append(segment)
+                a[j - 2] = a[j]
+                ai[j - 2] = ai[j]
+                j = j - 2
+
+    # partial range
+    for i in range(j):
+        lrange = abs(a[i] - a[i + 1])
+        if lrange > 0:
+            out_range.append(lrange)
+            out_mean.append((a[i] + a[i + 1]) / 2.)
+            out_count.append(uc_mult)
+            out_start.append(ai[i])
+            out_end.append(ai[i + 1])
+            out_segment.append(segment)
+
+
+def goodman_output(lrange, mean, count, flm=0, l_ult=1e16, dtype=float):
+    """ Output array of rainflow, with the Goodman correction of the load ranges
+
+        Args:
+            lrange, mean, count: load range, range mean and cycle count of the cycles
+
+        Keyword Args:
+            dtype: float type of the output array [opt, default=float]
+
+        Returns:
+            array_out (numpy.ndarray): (5 x n_cycle) array of rainflow values, see rainflow
+    """
+    flmargin = l_ult - fabs(flm)  # fixed load margin
+    lrange = np.array(lrange, dtype=float)
+    mean = np.array(mean, dtype=float)
+
+    array_out = np.empty((5, len(lrange)), dtype=dtype)  # output array
+    array_out[0] = lrange
+    array_out[1] = mean
+    array_out[2] = lrange * flmargin / (l_ult - fabs(mean))  # Goodman-adjusted range
+    array_out[3] = count
+    array_out[4] = lrange * l_ult / (l_ult - fabs(mean))  # Goodman-adjusted range with flm = 0
+    return array_out
 
 
 def rainflow(array_ext,
-             flm=0, l_ult=1e16, uc_mult=0.5):
+             flm=0, l_ult=1e16, uc_mult=0.5, return_indices=False, index_ext=None, dtype=float):
     """ Rainflow counting of a signal's turning points with Goodman correction
 
         Args:
@@ -58,6 +156,11 @@ def rainflow(array_ext,
             flm (float): fixed-load mean [opt, default=0]
             l_ult (float): ultimate load [opt, default=1e16]
             uc_mult (float): partial-load scaling [opt, default=0.5]
+            return_indices (bool): also return the start and end indices of the cycles [opt, default=False]
+            index_ext (numpy.ndarray): indices of the turning points in the signal
+                                       [opt, default=positions in array_ext]
+            dtype: float type of array_out, e.g. numpy.float32; the cycles are counted in double precision
+                   [opt, default=float]
 
         Returns:
             array_out (numpy.ndarray): (5 x n_cycle) array of rainflow values:
@@ -66,75 +169,354 @@ def rainflow(array_ext,
                                         3) Goodman-adjusted range
                                         4) cycle count
                                         5) Goodman-adjusted range with flm = 0
+            if return_indices, also:
+            start (numpy.ndarray): int64 index of the turning point starting each cycle
+            end (numpy.ndarray): int64 index of the turning point ending each cycle, i.e.
+                                 the second point of a half cycle, and the point closing a full cycle
 
     """
 
-    flmargin = l_ult - fabs(flm)  # fixed load margin
-    tot_num = array_ext.size  # total size of input array
-    array_out = np.zeros((5, tot_num - 1))  # initialize output array
+    values = np.asarray(array_ext, dtype=float).tolist()
+    tot_num = len(values)  # total size of input array
 
-    pr = 0  # index of input array
-    po = 0  # index of output array
-    j = -1  # index of temporary array "a"
-    a = np.empty(array_ext.shape)  # temporary array for algorithm
+    out = ([], [], [], [], [], [])
+    rainflow_core(values, 0, tot_num, [0.] * tot_num, [0] * tot_num, out, uc_mult=uc_mult)
 
-    # loop through each turning point stored in input array
-    for i in range(tot_num):
+    array_out = goodman_output(out[0], out[1], out[2], flm=flm, l_ult=l_ult, dtype=dtype)
 
-        j += 1  # increment "a" counter
-        a[j] = array_ext[pr]  # put turning point into temporary array
-        pr += 1  # increment input array pointer
+    if return_indices:
+        if index_ext is None:
+            index_ext = np.arange(tot_num)
+        index_ext = np.asarray(index_ext, dtype=np.int64)
+        return array_out, index_ext[np.array(out[3], dtype=np.int64)], index_ext[np.array(out[4], dtype=np.int64)]
 
-        while ((j >= 2) & (fabs(a[j - 1] - a[j - 2]) <= \
-                                   fabs(a[j] - a[j - 1]))):
-            lrange = fabs(a[j - 1] - a[j - 2])
+    return array_out
+
+
+def rainflow_batch(array_ext, offsets, uc_mult=0.5, return_indices=False, index_ext=None):
+    """ Rainflow counting of many signals in one call, e.g. daily profiles.
+        The temporary arrays are allocated once and reused for all the signals.
+
+        Args:
+            array_ext (numpy.ndarray): concatenated turning points of the signals
+            offsets (numpy.ndarray): positions in array_ext of the first turning point of each signal,
+                                     followed by len(array_ext), i.e. the signal s is
+                                     array_ext[offsets[s]:offsets[s + 1]]
+
+        Keyword Args:
+            uc_mult (float): partial-load scaling [opt, default=0.5]
+            return_indices (bool): also return the start and end indices of the cycles [opt, default=False]
+            index_ext (numpy.ndarray): indices of the turning points in their signal
+                                       [opt, default=positions in array_ext]
+
+        Returns:
+            array_out (numpy.ndarray): (3 x n_cycle) array of rainflow values of all the signals:
+                                        1) load range
+                                        2) range mean
+                                        3) cycle count
+            segment (numpy.ndarray): int64 index of the signal of each cycle
+            if return_indices, also start and end (numpy.ndarray), see rainflow
+    """
+    values = np.asarray(array_ext, dtype=float).tolist()
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    lengths = np.diff(offsets)
+    max_length = int(np.max(lengths)) if len(lengths) > 0 else 0
+    a = [0.] * max_length
+    ai = [0] * max_length
+
+    out = ([], [], [], [], [], [])
+    for segment, (first, stop) in enumerate(zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+        rainflow_core(values, first, stop, a, ai, out, uc_mult=uc_mult, segment=segment)
+
+    array_out = np.array(out[:3], dtype=float).reshape(3, -1)
+    segment = np.array(out[5], dtype=np.int64)
+
+    if return_indices:
+        if index_ext is None:
+            index_ext = np.arange(len(values))
+        index_ext = np.asarray(index_ext, dtype=np.int64)
+        return array_out, segment, index_ext[np.array(out[3], dtype=np.int64)], \
+            index_ext[np.array(out[4], dtype=np.int64)]
+
+    return array_out, segment
+
+
+def rainflow_stack(values, positions, uc_mult=0.5, virtual_bottom=False):
+    """ Rainflow counting of turning points, without counting the residue.
+        Used by rainflow_parallel to count the shards of a signal, then their residues.
+
+        With virtual_bottom, the turning points are a shard of a longer signal, preceded by an unknown residue:
+        a cycle is only closed when the stack holds the turning point below it, i.e. when the cycle is
+        enclosed by larger ranges on both sides (four point rule). The cycles whose closing would depend on
+        the turning points before the shard are left in the residue.
+
+        Args:
+            values (list): turning points
+            positions (list): positions of the turning points in the signal
+
+        Keyword Args:
+            uc_mult (float): partial-load scaling [opt, default=0.5]
+            virtual_bottom (bool): the turning points don't start the signal [opt, default=False]
+
+        Returns:
+            out (tuple): 7 lists of the closed cycles: load range, range mean, cycle count, position of the start,
+                         position of the second point, position of the turning point whose addition closed it,
+                         whether it is a partial cycle
+            residue (list): turning points of the residue
+            residue_positions (list): positions of the turning points of the residue
+    """
+    out = ([], [], [], [], [], [], [])
+    out_range, out_mean, out_count, out_start, out_second, out_closing, out_partial = out
+
+    a = []
+    ai = []
+    for k in range(len(values)):
+        a.append(values[k])
+        ai.append(positions[k])
+        j = len(a) - 1
+
+        while (j >= 2) and (abs(a[j - 1] - a[j - 2]) <= abs(a[j] - a[j - 1])):
+            lrange = abs(a[j - 1] - a[j - 2])
 
             # partial range
             if j == 2:
-                mean = (a[0] + a[1]) / 2.
-                adj_range = lrange * flmargin / (l_ult - fabs(mean))
-                adj_zero_mean_range = lrange * l_ult / (l_ult - fabs(mean))
-                a[0] = a[1]
-                a[1] = a[2]
+                if virtual_bottom:
+                    break
+                if lrange > 0:
+                    out_range.append(lrange)
+                    out_mean.append((a[0] + a[1]) / 2.)
+                    out_count.append(uc_mult)
+                    out_start.append(ai[0])
+                    out_second.append(ai[1])
+                    out_closing.append(positions[k])
+                    out_partial.append(True)
+                del a[0]
+                del ai[0]
                 j = 1
-                if (lrange > 0):
-                    array_out[0, po] = lrange
-                    array_out[1, po] = mean
-                    array_out[2, po] = adj_range
-                    array_out[3, po] = uc_mult
-                    array_out[4, po] = adj_zero_mean_range
-                    po += 1
 
             # full range
             else:
-                mean = (a[j - 1] + a[j - 2]) / 2.
-                adj_range = lrange * flmargin / (l_ult - fabs(mean))
-                adj_zero_mean_range = lrange * l_ult / (l_ult - fabs(mean))
+                if virtual_bottom and abs(a[j - 2] - a[j - 3]) <= lrange:
+                    break
+                if lrange > 0:
+                    out_range.append(lrange)
+                    out_mean.append((a[j - 1] + a[j - 2]) / 2.)
+                    out_count.append(1.00)
+                    out_start.append(ai[j - 2])
+                    out_second.append(ai[j - 1])
+                    out_closing.append(positions[k])
+                    out_partial.append(False)
                 a[j - 2] = a[j]
+                ai[j - 2] = ai[j]
+                del a[j - 1:]
+                del ai[j - 1:]
                 j = j - 2
-                if (lrange > 0):
-                    array_out[0, po] = lrange
-                    array_out[1, po] = mean
-                    array_out[2, po] = adj_range
-                    array_out[3, po] = 1.00
-                    array_out[4, po] = adj_zero_mean_range
-                    po += 1
 
-    # partial range
-    for i in range(j):
-        lrange = fabs(a[i] - a[i + 1]);
-        mean = (a[i] + a[i + 1]) / 2.
-        adj_range = lrange * flmargin / (l_ult - fabs(mean))
-        adj_zero_mean_range = lrange * l_ult / (l_ult - fabs(mean))
-        if (lrange > 0):
-            array_out[0, po] = lrange
-            array_out[1, po] = mean
-            array_out[2, po] = adj_range
-            array_out[3, po] = uc_mult
-            array_out[4, po] = adj_zero_mean_range
-            po += 1
-
-            # get rid of unused entries
-    array_out = array_out[:, :po]
-
-    return array_out
\ No newline at end of file
+    return out, a, ai
+
+
+def rainflow_shard(task):
+    """ Rainflow counting of a shard of turning points, run in a worker process of rainflow_parallel
+
+        Args:
+            task (tuple): (turning points of the shard (numpy.ndarray), position of its first turning point,
+                           whether it doesn't start the signal, uc_mult)
+
+        Returns:
+            (out, residue, residue_positions) of rainflow_stack
+    """
+    values, first, virtual_bottom, uc_mult = task
+    return rainflow_stack(values.tolist(), list(range(first, first + len(values))),
+                          uc_mult=uc_mult, virtual_bottom=virtual_bottom)
+
+
+def rainflow_parallel(array_ext, n_shards=None, processes=None,
+                      flm=0, l_ult=1e16, uc_mult=0.5, return_indices=False, index_ext=None, dtype=float):
+    """ Rainflow counting of a long signal on several cores, with the same result as rainflow
+
+        The turning points are split into shards, counted in worker processes: each shard returns its closed
+        cycles and its residue. The residues, concatenated in order, are then counted serially; this closes
+        the cycles which span several shards, and gives the partial cycles of the whole signal.
+        The cycles are the ones of rainflow, in the same order, with the same start and end indices.
+
+        Args:
+            array_ext (numpy.ndarray): array of turning points
+
+        Keyword Args:
+            n_shards (int): number of shards [opt, default=processes]
+            processes (int): number of worker processes [opt, default=number of cores]
+            flm, l_ult, uc_mult, return_indices, index_ext, dtype: see rainflow
+
+        Returns:
+            see rainflow
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if n_shards is None:
+        n_shards = processes
+
+    values = np.asarray(array_ext, dtype=float)
+    tot_num = len(values)
+    n_shards = max(min(n_shards, tot_num // 3), 1)  # a shard of less than 3 points can't close a cycle
+    if n_shards == 1:
+        return rainflow(values, flm=flm, l_ult=l_ult, uc_mult=uc_mult,
+                        return_indices=return_indices, index_ext=index_ext, dtype=dtype)
+
+    bounds = np.linspace(0, tot_num, n_shards + 1).astype(np.int64).tolist()
+    tasks = [(values[bounds[s]:bounds[s + 1]], bounds[s], s > 0, uc_mult) for s in range(n_shards)]
+
+    with Pool(processes=min(processes, n_shards)) as pool:
+        shards = pool.map(rainflow_shard, tasks)
+
+    # ---- counting of the concatenated residues ----
+    residue = []
+    residue_positions = []
+    for _, shard_residue, shard_positions in shards:
+        residue.extend(shard_residue)
+        residue_positions.extend(shard_positions)
+    merged, residue, residue_positions = rainflow_stack(residue, residue_positions, uc_mult=uc_mult)
+
+    # a residue point closes a cycle when it is added, but the serial counting closes it earlier,
+    # at the first turning point which comes back to the level of its start (it may be inside a cycle of a shard)
+    for i in range(len(merged[0])):
+        start, second, closing = merged[3][i], merged[4][i], merged[5][i]
+        lrange = merged[0][i]
+        direction = 1. if values[start] > values[second] else -1.
+        passage = direction * (values[second + 1:closing + 1] - values[second]) >= lrange
+        merged[5][i] = second + 1 + int(np.argmax(passage))
+
+    # partial cycles of the residue, closed at the end of the signal
+    final = ([], [], [], [], [], [], [])
+    for i in range(len(residue) - 1):
+        lrange = abs(residue[i] - residue[i + 1])
+        if lrange > 0:
+            for column, value in zip(final, (lrange, (residue[i] + residue[i + 1]) / 2., uc_mult,
+                                             residue_positions[i], residue_positions[i + 1], tot_num, True)):
+                column.append(value)
+
+    parts = [shard[0] for shard in shards] + [merged, final]
+    dtypes = (float, float, float, np.int64, np.int64, np.int64, bool)
+    lrange, mean, count, start, second, closing, partial = \
+        [np.concatenate([np.asarray(part[c], dtype=dtypes[c]) for part in parts]) for c in range(7)]
+
+    # end of a cycle: the point which closes a full cycle, the second point of a partial cycle
+    end = np.where(partial, second, closing)
+
+    # order of rainflow: by closing turning point, then from the top of the stack (the latest start)
+    # to its bottom; the partial cycles of the residue come last, in order
+    order = np.lexsort((np.where(closing == tot_num, start, -start), closing))
+    array_out = goodman_output(lrange[order], mean[order], count[order], flm=flm, l_ult=l_ult, dtype=dtype)
+
+    if return_indices:
+        if index_ext is None:
+            index_ext = np.arange(tot_num)
+        index_ext = np.asarray(index_ext, dtype=np.int64)
+        return array_out, index_ext[start[order]], index_ext[end[order]]
+
+    return array_out
+
+
+class RainflowCounter:
+    """ Incremental rainflow counting: the turning points are added one by one,
+        and the cycles are returned as soon as they are closed.
+
+        The residue (turning points of the cycles which aren't closed yet) is kept in a stack.
+        Adding all the turning points then counting the residue gives the cycles of rainflow,
+        in the same order, without the Goodman correction.
+
+        The positions of the turning points (their index if not given) are kept along the residue,
+        so that the cycles can be returned with the positions of their start and end, as by rainflow
+        with return_indices.
+    """
+
+    def __init__(self, uc_mult=0.5):
+        """
+
+        Keyword Args:
+            uc_mult (float): partial-load scaling [opt, default=0.5]
+        """
+        self.uc_mult = uc_mult
+        self.residue = []  # the temporary array "a" of rainflow
+        self.positions = []  # positions of the points of the residue, the array "ai" of rainflow
+        self.n_points = 0  # number of points added, i.e. index of the next point
+        self.n_unchanged = 0  # number of points at the bottom of the residue unchanged by the last add
+
+    def add(self, point, position=None, return_positions=False):
+        """
+
+        :param point: new turning point
+        :param position: position of the turning point, any object (its index if None)
+        :param return_positions: if True, the positions of the start and end of the cycles are returned
+        :return: list of the closed cycles, as tuples (load range, range mean, cycle count),
+                 or (load range, range mean, cycle count, start position, end position) if return_positions
+        """
+        a = self.residue
+        ai = self.positions
+        self.n_unchanged = len(a)
+        a.append(point)
+        ai.append(self.n_points if position is None else position)
+        self.n_points += 1
+
+        cycles = []
+        while (len(a) >= 3) and (fabs(a[-2] - a[-3]) <= fabs(a[-1] - a[-2])):
+            lrange = fabs(a[-2] - a[-3])
+
+            # partial range
+            if len(a) == 3:
+                mean = (a[0] + a[1]) / 2.
+                cycle = (lrange, mean, self.uc_mult, ai[0], ai[1])
+                del a[0]
+                del ai[0]
+                self.n_unchanged = 0
+
+            # full range
+            else:
+                mean = (a[-2] + a[-3]) / 2.
+                cycle = (lrange, mean, 1.00, ai[-3], ai[-1])
+                a[-3] = a[-1]
+                ai[-3] = ai[-1]
+                del a[-2:]
+                del ai[-2:]
+                self.n_unchanged = min(self.n_unchanged, len(a) - 1)
+
+            if lrange > 0:
+                cycles.append(cycle if return_positions else cycle[:3])
+
+        return cycles
+
+    def residue_cycles(self, return_positions=False):
+        """
+
+        :param return_positions: if True, the positions of the start and end of the cycles are returned
+        :return: list of the partial cycles of the residue, as tuples (load range, range mean, cycle count),
+                 or (load range, range mean, cycle count, start position, end position) if return_positions
+        """
+        a = self.residue
+        ai = self.positions
+        cycles = []
+        for i in range(len(a) - 1):
+            lrange = fabs(a[i] - a[i + 1])
+            if lrange > 0:
+                cycle = (lrange, (a[i] + a[i + 1]) / 2., self.uc_mult, ai[i], ai[i + 1])
+                cycles.append(cycle if return_positions else cycle[:3])
+        return cycles
+
+
+if __name__ == '__main__':
+    # equivalence check of rainflow_parallel and rainflow, on random signals split into random numbers of shards:
+    #     $ python -m lib.rainflow.rainflow
+    rng = np.random.RandomState(0)
+    for trial in range(0, 1000):
+        signal = rng.randint(-5, 6, size=rng.randint(1, 300)).astype(float) if trial % 2 \
+            else np.cumsum(rng.normal(size=rng.randint(1, 300)))
+        # turning points: no repeated value, and alternating directions
+        signal = signal[np.append(True, np.diff(signal) != 0)]
+        reversal = np.diff(np.sign(np.diff(signal))) != 0
+        signal = signal[np.concatenate(([True], reversal, [True]))] if len(signal) > 2 else signal
+
+        expected = rainflow(signal, return_indices=True)
+        result = rainflow_parallel(signal, n_shards=rng.randint(1, 16), processes=2, return_indices=True)
+        if not all(np.array_equal(x, y) for x, y in zip(expected, result)):
+            raise AssertionError('rainflow_parallel differs from rainflow on the signal {}'.format(signal.tolist()))
+    print('rainflow_parallel gives the cycles of rainflow on 1000 random signals')
@@ -31,7 +31,7 @@ from degradation_model.SEI_fit import SEI_fit
 from degradation_model.soc_stress_model_fit import SoCStressModelFit
 from degradation_model.temp_stress_model_fit import TempStressModelFit
 from degradation_model.time_deg_model_fit import TimeDegModelFit
-from degradation_model.stress_surface_representation import surface_stress_plot
+from degradation_model.plotting import surface_stress_plot
 from degradation_model.cycle_counting_algorithm import CycleCounter
 
 # -----------------------------------------------------------------------------------